@@ -0,0 +1,169 @@
+"""
+mbed SDK
+Copyright (c) 2018 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""asyncio versions of the listing API (Python 3.6 and newer)
+
+Commands that find the candidates run with asyncio.create_subprocess_exec, and
+the blocking reads of the board files run in the event loop's executor, a
+bounded number of devices at a time.
+"""
+
+import asyncio
+import functools
+from asyncio.subprocess import PIPE
+
+import logging
+logger = logging.getLogger("mbedls.aio")
+logger.addHandler(logging.NullHandler())
+del logging
+
+
+class AsyncListMixin(object):
+    """ Adds 'list_mbeds_async' and 'iter_mbeds_async' to MbedLsToolsBase
+
+    Platforms take part through three hooks, all of which may return None to
+    run their blocking counterpart in the executor instead:
+     - '_candidate_commands()' returns the commands 'find_candidates' runs,
+       and '_candidates_from_output(outputs)' builds the candidates from the
+       (stdout, stderr, returncode) of each of them
+     - '_mount_point_ready_command(path)' returns a command that exits with 0
+       when the mount point is ready
+    """
+
+    # Devices probed at once when 'max_workers' does not allow more
+    ASYNC_MAX_CONCURRENCY = 8
+
+    async def list_mbeds_async(self, fs_interaction=None, filter_function=None,
+                               unique_names=False, read_details_txt=False,
+                               max_concurrency=None):
+        """! Coroutine version of 'list_mbeds'
+        @param max_concurrency Maximum number of devices probed at once;
+          defaults to the larger of 'max_workers' and ASYNC_MAX_CONCURRENCY
+        @return List of devices, in the same order as 'list_mbeds'
+        @details Takes the same parameters as 'list_mbeds', and shares its
+          result cache
+        """
+        from .lstools_base import FSInteraction
+        cache_key = self._result_cache_key(
+            fs_interaction or FSInteraction.BeforeFilter, filter_function,
+            unique_names, read_details_txt)
+        cached = self._result_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            return cached
+        tasks = await self._async_probe(fs_interaction, filter_function,
+                                        read_details_txt, max_concurrency)
+        platform_count = {}
+        result = []
+        for device in await asyncio.gather(*tasks):
+            if device:
+                self._name_and_retarget(device, unique_names, platform_count)
+                result.append(device)
+        self._save_details_cache()
+        if cache_key:
+            self._result_cache.put(cache_key, result)
+        return result
+
+    async def iter_mbeds_async(self, fs_interaction=None, filter_function=None,
+                               unique_names=False, read_details_txt=False,
+                               max_concurrency=None):
+        """! Asynchronous generator version of 'list_mbeds'
+        @return Yields each device as soon as it has been probed
+        @details Takes the same parameters as 'list_mbeds_async'. Unique names
+          are numbered in the order the devices are yielded. Devices that have
+          not been probed yet are cancelled when the generator is closed.
+        """
+        tasks = await self._async_probe(fs_interaction, filter_function,
+                                        read_details_txt, max_concurrency)
+        platform_count = {}
+        try:
+            for next_device in asyncio.as_completed(tasks):
+                device = await next_device
+                if device:
+                    self._name_and_retarget(device, unique_names,
+                                            platform_count)
+                    yield device
+        finally:
+            for task in tasks:
+                task.cancel()
+            self._save_details_cache()
+
+    async def find_candidates_async(self):
+        """! Coroutine version of 'find_candidates'"""
+        commands = self._candidate_commands()
+        if commands is None:
+            loop = asyncio.get_event_loop()
+            return list(await loop.run_in_executor(None, self.find_candidates))
+        outputs = await asyncio.gather(
+            *[self._run_cli_process_async(cmd) for cmd in commands])
+        return list(self._candidates_from_output(outputs))
+
+    async def mount_point_ready_async(self, path):
+        """! Coroutine version of 'mount_point_ready'"""
+        command = self._mount_point_ready_command(path)
+        if command is None:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(None, self.mount_point_ready,
+                                              path)
+        _, stderr, retcode = await self._run_cli_process_async(command)
+        if retcode:
+            logger.debug("Mount point %s reported not ready with error '%s'",
+                         path, stderr.strip())
+        return retcode == 0
+
+    async def _async_probe(self, fs_interaction, filter_function,
+                           read_details_txt, max_concurrency):
+        """! Find the candidates and start probing them
+        @return List of the probing tasks, in the order of the candidates
+        """
+        from .lstools_base import FSInteraction
+        if fs_interaction is None:
+            fs_interaction = FSInteraction.BeforeFilter
+        candidates = await self.find_candidates_async()
+        logger.debug("Candidates for display %r", candidates)
+        limit = asyncio.Semaphore(
+            max_concurrency or max(self.max_workers,
+                                   self.ASYNC_MAX_CONCURRENCY))
+        identify = functools.partial(self._identify_candidate,
+                                     fs_interaction=fs_interaction,
+                                     filter_function=filter_function,
+                                     read_details_txt=read_details_txt)
+        loop = asyncio.get_event_loop()
+
+        async def probe(device):
+            async with limit:
+                if not self._prefilter(device, filter_function,
+                                       self.CANDIDATE_FIELDS):
+                    return None
+                mounted = bool(device['mount_point'] and
+                               await self.mount_point_ready_async(
+                                   device['mount_point']))
+                if not self._keep_candidate(device, mounted):
+                    return None
+                return await loop.run_in_executor(None, identify, device)
+
+        return [asyncio.ensure_future(probe(device)) for device in candidates]
+
+    @staticmethod
+    async def _run_cli_process_async(cmd):
+        """! Coroutine version of '_run_cli_process'
+        @param cmd List of the program and its arguments
+        @return Tuple of (stdout, stderr, returncode)
+        """
+        process = await asyncio.create_subprocess_exec(*cmd, stdout=PIPE,
+                                                       stderr=PIPE)
+        stdout, stderr = await process.communicate()
+        return stdout, stderr, process.returncode
@@ -0,0 +1,427 @@
+"""
+mbed SDK
+Copyright (c) 2018 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""Caches of device details that outlive a single listing"""
+
+import json
+import threading
+import time
+from copy import deepcopy
+from io import open
+from os import makedirs
+from os.path import join, dirname, exists
+from appdirs import user_data_dir
+from fasteners import InterProcessLock
+
+try:
+    unicode
+except NameError:
+    unicode = str
+
+import logging
+logger = logging.getLogger("mbedls.cache")
+logger.addHandler(logging.NullHandler())
+del logging
+
+LOCAL_DETAILS_CACHE = join(user_data_dir("mbedls"), "details.json")
+LOCAL_SCAN_CACHE = join(user_data_dir("mbedls"), "scans.json")
+
+BOOT_ID_FILE_NAME = '/proc/sys/kernel/random/boot_id'
+
+_boot_id = []
+
+# Clock for expiring cached results; time.time() before Python 3.3
+_now = getattr(time, 'monotonic', time.time)
+
+
+def boot_id():
+    """! Identify the current boot of the kernel
+    @return The Linux boot id, or None where there is none
+    """
+    if not _boot_id:
+        try:
+            with open(BOOT_ID_FILE_NAME, 'r') as f:
+                _boot_id.append(f.read().strip())
+        except (IOError, OSError):
+            _boot_id.append(None)
+    return _boot_id[0]
+
+
+class DetailsCache(object):
+    """ Parsed contents of the files on the boards, kept in a file between
+    runs
+
+    Each entry belongs to a USB id and holds, per file name, a key and the
+    parsed value. The key is chosen by the caller, and describes the file
+    well enough to tell when it may have changed (device number, mtime,
+    size, boot id). Boards that have not been seen for 'max_age_days' are
+    evicted when the cache is saved.
+    """
+
+    def __init__(self, path=LOCAL_DETAILS_CACHE, max_age_days=30):
+        """! ctor
+        @param path File the cache is kept in
+        @param max_age_days Days after which the entries of a board that has
+          not been seen are dropped
+        """
+        self.path = path
+        self.max_age = max_age_days * 24 * 60 * 60
+        self._lock = threading.Lock()
+        self._entries = self._load()
+        self._dirty = False
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as cache_in:
+                entries = json.load(cache_in)
+        except (IOError, OSError, ValueError) as e:
+            logger.debug("Could not load details cache %s: %s", self.path, e)
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def lookup(self, usb_id, file_name, key):
+        """! Get the parsed contents of a file
+        @param key Description of the file as it is now
+        @return A copy of the value stored with the same key, or None
+        """
+        with self._lock:
+            entry = self._entries.get(usb_id)
+            if not entry:
+                return None
+            cached = entry.get('files', {}).get(file_name)
+            if not cached or cached.get('key') != list(key):
+                return None
+            # Saving a hit is only needed to keep the entry from being evicted
+            now = time.time()
+            if now - entry.get('seen', 0) > 60 * 60:
+                entry['seen'] = now
+                self._dirty = True
+            return deepcopy(cached['value'])
+
+    def store(self, usb_id, file_name, key, value):
+        """! Remember the parsed contents of a file"""
+        with self._lock:
+            entry = self._entries.setdefault(usb_id, {'files': {}})
+            entry.setdefault('files', {})[file_name] = {
+                'key': list(key),
+                'value': deepcopy(value)
+            }
+            entry['seen'] = time.time()
+            self._dirty = True
+
+    def save(self):
+        """! Merge the changes into the cache file
+        @return False if the file could not be written
+        @details Entries written by other processes since the cache was loaded
+          are kept, unless this process saw the same board more recently
+        """
+        with self._lock:
+            if not self._dirty:
+                return True
+            lock = InterProcessLock("%s.lock" % self.path)
+            try:
+                makedirs(dirname(self.path))
+            except OSError:
+                pass
+            if not lock.acquire(blocking=True, timeout=10):
+                logger.debug("Could not lock details cache %s", self.path)
+                return False
+            try:
+                entries = self._load()
+                for usb_id, entry in self._entries.items():
+                    if entry.get('seen', 0) >= entries.get(usb_id, {}).get('seen', 0):
+                        entries[usb_id] = entry
+                oldest = time.time() - self.max_age
+                entries = {usb_id: entry for usb_id, entry in entries.items()
+                           if entry.get('seen', 0) > oldest}
+                with open(self.path, 'w', encoding='utf-8') as cache_out:
+                    cache_out.write(unicode(json.dumps(entries)))
+            except (IOError, OSError) as e:
+                logger.debug("Could not save details cache %s: %s",
+                             self.path, e)
+                return False
+            finally:
+                lock.release()
+            self._entries = entries
+            self._dirty = False
+            return True
+
+
+class SharedScanCache(object):
+    """ Results of recent listings, shared by all the processes of a user
+
+    A process that finds no valid result scans while holding a lock on the
+    file, so processes that start at the same time wait for the first one
+    and reuse its result instead of all reading the boards.
+    """
+
+    def __init__(self, path=LOCAL_SCAN_CACHE, ttl=2.0, lock_timeout=60):
+        """! ctor
+        @param path File the results are kept in
+        @param ttl Seconds a result stays valid
+        @param lock_timeout Seconds to wait for another process to finish
+          its scan, after which this process scans without the lock
+        """
+        self.path = path
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as cache_in:
+                results = json.load(cache_in)
+        except (IOError, OSError, ValueError) as e:
+            logger.debug("Could not load scan cache %s: %s", self.path, e)
+            return {}
+        return results if isinstance(results, dict) else {}
+
+    def _valid(self, results, key):
+        """! @return The result stored under 'key' if it is still valid,
+        or None
+        """
+        entry = results.get(key)
+        if not isinstance(entry, dict):
+            return None
+        if not 0 <= time.time() - entry.get('time', 0) < self.ttl:
+            return None
+        return entry.get('result')
+
+    def get_or_scan(self, key, scan):
+        """! Get a valid result, or scan and share the result
+        @param key String describing the listing
+        @param scan Function that lists the devices, returning a list that
+          can be stored as JSON
+        @return The result
+        """
+        result = self._valid(self._load(), key)
+        if result is not None:
+            return result
+        lock = InterProcessLock("%s.lock" % self.path)
+        try:
+            makedirs(dirname(self.path))
+        except OSError:
+            pass
+        if not lock.acquire(blocking=True, timeout=self.lock_timeout):
+            logger.debug("Could not lock scan cache %s", self.path)
+            return scan()
+        try:
+            results = self._load()
+            result = self._valid(results, key)
+            if result is not None:
+                logger.debug("Reusing the scan of another process")
+                return result
+            result = scan()
+            now = time.time()
+            results = {k: entry for k, entry in results.items()
+                       if self._valid(results, k) is not None}
+            results[key] = {'time': now, 'result': result}
+            try:
+                data = unicode(json.dumps(results))
+                with open(self.path, 'w', encoding='utf-8') as cache_out:
+                    cache_out.write(data)
+            except (IOError, OSError, TypeError, ValueError) as e:
+                logger.debug("Could not save scan cache %s: %s",
+                             self.path, e)
+            return result
+        finally:
+            lock.release()
+
+    def invalidate(self):
+        """! Drop the results of all processes"""
+        if not exists(self.path):
+            return
+        lock = InterProcessLock("%s.lock" % self.path)
+        if not lock.acquire(blocking=True, timeout=self.lock_timeout):
+            return
+        try:
+            with open(self.path, 'w', encoding='utf-8') as cache_out:
+                cache_out.write(unicode('{}'))
+        except (IOError, OSError) as e:
+            logger.debug("Could not clear scan cache %s: %s", self.path, e)
+        finally:
+            lock.release()
+
+
+class ResultCache(object):
+    """ Results of recent listings, kept in memory for a few seconds
+
+    Values are deep copied on the way in and out, so callers may modify
+    what they get. A cache with a TTL of 0 holds nothing.
+    """
+
+    def __init__(self, ttl=0):
+        """! ctor
+        @param ttl Seconds a result stays valid
+        """
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._results = {}
+
+    def get(self, key):
+        """! Get a copy of a result that is still valid
+        @return The result, or None
+        """
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            stamp, value = self._results.get(key, (None, None))
+            if stamp is None or _now() - stamp >= self.ttl:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return deepcopy(value)
+
+    def put(self, key, value):
+        if self.ttl <= 0:
+            return
+        value = deepcopy(value)
+        with self._lock:
+            self._results[key] = (_now(), value)
+
+    def invalidate(self):
+        """! Forget all results"""
+        with self._lock:
+            self._results.clear()
+
+    def stats(self):
+        """! @return Dict with the number of 'hits' and 'misses', and the
+        'ttl'
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'ttl': self.ttl}
+
+
+class DeviceIndex(object):
+    """ Probed devices, looked up by the value of one of their fields
+
+    Each entry keeps the candidate the device was probed from, so that a
+    caller can tell whether the device is still attached the same way. The
+    entries are grouped by a key describing how the devices were probed.
+    'platform_name_unique' depends on the rest of a listing, so it is not
+    kept.
+    """
+
+    FIELDS = ('target_id', 'target_id_usb_id', 'serial_port', 'mount_point')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}   # (key, usb id) -> (candidate, device)
+        self._by_field = {}  # (key, field, value) -> usb id
+
+    def put(self, key, candidate, device):
+        """! Index a device, replacing the entry of the same USB id"""
+        device = deepcopy(device)
+        device.pop('platform_name_unique', None)
+        candidate = deepcopy(candidate)
+        usb_id = candidate['target_id_usb_id']
+        with self._lock:
+            self._discard(key, usb_id)
+            self._entries[(key, usb_id)] = (candidate, device)
+            for field in self.FIELDS:
+                if device.get(field):
+                    self._by_field[(key, field, device[field])] = usb_id
+
+    def get(self, key, field, value):
+        """! Find a device by the value of one of 'FIELDS'
+        @return Tuple of copies of the candidate and the device, or
+          (None, None)
+        """
+        with self._lock:
+            usb_id = self._by_field.get((key, field, value))
+            entry = self._entries.get((key, usb_id))
+        if entry is None:
+            return None, None
+        return deepcopy(entry)
+
+    def discard(self, key, usb_id):
+        """! Forget the device of a USB id"""
+        with self._lock:
+            self._discard(key, usb_id)
+
+    def _discard(self, key, usb_id):
+        _, device = self._entries.pop((key, usb_id), (None, None))
+        if device is None:
+            return
+        for field in self.FIELDS:
+            if self._by_field.get((key, field, device.get(field))) == usb_id:
+                del self._by_field[(key, field, device[field])]
+
+    def clear(self):
+        """! Forget all devices"""
+        with self._lock:
+            self._entries.clear()
+            self._by_field.clear()
+
+
+class SingleFlight(object):
+    """ Lets concurrent callers with the same key share one computation
+
+    The first caller computes the value. Callers that arrive while it is in
+    flight wait for it, and each get a deep copy of the value, or the same
+    exception.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.shared = 0
+
+    def do(self, key, compute):
+        """! Compute a value, or wait for the computation in flight
+        @param key Hashable key; equal keys compute the same value
+        @param compute Function that returns the value
+        @return The value
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                leader = True
+            else:
+                flight.waiters += 1
+                self.shared += 1
+                leader = False
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return deepcopy(flight.value)
+        try:
+            value = compute()
+        except BaseException as e:
+            flight.error = e
+            raise
+        else:
+            return value
+        finally:
+            with self._lock:
+                del self._flights[key]
+            # No one can join any more; copy the value before the caller
+            # gets it, and may modify it
+            if flight.error is None and flight.waiters:
+                flight.value = deepcopy(value)
+            flight.done.set()
+
+
+class _Flight(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.waiters = 0
+        self.value = None
+        self.error = None
@@ -97,6 +97,8 @@ class MbedLsToolsDarwin(MbedLsToolsBase):
     """ mbed-enabled platform detection on Mac OS X
     """
 
+    DISKUTIL_COMMAND = ['diskutil', 'list', '-plist']
+
     def __init__(self, **kwargs):
         MbedLsToolsBase.__init__(self, **kwargs)
         self.mac_version = float('.'.join(platform.mac_ver()[0].split('.')[:2]))
@@ -107,6 +109,9 @@ class MbedLsToolsDarwin(MbedLsToolsBase):
 
         # {volume_id: mount_point}
         mounts = self._mount_points()
+        return self._candidates(volumes, mounts)
+
+    def _candidates(self, volumes, mounts):
         return [
             {
                 'mount_point': mounts[v],
@@ -116,28 +121,35 @@ class MbedLsToolsDarwin(MbedLsToolsBase):
             if v in mounts and v in volumes
         ]
 
+    def _candidate_commands(self):
+        return [self.DISKUTIL_COMMAND] + self._ioreg_commands()
+
+    def _candidates_from_output(self, outputs):
+        disks = plistlib.loads(outputs[0][0])
+        # Like '_volumes', only the tree of the last controller is used
+        try:
+            usb_tree = plistlib.loads(outputs[-1][0])
+        except:
+            usb_tree = []
+        return self._candidates(self._volumes_from_usb_tree(usb_tree),
+                                self._mounts_from_disks(disks))
+
     def _mount_points(self):
         ''' Returns map {volume_id: mount_point} '''
-        diskutil_ls = subprocess.Popen(['diskutil', 'list', '-plist'], stdout=subprocess.PIPE)
+        diskutil_ls = subprocess.Popen(self.DISKUTIL_COMMAND, stdout=subprocess.PIPE)
         disks = plistlib.readPlist(diskutil_ls.stdout)
         diskutil_ls.wait()
+        return self._mounts_from_disks(disks)
 
+    def _mounts_from_disks(self, disks):
         if logger.isEnabledFor(DEBUG):
             import pprint
             logger.debug("disks dict \n%s", pprint.PrettyPrinter(indent=2).pformat(disks))
         return {disk['DeviceIdentifier']: disk.get('MountPoint', None)
                 for disk in disks['AllDisksAndPartitions']}
 
-    def _volumes(self):
-        ''' returns a map {volume_id: {serial:, vendor_id:, product_id:, tty:}'''
-
-        # to find all the possible mbed volumes, we look for registry entries
-        # under all possible USB tree which have a "BSD Name" that starts with
-        # "disk" # (i.e. this is a USB disk), and have a IORegistryEntryName that
-        # matches /\cmbed/
-        # Once we've found a disk, we can search up for a parent with a valid
-        # serial number, and then search down again to find a tty that's part
-        # of the same composite device
+    def _ioreg_commands(self):
+        ''' Returns the ioreg commands that list the USB tree '''
         # ioreg -a -r -n <usb_controller_name> -l
         usb_controllers = ['AppleUSBXHCI', 'AppleUSBUHCI', 'AppleUSBEHCI',
                            'AppleUSBOHCI', 'IOUSBHostDevice']
@@ -148,14 +160,30 @@ class MbedLsToolsDarwin(MbedLsToolsBase):
         if self.mac_version >= 10.11:
             cmp_par = '-c'
 
-        for usb_controller in usb_controllers:
-            ioreg_usb = subprocess.Popen(['ioreg', '-a', '-r', cmp_par, usb_controller, '-l'], stdout=subprocess.PIPE)
+        return [['ioreg', '-a', '-r', cmp_par, usb_controller, '-l']
+                for usb_controller in usb_controllers]
+
+    def _volumes(self):
+        ''' returns a map {volume_id: {serial:, vendor_id:, product_id:, tty:}'''
+
+        # to find all the possible mbed volumes, we look for registry entries
+        # under all possible USB tree which have a "BSD Name" that starts with
+        # "disk" # (i.e. this is a USB disk), and have a IORegistryEntryName that
+        # matches /\cmbed/
+        # Once we've found a disk, we can search up for a parent with a valid
+        # serial number, and then search down again to find a tty that's part
+        # of the same composite device
+        for command in self._ioreg_commands():
+            ioreg_usb = subprocess.Popen(command, stdout=subprocess.PIPE)
             try:
                 usb_tree = plistlib.readPlist(ioreg_usb.stdout)
             except:
                 usb_tree = []
             ioreg_usb.wait()
 
+        return self._volumes_from_usb_tree(usb_tree)
+
+    def _volumes_from_usb_tree(self, usb_tree):
         r = {}
 
         for name, obj in enumerate(usb_tree):
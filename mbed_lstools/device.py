@@ -0,0 +1,190 @@
+"""
+mbed SDK
+Copyright (c) 2018 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""Dict device record that can fill in fields on first access"""
+
+import threading
+
+
+class MbedDevice(dict):
+    """ A device, as returned by 'list_mbeds'
+
+    A dict whose stages, registered with 'defer', are run the first time a
+    field they may set is read or written, and are then forgotten, so what
+    the caller writes is kept. Iterating, comparing, copying, pickling or
+    JSON encoding a record runs all of its stages. Records can be read from
+    several threads; a stage runs only once.
+    """
+
+    __slots__ = ('_pending', '_lock', '_stage_thread')
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self._pending = []
+        self._lock = None
+        self._stage_thread = None   # The thread running a stage
+
+    def defer(self, wanted, resolve):
+        """! Register a stage
+        @param wanted Function that tells, given a field name, whether the
+          stage may set that field
+        @param resolve Function that is called with this record to set the
+          fields of the stage
+        @details Stages run in the order they are registered
+        """
+        if self._lock is None:
+            # Stages read the record they fill in, so the lock is reentrant
+            self._lock = threading.RLock()
+        self._pending.append((wanted, resolve))
+
+    @property
+    def pending(self):
+        """! True while some stages have not run yet"""
+        return bool(self._pending)
+
+    def _resolve(self, key=None):
+        """! Run the pending stages that may set 'key', or all of them"""
+        # A stage leaves '_pending' before it runs, so another thread must
+        # wait for the lock to know that the stage is done
+        if self._lock is None:
+            return
+        with self._lock:
+            while True:
+                for index, (wanted, resolve) in enumerate(self._pending):
+                    if key is None or wanted(key):
+                        del self._pending[index]
+                        outer, self._stage_thread = (self._stage_thread,
+                                                     threading.current_thread())
+                        try:
+                            resolve(self)
+                        finally:
+                            self._stage_thread = outer
+                        break
+                else:
+                    return
+
+    def to_dict(self):
+        """! Resolve the record
+        @return A plain dict with the fields of the record
+        """
+        self._resolve()
+        return dict(dict.items(self))
+
+    def __getitem__(self, key):
+        self._resolve(key)
+        return dict.__getitem__(self, key)
+
+    def __setitem__(self, key, value):
+        # The fields a stage sets while it runs are its own
+        if self._stage_thread is not threading.current_thread():
+            self._resolve(key)
+        dict.__setitem__(self, key, value)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def get(self, key, default=None):
+        self._resolve(key)
+        return dict.get(self, key, default)
+
+    def __contains__(self, key):
+        self._resolve(key)
+        return dict.__contains__(self, key)
+
+    def __delitem__(self, key):
+        self._resolve(key)
+        dict.__delitem__(self, key)
+
+    def pop(self, key, *default):
+        self._resolve(key)
+        return dict.pop(self, key, *default)
+
+    def setdefault(self, key, default=None):
+        self._resolve(key)
+        return dict.setdefault(self, key, default)
+
+    def popitem(self):
+        self._resolve()
+        return dict.popitem(self)
+
+    def clear(self):
+        del self._pending[:]
+        dict.clear(self)
+
+    def __iter__(self):
+        self._resolve()
+        return dict.__iter__(self)
+
+    def __len__(self):
+        self._resolve()
+        return dict.__len__(self)
+
+    def __bool__(self):
+        # Without this, truth testing would run the stages through __len__
+        return bool(self._pending) or dict.__len__(self) > 0
+    __nonzero__ = __bool__
+
+    def keys(self):
+        self._resolve()
+        return dict.keys(self)
+
+    def values(self):
+        self._resolve()
+        return dict.values(self)
+
+    def items(self):
+        self._resolve()
+        return dict.items(self)
+
+    if hasattr(dict, 'iteritems'):
+        def iterkeys(self):
+            self._resolve()
+            return dict.iterkeys(self)
+
+        def itervalues(self):
+            self._resolve()
+            return dict.itervalues(self)
+
+        def iteritems(self):
+            self._resolve()
+            return dict.iteritems(self)
+
+    def __eq__(self, other):
+        self._resolve()
+        if isinstance(other, MbedDevice):
+            other._resolve()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def copy(self):
+        return type(self)(self.to_dict())
+
+    def __repr__(self):
+        return "%s(%s%s)" % (type(self).__name__, dict.__repr__(self),
+                             ", pending" if self._pending else "")
+
+    def __reduce_ex__(self, protocol):
+        return (type(self), (self.to_dict(),))
+
+    def __reduce__(self):
+        return self.__reduce_ex__(2)
@@ -0,0 +1,131 @@
+"""
+mbed SDK
+Copyright (c) 2018 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""Declarative device filters that can be checked one stage at a time"""
+
+import re
+
+
+def _text(value):
+    return value if value is None else str(value)
+
+
+class Filter(object):
+    """ Filter of devices by the values of their fields
+
+    Ex. Filter(platform_name='K64F', target_id__startswith='0240')
+
+    Each keyword is a field name, optionally followed by '__' and one of the
+    OPERATORS; a bare field name compares for equality. A device matches when
+    all the predicates hold. A missing field has the value None.
+
+    A filter may be passed anywhere a 'filter_function' is accepted. The
+    listing then checks each predicate as soon as the fields it needs are
+    final, so devices that fail on their USB id, serial port or mount point
+    never have their file systems read.
+    """
+
+    OPERATORS = {
+        'exact': lambda value, arg: value == arg,
+        'ne': lambda value, arg: value != arg,
+        'startswith': lambda value, arg: (value is not None and
+                                          _text(value).startswith(arg)),
+        'endswith': lambda value, arg: (value is not None and
+                                        _text(value).endswith(arg)),
+        'contains': lambda value, arg: (value is not None and
+                                        arg in _text(value)),
+        'in': lambda value, arg: value in arg,
+        'regex': lambda value, arg: (value is not None and
+                                     re.search(arg, _text(value)) is not None),
+    }
+
+    def __init__(self, **criteria):
+        """! ctor
+        @param criteria Keywords of the form 'field' or 'field__operator'
+        @details Raises ValueError on an unknown operator
+        """
+        predicates = []
+        for key, arg in criteria.items():
+            field, _, operator = key.partition('__')
+            operator = operator or 'exact'
+            if operator not in self.OPERATORS:
+                raise ValueError("Unknown filter operator '%s' in '%s'"
+                                 % (operator, key))
+            if operator == 'in':
+                arg = tuple(arg)
+            elif operator == 'regex':
+                re.compile(arg)
+            predicates.append((field, operator, arg))
+        self.predicates = tuple(sorted(predicates))
+
+    @classmethod
+    def parse(cls, expressions):
+        """! Make a filter from command line expressions
+        @param expressions List of strings of the form 'field=value' or
+          'field__operator=value'; the value of 'in' is a comma separated list
+        @return A Filter that matches when all the expressions hold
+        @details Raises ValueError on a malformed expression
+        """
+        criteria = {}
+        for expression in expressions:
+            key, sep, value = expression.partition('=')
+            key = key.strip()
+            if not sep or not key:
+                raise ValueError("Expected FIELD[__OPERATOR]=VALUE, got '%s'"
+                                 % expression)
+            if key.endswith('__in'):
+                value = [v.strip() for v in value.split(',')]
+            criteria[key] = value
+        return cls(**criteria)
+
+    @property
+    def fields(self):
+        """! Names of the fields the predicates look at"""
+        return frozenset(field for field, _, _ in self.predicates)
+
+    def matches(self, device, known=None):
+        """! Check the predicates on a device
+        @param device Dict of the fields of the device
+        @param known Names of the fields that are already final; predicates
+          on other fields are skipped. None checks every predicate
+        @return False as soon as a checked predicate does not hold
+        """
+        for field, operator, arg in self.predicates:
+            if known is not None and field not in known:
+                continue
+            if not self.OPERATORS[operator](device.get(field), arg):
+                return False
+        return True
+
+    def __call__(self, device):
+        return self.matches(device)
+
+    def __eq__(self, other):
+        return (isinstance(other, Filter) and
+                self.predicates == other.predicates)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.predicates)
+
+    def __repr__(self):
+        return "Filter(%s)" % ", ".join(
+            "%s=%r" % (field if operator == 'exact' else
+                       "%s__%s" % (field, operator), arg)
+            for field, operator, arg in self.predicates)
@@ -0,0 +1,185 @@
+"""
+mbed SDK
+Copyright (c) 2018 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""Hand out boards to parallel workers, one worker per board"""
+
+import threading
+import time
+from copy import deepcopy
+from os import makedirs
+from os.path import join
+from appdirs import user_data_dir
+from fasteners import InterProcessLock
+
+from .cache import _now
+from .filters import Filter
+
+import logging
+logger = logging.getLogger("mbedls.lease")
+logger.addHandler(logging.NullHandler())
+del logging
+
+LOCAL_LEASE_DIR = join(user_data_dir("mbedls"), "leases")
+
+# File locks are held by processes, so the threads of one process also have
+# to keep track of the boards they hold
+_held = set()
+_held_lock = threading.Lock()
+
+
+class LeaseTimeout(Exception):
+    """ Not enough boards were free before the timeout """
+
+
+class Lease(object):
+    """ Boards held by this worker until 'release' is called
+
+    Can be used as a context manager, which releases the boards on exit.
+    """
+
+    def __init__(self, devices, locks):
+        """! ctor
+        @param devices The devices of the boards
+        @param locks List of (path, InterProcessLock) tuples held for them
+        """
+        self.devices = devices
+        self._locks = locks
+
+    @property
+    def target_ids(self):
+        return [device['target_id'] for device in self.devices]
+
+    def release(self):
+        """! Let other workers acquire the boards"""
+        locks, self._locks = self._locks, []
+        for path, lock in locks:
+            lock.release()
+            with _held_lock:
+                _held.discard(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def __del__(self):
+        self.release()
+
+
+class BoardAllocator(object):
+    """ Hands out the boards listed by an 'MbedLsToolsBase' so that no two
+    workers, in this or other processes, hold the same board
+
+    A board is held through a lock file named after its target ID. Boards
+    are matched against the result of one listing, which is only made again
+    when there are not enough free boards that match.
+    """
+
+    def __init__(self, mbeds, lock_dir=LOCAL_LEASE_DIR, poll_interval=0.5,
+                 read_details_txt=False):
+        """! ctor
+        @param mbeds The 'MbedLsToolsBase' that lists the boards
+        @param lock_dir Directory of the lock files, shared by all the
+          workers
+        @param poll_interval Seconds between attempts while waiting for
+          boards
+        @param read_details_txt The same as for 'list_mbeds', for matching on
+          the 'daplink_*' fields read from DETAILS.TXT
+        """
+        self.mbeds = mbeds
+        self.lock_dir = lock_dir
+        self.poll_interval = poll_interval
+        self.read_details_txt = read_details_txt
+        self._lock = threading.Lock()
+        self._devices = None
+
+    def refresh(self):
+        """! List the boards again before the next match"""
+        with self._lock:
+            self._devices = None
+
+    def _listed(self, rescan):
+        with self._lock:
+            if self._devices is None or rescan:
+                self._devices = [
+                    device for device in self.mbeds.list_mbeds(
+                        read_details_txt=self.read_details_txt)
+                    if device.get('target_id')]
+            return self._devices
+
+    def acquire(self, count=1, timeout=None, **criteria):
+        """! Hold boards that match some criteria
+        @param count Number of boards
+        @param timeout Seconds to wait for enough boards to be free, None to
+          wait forever
+        @param criteria Keywords of a 'Filter', such as platform_name='K64F'
+        @return A Lease of 'count' boards
+        @details Boards are only held when all 'count' of them can be, so
+          workers waiting for several boards don't block each other. Raises
+          LeaseTimeout when not enough boards are free before the timeout
+        """
+        matches = Filter(**criteria)
+        deadline = None if timeout is None else _now() + timeout
+        rescan = False
+        while True:
+            devices = [d for d in self._listed(rescan) if matches(d)]
+            lease = self._try_acquire(devices, count)
+            if lease is not None:
+                return lease
+            logger.debug("Less than %d free boards match %r", count, matches)
+            interval = self.poll_interval
+            if deadline is not None:
+                interval = min(interval, deadline - _now())
+                if interval <= 0:
+                    raise LeaseTimeout(
+                        "Less than %d free boards match %r after %s seconds"
+                        % (count, matches, timeout))
+            time.sleep(interval)
+            rescan = True
+
+    def _try_acquire(self, devices, count):
+        """! Hold 'count' of 'devices' without waiting
+        @return A Lease, or None, holding nothing, when too few are free
+        """
+        if len(devices) < count:
+            return None
+        try:
+            makedirs(self.lock_dir)
+        except OSError:
+            pass
+        held = []
+        for device in devices:
+            path = join(self.lock_dir, "%s.lock" % device['target_id'])
+            with _held_lock:
+                if path in _held:
+                    continue
+                _held.add(path)
+            lock = InterProcessLock(path)
+            if lock.acquire(blocking=False):
+                held.append((device, (path, lock)))
+                if len(held) == count:
+                    break
+            else:
+                with _held_lock:
+                    _held.discard(path)
+        lease = Lease([deepcopy(d) for d, _ in held], [l for _, l in held])
+        if len(held) < count:
+            lease.release()
+            return None
+        logger.debug("Acquired %r", lease.target_ids)
+        return lease
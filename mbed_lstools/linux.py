@@ -16,10 +16,13 @@ limitations under the License.
 """
 
 import re
+import socket
+import threading
 from os.path import join, isdir, dirname, abspath
 import os
 
 from .lstools_base import MbedLsToolsBase
+from . import sysfs
 
 import logging
 logger = logging.getLogger("mbedls.lstools_linux")
@@ -34,32 +37,193 @@ def _readlink(link):
         return content
 
 
+try:
+    _fsdecode = os.fsdecode
+except AttributeError:
+    def _fsdecode(path):
+        # Python 2 uses byte strings as paths
+        return path
+
+
+def _unescape_mountinfo(field):
+    """! Undo the octal escaping of whitespace and backslashes in mountinfo"""
+    return re.sub(r'\\([0-7]{3})', lambda m: chr(int(m.group(1), 8)), field)
+
+
+def _parse_mountinfo(lines):
+    """! Parse the lines of a mountinfo file for vfat mounts
+    @param lines Lines of /proc/<pid>/mountinfo, as bytes
+    @return Generator of (major:minor, device file, mount point) tuples
+    @details Each line has the form:
+      '36 35 8:16 / /media/usb0 rw,relatime shared:1 - vfat /dev/sdb rw,...'
+      The optional fields are terminated by a single '-'. Paths are decoded
+      as the os module does, so that names that are not valid in the file
+      system encoding can still be opened
+    """
+    for line in lines:
+        fields = _fsdecode(line).split()
+        try:
+            separator = fields.index('-', 6)
+        except ValueError:
+            continue
+        if len(fields) > separator + 2 and fields[separator + 1] == 'vfat':
+            yield (fields[2],
+                   _unescape_mountinfo(fields[separator + 2]),
+                   _unescape_mountinfo(fields[4]))
+
+
+def _devno(dev):
+    """! Get the 'major:minor' device number of a device file
+    @return Device number string or None if the device can't be stat'ed
+    """
+    try:
+        rdev = os.stat(dev).st_rdev
+    except OSError:
+        return None
+    return "%d:%d" % (os.major(rdev), os.minor(rdev))
+
+
 class MbedLsToolsLinuxGeneric(MbedLsToolsBase):
     """ mbed-enabled platform for Linux with udev
     """
+
+    MOUNTINFO_FILE_NAME = '/proc/self/mountinfo'
+
     def __init__(self, **kwargs):
         """! ctor
+        @param hotplug When True, keep the disk and serial device tables up to
+          date from kernel uevents instead of enumerating them on every call
+        @param uevent_source Optional uevent source used when 'hotplug' is
+          set; defaults to a netlink socket
+        @param sysfs_root When set, enumerate USB devices by walking
+          <sysfs_root>/bus/usb/devices instead of parsing the names of the
+          /dev/<type>/by-id symbolic links
+        @param watch When True, only re-read the /dev/<type>/by-id directories
+          and the mount table after inotify or poll() reports a change
         """
         MbedLsToolsBase.__init__(self, **kwargs)
         self.nlp = re.compile(
             r'(pci|usb)-[0-9a-zA-Z_-]*_(?P<usbid>[0-9a-zA-Z]*)-.*$')
         self.mmp = re.compile(
             r'(?P<dev>(/[^/ ]*)+) on (?P<dir>(/[^/ ]*)+) ')
+        self.sysfs_root = kwargs.get('sysfs_root', None)
+        self._uevents = None
+        if kwargs.get('hotplug', False):
+            self._start_hotplug(kwargs.get('uevent_source', None))
+        self._watcher = None
+        self._watched_values = {}
+        # The watcher and the uevent table are not thread safe
+        self._candidates_lock = threading.Lock()
+        if kwargs.get('watch', False):
+            self._start_watch()
+
+    def _start_hotplug(self, source):
+        """! Subscribe to uevents, falling back to enumerating devices on every
+        call if that is not possible
+        """
+        from .uevent import NetlinkUeventSource, UeventDeviceTable
+        if source is None:
+            try:
+                source = NetlinkUeventSource()
+            except (socket.error, AttributeError) as e:
+                logger.warning("Could not subscribe to uevents: %s. "
+                               "Hotplug support is disabled", e)
+                return
+        self._uevents = UeventDeviceTable(source, self._enumerate_ids,
+                                          self._link_usb_id)
+
+    def _start_watch(self):
+        """! Watch the inputs of 'find_candidates', falling back to reading
+        them on every call if that is not possible
+        """
+        from .watch import ChangeWatcher
+        try:
+            self._watcher = ChangeWatcher()
+        except (OSError, AttributeError) as e:
+            logger.warning("Could not watch for device changes: %s", e)
+            return
+        # The by-id directories are only read when they are the source of
+        # the USB ids; watching them otherwise leaves changes that are never
+        # read, which would wake up every 'wait'
+        if self._uevents is None and not self.sysfs_root:
+            for device_type in ['disk', 'serial']:
+                self._watcher.watch_directory(
+                    device_type, join("/dev", device_type, "by-id"))
+        self._watcher.watch_mountinfo('mounts', self.MOUNTINFO_FILE_NAME)
+
+    def _watched(self, name, load):
+        """! Serve an input from memory until its watch reports a change
+        @param name Name of the watched input
+        @param load Function that reads the input
+        """
+        if self._watcher is None:
+            return load()
+        if self._watcher.changed(name) or name not in self._watched_values:
+            self._watched_values[name] = load()
+        return self._watched_values[name]
+
+    def _wait_for_change(self, timeout):
+        """! Block until the by-id directories or the mount table change,
+        when they are watched
+        """
+        if self._watcher is None:
+            return MbedLsToolsBase._wait_for_change(self, timeout)
+        self._watcher.wait(timeout)
 
     def find_candidates(self):
-        disk_ids = self._dev_by_id('disk')
-        serial_ids = self._dev_by_id('serial')
-        mount_ids = dict(self._fat_mounts())
+        with self._candidates_lock:
+            return self._candidates(self._watched('mounts', self._mount_table))
+
+    def _candidates(self, mount_table):
+        """! Match the USB disks and serial ports with the mount table
+        @param mount_table The same as '_mount_table' returns
+        """
+        disk_ids, serial_ids = self._usb_ids()
+        mount_ids, mount_devnos = mount_table
         logger.debug("Mount mapping %r", mount_ids)
 
         return [
             {
-                'mount_point' : mount_ids.get(disk_dev),
+                'mount_point' : self._mount_point(disk_dev, mount_ids,
+                                                  mount_devnos),
                 'serial_port' : serial_ids.get(disk_uuid),
                 'target_id_usb_id' : disk_uuid
             } for disk_uuid, disk_dev in disk_ids.items()
         ]
 
+    def _candidate_commands(self):
+        """! Only the fallback to the 'mount' command is worth running
+        asynchronously; the by-id directories and procfs are read in an
+        executor
+        """
+        if os.access(self.MOUNTINFO_FILE_NAME, os.R_OK):
+            return None
+        return [['mount']]
+
+    def _candidates_from_output(self, outputs):
+        _stdout, _, retval = outputs[0]
+        mount_ids = {} if retval else dict(self._parse_mount_output(_stdout))
+        return self._candidates((mount_ids, {}))
+
+    def _usb_ids(self):
+        """! Get the USBID maps of disks and serial ports
+        @return Tuple of two dicts: USBID -> disk device and
+          USBID -> serial device
+        """
+        if self._uevents:
+            return self._uevents.ids('disk'), self._uevents.ids('serial')
+        if self.sysfs_root:
+            return sysfs.usb_ids(self.sysfs_root)
+        return (self._watched('disk', lambda: self._dev_by_id('disk')),
+                self._watched('serial', lambda: self._dev_by_id('serial')))
+
+    def _enumerate_ids(self, device_type):
+        """! Get a dict, USBID -> device, for a device class from scratch"""
+        if self.sysfs_root:
+            disk_ids, serial_ids = sysfs.usb_ids(self.sysfs_root)
+            return disk_ids if device_type == 'disk' else serial_ids
+        return self._dev_by_id(device_type)
+
     def _dev_by_id(self, device_type):
         """! Get a dict, USBID -> device, for a device class
         @param device_type The type of devices to search. For exmaple, "serial"
@@ -79,18 +243,66 @@ class MbedLsToolsLinuxGeneric(MbedLsToolsBase):
                          "armmbed/mbed-ls.", device_type, device_type)
             return {}
 
+    def _mount_point(self, disk_dev, mount_ids, mount_devnos):
+        """! Find the mount point of a disk
+        @details Tries the device file first and falls back to the device
+          number, which also matches mounts made through another name for the
+          same device (/dev/disk/by-uuid/..., device mapper, etc.)
+        """
+        mount_point = mount_ids.get(disk_dev)
+        if not mount_point and mount_devnos:
+            mount_point = mount_devnos.get(_devno(disk_dev))
+        return mount_point
+
+    def _mount_table(self):
+        """! Map mounted devices with vfat file system (potential mbeds) to
+        their mount points
+        @return Tuple of two dicts: device file -> mount point and
+          'major:minor' device number -> mount point
+        @details Reads /proc/self/mountinfo, and only falls back to the Linux
+          shell command 'mount' when procfs is unavailable
+        """
+        try:
+            with open(self.MOUNTINFO_FILE_NAME, 'rb') as mountinfo:
+                lines = mountinfo.read().splitlines()
+        except (IOError, OSError) as e:
+            logger.debug("Could not read %s: %s. Falling back to 'mount'",
+                         self.MOUNTINFO_FILE_NAME, e)
+            return dict(self._fat_mounts_cli()), {}
+
+        mount_ids = {}
+        mount_devnos = {}
+        for devno, dev, mount_point in _parse_mountinfo(lines):
+            mount_ids[dev] = mount_point
+            mount_devnos[devno] = mount_point
+        return mount_ids, mount_devnos
+
     def _fat_mounts(self):
+        """! Lists mounted devices with vfat file system (potential mbeds)
+        @result Returns list of all mounted vfat devices
+        """
+        for dev_dir in self._mount_table()[0].items():
+            yield dev_dir
+
+    def _fat_mounts_cli(self):
         """! Lists mounted devices with vfat file system (potential mbeds)
         @result Returns list of all mounted vfat devices
         @details Uses Linux shell command: 'mount'
         """
         _stdout, _, retval = self._run_cli_process('mount')
         if not retval:
-            for line in _stdout.splitlines():
-                if b'vfat' in line:
-                    match = self.mmp.search(line.decode('utf-8'))
-                    if match:
-                        yield match.group("dev"), match.group("dir")
+            for dev_dir in self._parse_mount_output(_stdout):
+                yield dev_dir
+
+    def _parse_mount_output(self, output):
+        """! Get the vfat mounts from the output of 'mount'
+        @return Generator of (device file, mount point) tuples
+        """
+        for line in output.splitlines():
+            if b'vfat' in line:
+                match = self.mmp.search(_fsdecode(line))
+                if match:
+                    yield match.group("dev"), match.group("dir")
 
     def _hex_ids(self, dev_list):
         """! Build a USBID map for a device list
@@ -101,6 +313,15 @@ class MbedLsToolsLinuxGeneric(MbedLsToolsBase):
         """
         logger.debug("Converting device list %r", dev_list)
         for dl in dev_list:
-            match = self.nlp.search(dl)
-            if match:
-                yield match.group("usbid"), _readlink(dl)
+            usb_id = self._link_usb_id(dl)
+            if usb_id is not None:
+                yield usb_id, _readlink(dl)
+
+    def _link_usb_id(self, link):
+        """! Get the USBID from a "by-id" symbolic link name
+        @return USBID or None if the link is not a USB device
+        """
+        match = self.nlp.search(link)
+        if match:
+            return match.group("usbid")
+        return None
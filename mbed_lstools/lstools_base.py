@@ -18,7 +18,13 @@ limitations under the License.
 import re
 import os
 import sys
+import time
+import atexit
+import weakref
 import functools
+import threading
+from copy import deepcopy
+from contextlib import contextmanager
 from os.path import expanduser
 from io import open
 import json
@@ -26,9 +32,18 @@ from os import listdir
 from os.path import isfile, join, exists, isdir
 import logging
 from abc import ABCMeta, abstractmethod
+from multiprocessing.pool import ThreadPool
 
+from .cache import _now
+from .device import MbedDevice
+from .filters import Filter
 from .platform_database import PlatformDatabase, LOCAL_PLATFORM_DATABASE, \
-    LOCAL_MOCKS_DATABASE
+    LOCAL_MOCKS_DATABASE, local_platform_cache
+if sys.version_info >= (3, 6):
+    from .aio import AsyncListMixin
+else:
+    class AsyncListMixin(object):
+        """ The asyncio API needs Python 3.6 or newer """
 mbedls_root_logger = logging.getLogger("mbedls")
 mbedls_root_logger.setLevel(logging.WARNING)
 
@@ -46,12 +61,28 @@ def deprecated(reason):
         return new_func
     return actual_decorator
 
+@contextmanager
+def _no_deadline():
+    yield
+
+# Tools objects to close when the interpreter exits, without keeping them
+# alive until then
+_to_close = weakref.WeakSet()
+
+def _close_at_exit():
+    """Close the tools objects that still exist when the interpreter exits"""
+    for tools in list(_to_close):
+        tools.close()
+
+atexit.register(_close_at_exit)
+
 class FSInteraction(object):
     BeforeFilter = 1
     AfterFilter = 2
     Never = 3
+    Lazy = 4
 
-class MbedLsToolsBase(object):
+class MbedLsToolsBase(AsyncListMixin):
     """ Base class for mbed-lstools, defines mbed-ls tools interface for
     mbed-enabled devices detection for various hosts
     """
@@ -71,8 +102,57 @@ class MbedLsToolsBase(object):
 
     def __init__(self, list_unmounted=False, **kwargs):
         """ ctor
+        @param list_unmounted Include devices that are not mounted
+        @param max_workers Number of threads used to probe the file systems
+          of the devices; 1 probes them one after another
+        @param probe_timeout When set, read the file systems of the devices
+          in helper processes and give up on a device after this many seconds
+        @param details_cache When True, or the path of a file, keep what is
+          read from mbed.htm and DETAILS.TXT between runs, and only read
+          those files again when they may have changed
+        @param cache_ttl Seconds for which 'list_mbeds' returns the result of
+          an earlier call with the same arguments; 0 disables the cache
+        @param shared_cache When True, or the path of a file, share the
+          results of 'list_mbeds' with the other processes of this user for
+          'shared_cache_ttl' seconds, and let one process scan while the
+          others wait for its result
+        @param shared_cache_ttl Seconds a shared result stays valid
+        @param platform_cache When True, or the path of a file, load the
+          platform database from a cache that is rebuilt whenever one of its
+          files changes; False, the default, always reads the JSON files
+        @param platform_reload_interval When set, look for changes that other
+          processes made to the platform database files at most every this
+          many seconds, and read the changed files again
         """
         self.retarget_data = {}          # Used to retarget mbed-enabled platform properties
+        self.max_workers = kwargs.get('max_workers', 1) or 1
+        self._probe_helpers = None
+        if kwargs.get('probe_timeout', None):
+            from .probe_helpers import ProbeHelperPool
+            self._probe_helpers = ProbeHelperPool(self.max_workers,
+                                                  kwargs['probe_timeout'])
+        from .cache import ResultCache, DeviceIndex, SingleFlight
+        self._result_cache = ResultCache(kwargs.get('cache_ttl', 0) or 0)
+        self._scans = SingleFlight()        # Shares concurrent 'list_mbeds'
+        self._device_index = DeviceIndex()  # Used by the 'find_by_*' methods
+        self._snapshot = (None, {})       # Used by 'list_mbeds_changes'
+        self._snapshot_lock = threading.Lock()
+        self._mock_batch_depth = 0          # Used by 'mock_batch'
+        self._shared_cache = None
+        if kwargs.get('shared_cache', False):
+            from .cache import SharedScanCache, LOCAL_SCAN_CACHE
+            path = kwargs['shared_cache']
+            self._shared_cache = SharedScanCache(
+                LOCAL_SCAN_CACHE if path is True else path,
+                kwargs.get('shared_cache_ttl', 2.0))
+        self._details_cache = None
+        if kwargs.get('details_cache', False):
+            from .cache import DetailsCache, LOCAL_DETAILS_CACHE
+            path = kwargs['details_cache']
+            self._details_cache = DetailsCache(
+                LOCAL_DETAILS_CACHE if path is True else path)
+        if self._probe_helpers or self._details_cache:
+            _to_close.add(self)
 
         platform_dbs = []
         if isfile(self.MOCK_FILE_NAME) or ("force_mock" in kwargs and kwargs['force_mock']):
@@ -80,8 +160,12 @@ class MbedLsToolsBase(object):
         elif isfile(LOCAL_MOCKS_DATABASE):
             platform_dbs.append(LOCAL_MOCKS_DATABASE)
         platform_dbs.append(LOCAL_PLATFORM_DATABASE)
-        self.plat_db = PlatformDatabase(platform_dbs,
-                                        primary_database=platform_dbs[0])
+        platform_cache = kwargs.get('platform_cache', False)
+        self.plat_db = PlatformDatabase(
+            platform_dbs, primary_database=platform_dbs[0],
+            cache_file=(local_platform_cache(platform_dbs)
+                        if platform_cache is True else platform_cache or None),
+            reload_interval=kwargs.get('platform_reload_interval', None))
         self.list_unmounted = list_unmounted
 
         if 'skip_retarget' not in kwargs or not kwargs['skip_retarget']:
@@ -111,7 +195,7 @@ class MbedLsToolsBase(object):
     def list_mbeds(
             self, fs_interaction=FSInteraction.BeforeFilter,
             filter_function=None, unique_names=False,
-            read_details_txt=False):
+            read_details_txt=False, fields=None):
         """ List details of connected devices
         @return Returns list of structures with detailed info about each mbed
         @param fs_interaction A member of the FSInteraction class that picks the
@@ -119,51 +203,743 @@ class MbedLsToolsBase(object):
         @param filter_function Function that is passed each mbed candidate,
           should return True if it should be included in the result
           Ex. mbeds = list_mbeds(filter_function=lambda m: m['platform_name'] == 'K64F')
+          A 'Filter' is checked one stage at a time, and only the devices
+          that pass on their USB id, serial port and mount point have their
+          file systems read, whatever the 'fs_interaction'. With
+          'FSInteraction.AfterFilter' and 'FSInteraction.Never', predicates
+          on the platform are also checked before the read, against the
+          platform looked up from the USB id. With
+          'FSInteraction.BeforeFilter', they are checked after the read,
+          which may change the platform
         @param unique_names A boolean controlling the presence of the
           'platform_unique_name' member of the output dict
         @param read_details_txt A boolean controlling the presense of the
           output dict attributes read from other files present on the 'mount_point'
+        @param fields List of the names of the attributes wanted in the output
+          dicts; only the files that provide them are read
         @details Function returns list of dictionaries with mbed attributes 'mount_point', TargetID name etc.
-        Function returns mbed list with platform names if possible
+        Function returns mbed list with platform names if possible.
+        Results are cached for 'cache_ttl' seconds, unless 'filter_function'
+        is given and is not a 'Filter'. Calls that could be cached share the
+        scan of an identical call already in progress in another thread.
+        """
+        if fields is not None:
+            fs_interaction, unique_names, read_details_txt = self._plan_fields(
+                fields, fs_interaction, filter_function, unique_names,
+                read_details_txt)
+        cache_key = self._result_cache_key(fs_interaction, filter_function,
+                                           unique_names, read_details_txt)
+        cached = self._result_cache.get(cache_key) if cache_key else None
+        if cached is None:
+            scan = functools.partial(self._scan, cache_key, fs_interaction,
+                                     filter_function, unique_names,
+                                     read_details_txt)
+            cached = self._scans.do(cache_key, scan) if cache_key else scan()
+
+        if fields is None:
+            return cached
+        return list(self._project(cached, fields))
+
+    def _scan(self, cache_key, fs_interaction, filter_function, unique_names,
+              read_details_txt):
+        """! List the devices and cache the result under 'cache_key'"""
+        scan = lambda: list(self._iter_mbeds(fs_interaction, filter_function,
+                                             unique_names, read_details_txt,
+                                             ordered=True))
+        if cache_key and self._shared_cache:
+            result = self._shared_cache.get_or_scan(
+                self._shared_cache_key(cache_key), scan)
+        else:
+            result = scan()
+        if cache_key:
+            self._result_cache.put(cache_key, result)
+        return result
+
+    def _shared_cache_key(self, cache_key):
+        """! Key of a listing in the cache shared between processes
+        @details The mock and retarget files are looked for in the current
+          directory, so the key includes it
+        """
+        return "%s %r %s %s" % (type(self).__name__, cache_key, os.getcwd(),
+                                json.dumps(self.retarget_data, sort_keys=True))
+
+    def iter_mbeds(
+            self, fs_interaction=FSInteraction.BeforeFilter,
+            filter_function=None, unique_names=False,
+            read_details_txt=False, fields=None):
+        """! Generator version of 'list_mbeds'
+        @return Yields each device as soon as its file system has been probed
+        @details Takes the same parameters as 'list_mbeds'. With 'max_workers'
+          above 1 the devices are yielded in the order their probing finishes,
+          and unique names are numbered in that order. Devices that have not
+          been probed when the generator is closed are never touched. Results
+          are not cached.
+        """
+        if fields is not None:
+            fs_interaction, unique_names, read_details_txt = self._plan_fields(
+                fields, fs_interaction, filter_function, unique_names,
+                read_details_txt)
+        mbeds = self._iter_mbeds(fs_interaction, filter_function,
+                                 unique_names, read_details_txt,
+                                 ordered=False)
+        return mbeds if fields is None else self._project(mbeds, fields)
+
+    # Attributes of the candidates, known without touching the file systems
+    CANDIDATE_FIELDS = frozenset(['mount_point', 'serial_port',
+                                  'target_id_usb_id'])
+
+    def _plan_fields(self, fields, fs_interaction, filter_function,
+                     unique_names, read_details_txt):
+        """! Work out the least work that produces the requested fields
+        @return Tuple of the fs_interaction, unique_names and read_details_txt
+          to list the devices with
+        @details A filter function or retargeting may look at any attribute,
+          so they keep the file systems in play. A 'Filter' only needs the
+          fields it names.
+        """
+        fields = set(fields)
+        if isinstance(filter_function, Filter):
+            fields |= filter_function.fields
+            filter_reads_files = False
+        else:
+            filter_reads_files = bool(filter_function)
+        if (fields <= self.CANDIDATE_FIELDS and not filter_reads_files and
+                not self.retarget_data and
+                fs_interaction != FSInteraction.Lazy):
+            fs_interaction = FSInteraction.Never
+        unique_names = unique_names and 'platform_name_unique' in fields
+        read_details_txt = read_details_txt and any(
+            f.startswith('daplink_') for f in fields)
+        return fs_interaction, unique_names, read_details_txt
+
+    @staticmethod
+    def _project(devices, fields):
+        """! Keep only the requested attributes of the devices
+        @param devices Iterable of devices
+        @return Generator of dicts with exactly the keys in 'fields'
+        """
+        return ({f: d.get(f) for f in fields} for d in devices)
+
+    def _iter_mbeds(self, fs_interaction, filter_function, unique_names,
+                    read_details_txt, ordered):
+        """! Find, probe, name and retarget the devices
+        @param ordered When True, yield the devices in the order of the
+          candidates even when they are probed in parallel
         """
         platform_count = {}
         candidates = list(self.find_candidates())
         logger.debug("Candidates for display %r", candidates)
-        result = []
-        for device in candidates:
-            if  ((not device['mount_point'] or
-                  not self.mount_point_ready(device['mount_point'])) and
-                 not self.list_unmounted):
-                if  (device['target_id_usb_id'] and device['serial_port']):
-                    logger.warning(
-                        "MBED with target id '%s' is connected, but not mounted. "
-                        "Use the '-u' flag to include it in the list.",
-                        device['target_id_usb_id'])
-            else:
-                platform_data = self.plat_db.get(device['target_id_usb_id'][0:4], verbose_data=True)
+        index_key = self._index_key(fs_interaction, read_details_txt)
+        untouched = {c['target_id_usb_id']: dict(c) for c in candidates}
+        probe = functools.partial(self._probe_candidate,
+                                  fs_interaction=fs_interaction,
+                                  filter_function=filter_function,
+                                  read_details_txt=read_details_txt)
+        try:
+            for device in self._map_candidates(probe, candidates, ordered):
+                if device:
+                    candidate = untouched.get(device['target_id_usb_id'])
+                    self._name_and_retarget(device, unique_names,
+                                            platform_count)
+                    if index_key and candidate:
+                        self._device_index.put(index_key, candidate, device)
+                    yield device
+        finally:
+            self._save_details_cache()
+
+    def find_by_target_id(self, target_id,
+                          fs_interaction=FSInteraction.BeforeFilter,
+                          read_details_txt=False):
+        """! Find the device with a target ID without listing all of them
+        @param target_id The 'target_id' of the device
+        @param fs_interaction The same as for 'list_mbeds'
+        @param read_details_txt The same as for 'list_mbeds'
+        @return The device, or None when no device has this target ID
+        @details The candidate whose USB id is the target ID is probed first.
+          The others are only probed, until the device is found, when it is
+          not that one, since the target ID read from mbed.htm may differ
+          from the USB id.
+        """
+        return self._find_by('target_id', target_id, fs_interaction,
+                             read_details_txt)
+
+    def find_by_serial_port(self, serial_port,
+                            fs_interaction=FSInteraction.BeforeFilter,
+                            read_details_txt=False):
+        """! Find the device with a serial port without listing all of them
+        @return The device, or None when no device has this serial port
+        @details Takes the same parameters as 'find_by_target_id'. Only the
+          candidate with this serial port is probed, unless retargeting may
+          change the serial ports.
+        """
+        return self._find_by('serial_port', serial_port, fs_interaction,
+                             read_details_txt)
+
+    def find_by_mount_point(self, mount_point,
+                            fs_interaction=FSInteraction.BeforeFilter,
+                            read_details_txt=False):
+        """! Find the device with a mount point without listing all of them
+        @return The device, or None when no device has this mount point
+        @details Takes the same parameters as 'find_by_target_id'. Only the
+          candidate with this mount point is probed, unless retargeting may
+          change the mount points.
+        """
+        return self._find_by('mount_point', mount_point, fs_interaction,
+                             read_details_txt)
+
+    def refresh(self, target_id, fs_interaction=FSInteraction.BeforeFilter,
+                read_details_txt=False):
+        """! Probe one device again, such as after flashing it
+        @param target_id The 'target_id' of the device
+        @param fs_interaction The same as for 'list_mbeds'
+        @param read_details_txt The same as for 'list_mbeds'
+        @return The updated device, or None when it is no longer attached
+        @details Only the candidate of the device is probed, as for
+          'find_by_target_id', but the indexed device is never reused. The
+          device index is updated, the results cached for 'cache_ttl' or
+          shared with other processes are dropped, and the next
+          'list_mbeds_changes' probes the device again and reports how it
+          changed since its previous call
+        """
+        if self._shared_cache:
+            self._shared_cache.invalidate()
+        return self._refresh(target_id, fs_interaction, read_details_txt)
+
+    def _refresh(self, target_id, fs_interaction, read_details_txt,
+                 warn_unmounted=True):
+        """! Probe one device again, leaving the results shared with other
+        processes alone
+        @param warn_unmounted False to not warn when the device is attached
+          but not mounted
+        @return The same as 'refresh'
+        """
+        index_key = self._index_key(fs_interaction, read_details_txt)
+        stale = self._usb_ids_of(target_id, index_key)
+        for usb_id in stale:
+            self._device_index.discard(index_key, usb_id)
+        self._result_cache.invalidate()
+
+        device = self._find_by('target_id', target_id, fs_interaction,
+                               read_details_txt, warn_unmounted)
+
+        if device is not None:
+            stale.add(device['target_id_usb_id'])
+        with self._snapshot_lock:
+            args, snapshot = self._snapshot
+            # Only make 'list_mbeds_changes' probe the device again; its
+            # previous state stays, so that the change is still reported
+            self._snapshot = (args, {
+                usb_id: (None, None, entry[2]) if usb_id in stale else entry
+                for usb_id, entry in snapshot.items()})
+        return device
+
+    # Bounds, in seconds, of the interval at which the 'wait_for_*' methods
+    # check the devices again
+    WAIT_POLL_MIN = 0.05
+    WAIT_POLL_MAX = 1.0
+
+    def wait_for_device(self, target_id, mounted=True, timeout=None,
+                        fs_interaction=FSInteraction.BeforeFilter,
+                        read_details_txt=False):
+        """! Block until a device is attached
+        @param target_id The 'target_id' of the device
+        @param mounted When True, wait until the device is also mounted and
+          its files can be read. When False, return as soon as its USB device
+          is attached, without reading its files when it is not mounted
+        @param timeout Seconds to wait, None to wait forever
+        @param fs_interaction The same as for 'list_mbeds'
+        @param read_details_txt The same as for 'list_mbeds'
+        @return The device, as returned by 'refresh', or None on timeout
+        @details Between checks, waits for the candidates to change where
+          the platform is notified of changes, and otherwise for an interval
+          that grows from WAIT_POLL_MIN to WAIT_POLL_MAX seconds. The checks
+          don't warn that the device is not mounted, and the results shared
+          with other processes are only dropped once the device is found
+        """
+        deadline = None if timeout is None else _now() + timeout
+        interval = self.WAIT_POLL_MIN
+        while True:
+            device = self._refresh(target_id, fs_interaction,
+                                   read_details_txt, warn_unmounted=False)
+            if device is None and not mounted:
+                device = self._attached_device(target_id, fs_interaction,
+                                               read_details_txt)
+            if device is not None and (device['mount_point'] or not mounted):
+                if self._shared_cache:
+                    self._shared_cache.invalidate()
+                return device
+            if not self._wait_until(deadline, interval):
+                return None
+            interval = min(interval * 2, self.WAIT_POLL_MAX)
+
+    def wait_for_remount(self, target_id, timeout=None,
+                         fs_interaction=FSInteraction.BeforeFilter,
+                         read_details_txt=False):
+        """! Block until a device is unmounted and then mounted again, such
+        as after a binary is copied to it
+        @return The remounted device, as returned by 'refresh', or None on
+          timeout
+        @details Takes the same parameters as 'wait_for_device'. Call it
+          right after the copy; a remount that is already over when it is
+          called is not noticed. Being unplugged counts as being unmounted.
+        """
+        deadline = None if timeout is None else _now() + timeout
+        interval = self.WAIT_POLL_MIN
+        index_key = self._index_key(fs_interaction, read_details_txt)
+        while self._is_mounted(target_id, index_key):
+            if not self._wait_until(deadline, interval):
+                return None
+            interval = min(interval * 2, self.WAIT_POLL_MAX)
+        logger.debug("Device %s is unmounted, waiting for it to come back",
+                     target_id)
+        remaining = None if deadline is None else max(deadline - _now(), 0)
+        return self.wait_for_device(target_id, True, remaining,
+                                    fs_interaction, read_details_txt)
+
+    def _wait_until(self, deadline, interval):
+        """! Wait for the candidates to change for at most 'interval' seconds
+        @return False, without waiting, when 'deadline' has passed
+        """
+        if deadline is not None:
+            interval = min(interval, deadline - _now())
+            if interval <= 0:
+                return False
+        self._wait_for_change(interval)
+        return True
+
+    def _wait_for_change(self, timeout):
+        """! Block until the candidates may have changed
+        @param timeout Seconds to wait at most
+        @details Sleeps for the whole timeout; platforms that are notified of
+          changes to the candidates return as soon as one happens
+        """
+        time.sleep(timeout)
+
+    def _usb_ids_of(self, target_id, index_key):
+        """! The USB ids a target ID is known by
+        @return Set of the target ID itself and the USB ids of the devices
+          with this target ID in the device index and the snapshot of
+          'list_mbeds_changes'
+        """
+        usb_ids = set([target_id])
+        if index_key:
+            _, indexed = self._device_index.get(index_key, 'target_id',
+                                                target_id)
+            if indexed is not None:
+                usb_ids.add(indexed['target_id_usb_id'])
+        usb_ids.update(usb_id for usb_id, (_, _, device)
+                       in self._snapshot[1].items()
+                       if device.get('target_id') == target_id)
+        return usb_ids
+
+    def _is_mounted(self, target_id, index_key):
+        """! Check, without reading any files, whether a device is mounted
+        """
+        usb_ids = self._usb_ids_of(target_id, index_key)
+        return any(c['mount_point'] and self.mount_point_ready(c['mount_point'])
+                   for c in self.find_candidates()
+                   if c['target_id_usb_id'] in usb_ids)
+
+    def _attached_device(self, target_id, fs_interaction, read_details_txt):
+        """! Describe an attached device from its candidate only
+        @return The device as 'FSInteraction.Never' lists it, or None when no
+          candidate has a USB id the target ID is known by
+        """
+        usb_ids = self._usb_ids_of(
+            target_id, self._index_key(fs_interaction, read_details_txt))
+        for candidate in self.find_candidates():
+            if candidate['target_id_usb_id'] in usb_ids:
+                device = dict(candidate)
+                platform_data = self.plat_db.get(
+                    device['target_id_usb_id'][0:4], verbose_data=True)
                 device.update(platform_data or {"platform_name": None})
-                maybe_device = {
-                    FSInteraction.BeforeFilter: self._fs_before_id_check,
-                    FSInteraction.AfterFilter: self._fs_after_id_check,
-                    FSInteraction.Never: self._fs_never
-                }[fs_interaction](device, filter_function, read_details_txt)
-                if maybe_device and (maybe_device['mount_point'] or self.list_unmounted):
-                    if unique_names:
-                        name = device['platform_name']
-                        platform_count.setdefault(name, -1)
-                        platform_count[name] += 1
-                        device['platform_name_unique'] = (
-                            "%s[%d]" % (name, platform_count[name]))
-                    try:
-                        device.update(self.retarget_data[device['target_id']])
-                        logger.debug("retargeting %s with %r",
-                                     device['target_id'],
-                                     self.retarget_data[device['target_id']])
-                    except KeyError:
-                        pass
-                    result.append(maybe_device)
+                self._fs_never(device, None, False)
+                self._name_and_retarget(device, False, {})
+                return device
+        return None
 
-        return result
+    def _find_by(self, field, value, fs_interaction, read_details_txt,
+                 warn_unmounted=True):
+        """! Find a device by the value of one of its fields
+        @param warn_unmounted The same as for '_keep_candidate'
+        @details Devices found by 'list_mbeds', 'iter_mbeds' and earlier
+          lookups are indexed. An indexed device is returned without being
+          probed again while its candidate is unchanged.
+        """
+        candidates = list(self.find_candidates())
+        index_key = self._index_key(fs_interaction, read_details_txt)
+        if index_key:
+            candidate, device = self._device_index.get(index_key, field, value)
+            if device is not None and candidate in candidates:
+                logger.debug("Found %s %s in the index", field, value)
+                return device
+            if device is not None:
+                self._device_index.discard(index_key,
+                                           candidate['target_id_usb_id'])
+            # The indexed devices that are still attached the same way are
+            # known not to match
+            candidates = [c for c in candidates
+                          if self._device_index.get(
+                              index_key, 'target_id_usb_id',
+                              c['target_id_usb_id'])[0] != c]
+
+        # The candidates tell the USB id, serial port and mount point, and
+        # the target ID is almost always the USB id
+        candidate_field = ('target_id_usb_id' if field == 'target_id'
+                           else field)
+        likely = [c for c in candidates if c[candidate_field] == value]
+        others = []
+        if field == 'target_id' or self.retarget_data:
+            others = [c for c in candidates if c[candidate_field] != value]
+        logger.debug("Looking for %s %s in %r, then %r", field, value,
+                     likely, others)
+        probe = functools.partial(self._probe_candidate,
+                                  fs_interaction=fs_interaction,
+                                  filter_function=None,
+                                  read_details_txt=read_details_txt,
+                                  warn_unmounted=warn_unmounted)
+        try:
+            for group in (likely, others):
+                untouched = {c['target_id_usb_id']: dict(c) for c in group}
+                devices = self._map_candidates(probe, group, ordered=False)
+                try:
+                    for device in devices:
+                        if not device:
+                            continue
+                        candidate = untouched.get(device['target_id_usb_id'])
+                        self._name_and_retarget(device, False, {})
+                        if index_key and candidate:
+                            self._device_index.put(index_key, candidate,
+                                                   device)
+                        if device.get(field) == value:
+                            return device
+                finally:
+                    devices.close()
+        finally:
+            self._save_details_cache()
+        return None
+
+    def _index_key(self, fs_interaction, read_details_txt):
+        """! Key of the devices probed the same way in the device index
+        @return None for lazy records, which are not indexed
+        """
+        if fs_interaction == FSInteraction.Lazy:
+            return None
+        return (fs_interaction, read_details_txt, self.list_unmounted)
+
+    def list_mbeds_changes(
+            self, fs_interaction=FSInteraction.BeforeFilter,
+            read_details_txt=False):
+        """! List what changed since the previous call
+        @param fs_interaction The same as for 'list_mbeds'
+        @param read_details_txt The same as for 'list_mbeds'
+        @return Dict with the lists 'added' and 'removed' of devices, and the
+          list 'changed' of dicts with the 'device', its 'previous' state and
+          the sorted names of the 'fields' that differ
+        @details The previous scan is kept, keyed by 'target_id_usb_id'. A
+          device whose candidate (mount point and serial port) is the same as
+          in the previous scan, and whose mbed.htm and DETAILS.TXT have the
+          same modification time and size, is not probed again. The first
+          call, and the first after a change of arguments, reports every
+          device as added. Concurrent calls run one after another.
+        """
+        with self._snapshot_lock:
+            return self._list_mbeds_changes(fs_interaction, read_details_txt)
+
+    def _list_mbeds_changes(self, fs_interaction, read_details_txt):
+        args, previous = self._snapshot
+        if args != (fs_interaction, read_details_txt, self.list_unmounted):
+            args = (fs_interaction, read_details_txt, self.list_unmounted)
+            # Devices probed with other arguments have other fields
+            previous = {}
+
+        index_key = self._index_key(fs_interaction, read_details_txt)
+        devices = {}
+        to_probe = []
+        stamps = {}
+        for candidate in self.find_candidates():
+            usb_id = candidate['target_id_usb_id']
+            # Taken before probing, so that a change made meanwhile is seen
+            # by the next call
+            stamps[usb_id] = self._fs_stamps(candidate, fs_interaction,
+                                             read_details_txt)
+            if (usb_id in previous and previous[usb_id][0] == candidate and
+                    previous[usb_id][1] == stamps[usb_id]):
+                devices[usb_id] = previous[usb_id]
+            else:
+                to_probe.append(candidate)
+        logger.debug("Probing changed candidates %r", to_probe)
+        probe = functools.partial(self._probe_candidate,
+                                  fs_interaction=fs_interaction,
+                                  filter_function=None,
+                                  read_details_txt=read_details_txt)
+        # Probing fills in the candidates, so keep copies to compare with
+        untouched = [dict(candidate) for candidate in to_probe]
+        for candidate, device in zip(untouched,
+                                     self._map_candidates(probe, to_probe)):
+            if device:
+                self._name_and_retarget(device, False, {})
+                usb_id = candidate['target_id_usb_id']
+                devices[usb_id] = (candidate, stamps[usb_id], device)
+                if index_key:
+                    self._device_index.put(index_key, candidate, device)
+        self._save_details_cache()
+        self._snapshot = (args, devices)
+
+        changes = {'added': [], 'removed': [], 'changed': []}
+        for usb_id, (_, _, device) in devices.items():
+            if usb_id not in previous:
+                changes['added'].append(deepcopy(device))
+                continue
+            old_device = previous[usb_id][2]
+            fields = sorted(k for k in set(device) | set(old_device)
+                            if device.get(k) != old_device.get(k))
+            if fields:
+                changes['changed'].append({'device': deepcopy(device),
+                                           'previous': deepcopy(old_device),
+                                           'fields': fields})
+        for usb_id, (_, _, device) in previous.items():
+            if usb_id not in devices:
+                changes['removed'].append(deepcopy(device))
+        return changes
+
+    def _fs_stamps(self, candidate, fs_interaction, read_details_txt):
+        """! Tell cheaply whether the files a probe reads may have changed
+        @return Tuple of the device number, modification time and size of
+          mbed.htm and, with 'read_details_txt', of DETAILS.TXT; None for a
+          file that can't be stat'ed
+        @details A firmware update remounts the device at the same paths,
+          but rewrites these files
+        """
+        if (fs_interaction == FSInteraction.Never or
+                not candidate.get('mount_point')):
+            return ()
+        names = [self.MBED_HTM_NAME]
+        if read_details_txt:
+            names.append(self.DETAILS_TXT_NAME)
+        stamps = []
+        for name in names:
+            try:
+                with self._probe_deadline():
+                    stamps.append(tuple(self._stat(
+                        join(candidate['mount_point'], name))))
+            except (IOError, OSError):
+                stamps.append(None)
+        return tuple(stamps)
+
+    def close(self):
+        """! Stop the probe helper processes, and save what lazy records
+        added to the details cache
+        @details Called when the interpreter exits. The object can still be
+          used afterwards; helpers are started again when needed
+        """
+        if self._probe_helpers:
+            self._probe_helpers.close()
+        self._save_details_cache()
+
+    def invalidate(self):
+        """! Forget the results cached for 'cache_ttl', the results shared
+        with other processes and the devices indexed for the 'find_by_*'
+        methods, so that the next call scans the devices again
+        """
+        self._result_cache.invalidate()
+        self._device_index.clear()
+        if self._shared_cache:
+            self._shared_cache.invalidate()
+
+    def cache_stats(self):
+        """! Counters of the 'list_mbeds' result cache
+        @return Dict with the number of 'hits' and 'misses', the 'ttl', and
+          the number of calls that were 'coalesced' with a scan in progress
+        """
+        stats = self._result_cache.stats()
+        stats['coalesced'] = self._scans.shared
+        return stats
+
+    def _result_cache_key(self, fs_interaction, filter_function, unique_names,
+                          read_details_txt):
+        """! Key of a listing in the result cache
+        @return None when the listing can't be cached, because the result of
+          'filter_function' can't be known without calling it, or because
+          copying lazy records would read everything they defer
+        """
+        if filter_function and not isinstance(filter_function, Filter):
+            return None
+        if fs_interaction == FSInteraction.Lazy:
+            return None
+        return (fs_interaction, unique_names, read_details_txt,
+                self.list_unmounted, filter_function)
+
+    def _map_candidates(self, probe, candidates, ordered=True):
+        """! Probe candidates, in parallel when 'max_workers' allows it
+        @param probe Function called with each candidate
+        @param candidates List of candidates
+        @param ordered When False, parallel results come in the order they
+          finish instead of the order of 'candidates'
+        @return Generator of the results of 'probe'
+        @details Candidates that have not been probed yet are skipped when
+          the generator is closed
+        """
+        workers = min(self.max_workers, len(candidates))
+        if workers <= 1:
+            for device in candidates:
+                yield probe(device)
+            return
+        pool = ThreadPool(workers)
+        try:
+            if ordered:
+                results = pool.imap(probe, candidates)
+            else:
+                results = pool.imap_unordered(probe, candidates)
+            for result in results:
+                yield result
+        finally:
+            pool.terminate()
+
+    def _probe_candidate(self, device, fs_interaction, filter_function,
+                         read_details_txt, warn_unmounted=True):
+        """! Look up and filter a single candidate, touching its file system
+        as requested
+        @param warn_unmounted The same as for '_keep_candidate'
+        @return The device, or None if it is filtered out or not mounted
+        @details Only touches 'device', so candidates may be probed in parallel
+        """
+        if not self._prefilter(device, filter_function, self.CANDIDATE_FIELDS):
+            return None
+        if self.list_unmounted and fs_interaction == FSInteraction.Never:
+            # Listed anyway, and nothing is read from the mount point
+            mounted = True
+        else:
+            mounted = bool(device['mount_point'] and
+                           self.mount_point_ready(device['mount_point']))
+        if not self._keep_candidate(device, mounted, warn_unmounted):
+            return None
+        return self._identify_candidate(device, fs_interaction,
+                                        filter_function, read_details_txt)
+
+    def _keep_candidate(self, device, mounted, warn_unmounted=True):
+        """! Decide whether a candidate is listed, given whether its mount
+        point is ready
+        @param warn_unmounted False to leave an unmounted device out without
+          warning about it, such as while waiting for it to be mounted
+        @return False, after warning about it, when an unmounted device is left
+          out of the list
+        """
+        if not mounted and not self.list_unmounted:
+            if (warn_unmounted and device['target_id_usb_id'] and
+                    device['serial_port']):
+                logger.warning(
+                    "MBED with target id '%s' is connected, but not mounted. "
+                    "Use the '-u' flag to include it in the list.",
+                    device['target_id_usb_id'])
+            return False
+        return True
+
+    def _prefilter(self, device, filter_function, known):
+        """! Check the predicates of a 'Filter' whose fields are known
+        @param known Names of the fields of 'device' that are known so far
+        @return False if 'filter_function' is a 'Filter' that already rejects
+          the device
+        """
+        if not isinstance(filter_function, Filter):
+            return True
+        return filter_function.matches(device, known)
+
+    def _identify_candidate(self, device, fs_interaction, filter_function,
+                            read_details_txt):
+        """! Look up and filter a candidate that is to be listed
+        @return The device, or None if it is filtered out or not mounted
+        """
+        if fs_interaction == FSInteraction.Lazy:
+            return self._lazy_device(device, filter_function, read_details_txt)
+        platform_data = self.plat_db.get(device['target_id_usb_id'][0:4], verbose_data=True)
+        platform_data = platform_data or {"platform_name": None}
+        device.update(platform_data)
+        if (isinstance(filter_function, Filter) and
+                fs_interaction != FSInteraction.BeforeFilter):
+            # As a callable would, take the platform of the USB id as final;
+            # with BeforeFilter, mbed.htm may still name another platform
+            if not self._prefilter(device, filter_function,
+                                   self.CANDIDATE_FIELDS.union(platform_data)):
+                return None
+            # What is left of the filter is checked once the files are read
+            if fs_interaction == FSInteraction.AfterFilter:
+                fs_interaction = FSInteraction.BeforeFilter
+        maybe_device = {
+            FSInteraction.BeforeFilter: self._fs_before_id_check,
+            FSInteraction.AfterFilter: self._fs_after_id_check,
+            FSInteraction.Never: self._fs_never
+        }[fs_interaction](device, filter_function, read_details_txt)
+        if maybe_device and (maybe_device['mount_point'] or self.list_unmounted):
+            return maybe_device
+        return None
+
+    def _lazy_device(self, device, filter_function, read_details_txt):
+        """! Make a record that only touches the file system of the device
+        when a field read from it is accessed
+        @return The record, or None if it is filtered out
+        """
+        # The platform is only known once the file system is read
+        if not self._prefilter(device, filter_function, self.CANDIDATE_FIELDS):
+            return None
+        record = MbedDevice(device)
+        candidate_fields = frozenset(device)
+        record.defer(lambda key: key not in candidate_fields,
+                     self._resolve_lazy_fs)
+        if read_details_txt:
+            record.defer(lambda key: key.startswith('daplink_'),
+                         self._resolve_lazy_details)
+        if not filter_function or filter_function(record):
+            return record
+        return None
+
+    def _resolve_lazy_fs(self, record):
+        """! Fill in what 'FSInteraction.BeforeFilter' reads, except DETAILS.TXT"""
+        platform_data = self.plat_db.get(record['target_id_usb_id'][0:4],
+                                         verbose_data=True)
+        record.update(platform_data or {"platform_name": None})
+        record['target_id'] = record['target_id_usb_id']
+        self._update_device_from_fs(record, False)
+
+    def _resolve_lazy_details(self, record):
+        """! Fill in the 'daplink_*' fields read from DETAILS.TXT"""
+        if not record['mount_point'] or record['device_type'] != 'daplink':
+            return
+        try:
+            with self._probe_deadline():
+                details_txt = self._cached_read(record, self.DETAILS_TXT_NAME,
+                                                self._details_txt) or {}
+        except (OSError, IOError) as e:
+            logger.warning(
+                'Marking device with mount point "%s" as unmounted due to the '
+                'following error: %s', record['mount_point'], e)
+            record['mount_point'] = None
+            record['device_type'] = 'unknown'
+            return
+        record.update({"daplink_%s" % f.lower().replace(' ', '_'): v
+                       for f, v in details_txt.items()})
+
+    def _name_and_retarget(self, device, unique_names, platform_count):
+        """! Add the 'platform_name_unique' and retargeted attributes of a
+        probed device
+        @param platform_count Dict of platform name -> last used index, shared
+          by all the devices of one listing
+        """
+        if unique_names:
+            name = device['platform_name']
+            platform_count.setdefault(name, -1)
+            platform_count[name] += 1
+            device['platform_name_unique'] = (
+                "%s[%d]" % (name, platform_count[name]))
+        if not self.retarget_data:
+            return
+        try:
+            device.update(self.retarget_data[device['target_id']])
+            logger.debug("retargeting %s with %r",
+                         device['target_id'],
+                         self.retarget_data[device['target_id']])
+        except KeyError:
+            pass
 
     def _fs_never(self, device, filter_function, read_details_txt):
         """Filter device without touching the file system of the device"""
@@ -209,14 +985,15 @@ class MbedLsToolsBase(object):
             return
 
         try:
-            directory_entries = os.listdir(device['mount_point'])
-            device['device_type'] = self._detect_device_type(directory_entries)
-            device['target_id'] = device['target_id_usb_id']
-
-            {
-                'daplink': self._update_device_details_daplink,
-                'jlink': self._update_device_details_jlink
-            }[device['device_type']](device, read_details_txt, directory_entries)
+            with self._probe_deadline():
+                directory_entries = self._listdir(device['mount_point'])
+                device['device_type'] = self._detect_device_type(directory_entries)
+                device['target_id'] = device['target_id_usb_id']
+
+                {
+                    'daplink': self._update_device_details_daplink,
+                    'jlink': self._update_device_details_jlink
+                }[device['device_type']](device, read_details_txt, directory_entries)
         except (OSError, IOError) as e:
             logger.warning(
                 'Marking device with mount point "%s" as unmounted due to the '
@@ -243,7 +1020,8 @@ class MbedLsToolsBase(object):
         """
         self._update_device_from_htm(device)
         if read_details_txt:
-            details_txt = self._details_txt(device['mount_point']) or {}
+            details_txt = self._cached_read(device, self.DETAILS_TXT_NAME,
+                                            self._details_txt) or {}
             device.update({"daplink_%s" % f.lower().replace(' ', '_'): v
                            for f, v in details_txt.items()})
 
@@ -272,8 +1050,7 @@ class MbedLsToolsBase(object):
             return
 
         board_file_path = os.path.join(device['mount_point'], lower_case_map[board_file_key])
-        with open(board_file_path, 'r') as board_file:
-            board_file_lines = board_file.readlines()
+        board_file_lines = self._readlines(board_file_path)
 
         for line in board_file_lines:
             m = re.search(r'url=([\w\d\:\-/\\\?\.=-_]+)', line)
@@ -292,7 +1069,8 @@ class MbedLsToolsBase(object):
         """Set the 'target_id', 'target_id_mbed_htm', 'platform_name' and
         'daplink_*' attributes by reading from mbed.htm on the device
         """
-        htm_target_id, daplink_info = self._read_htm_ids(device['mount_point'])
+        htm_target_id, daplink_info = self._cached_read(
+            device, self.MBED_HTM_NAME, self._read_htm_ids)
         if daplink_info:
             device.update({"daplink_%s" % f.lower().replace(' ', '_'): v
                            for f, v in daplink_info.items()})
@@ -319,6 +1097,23 @@ class MbedLsToolsBase(object):
             self.plat_db.remove(mid, permanent=True)
         else:
             raise ValueError("oper can only be [+-]")
+        if self._shared_cache and not self._mock_batch_depth:
+            self._shared_cache.invalidate()
+
+    @contextmanager
+    def mock_batch(self):
+        """! Make the 'mock_manufacture_id' calls of the 'with' block with a
+        single write of the mock file, and drop the results shared with other
+        processes once, when the outermost block exits
+        """
+        self._mock_batch_depth += 1
+        try:
+            with self.plat_db.batch():
+                yield self
+        finally:
+            self._mock_batch_depth -= 1
+            if not self._mock_batch_depth and self._shared_cache:
+                self._shared_cache.invalidate()
 
     @deprecated("List formatting methods are deprecated for a simpler API. "
                 "Please use 'list_mbeds' instead.")
@@ -549,8 +1344,7 @@ class MbedLsToolsBase(object):
     def _htm_lines(self, mount_point):
         if mount_point:
             mbed_htm_path = join(mount_point, self.MBED_HTM_NAME)
-            with open(mbed_htm_path, 'r') as f:
-                return f.readlines()
+            return self._readlines(mbed_htm_path)
 
     @deprecated("This method will be removed from the public API. "
                 "Please use 'list_mbeds' instead")
@@ -582,8 +1376,7 @@ class MbedLsToolsBase(object):
 
         if mount_point:
             path_to_details_txt = os.path.join(mount_point, self.DETAILS_TXT_NAME)
-            with open(path_to_details_txt, 'r') as f:
-                return self._parse_details(f.readlines())
+            return self._parse_details(self._readlines(path_to_details_txt))
         return None
 
     @deprecated("This method will be removed from the public API. "
@@ -629,8 +1422,90 @@ class MbedLsToolsBase(object):
     def mount_point_ready(self, path):
         """! Check if a mount point is ready for file operations
         """
+        if self._probe_helpers:
+            try:
+                return self._probe_helpers.call('isdir', path)
+            except (OSError, IOError) as e:
+                logger.warning('Mount point "%s" is not ready: %s', path, e)
+                return False
         return exists(path) and isdir(path)
 
+    def _mount_point_ready_command(self, path):
+        """! Command used by 'mount_point_ready_async'
+        @return List of the program and its arguments, or None to run
+          'mount_point_ready' in an executor
+        """
+        return None
+
+    def _candidate_commands(self):
+        """! Commands used by 'find_candidates_async'
+        @return List of commands, each a list of the program and its
+          arguments, or None to run 'find_candidates' in an executor
+        """
+        return None
+
+    def _candidates_from_output(self, outputs):
+        """! Build the candidates from the output of '_candidate_commands'
+        @param outputs List of (stdout, stderr, returncode), one per command
+        @return The same as 'find_candidates'
+        """
+        raise NotImplementedError
+
+    def _cached_read(self, device, file_name, read):
+        """! Read and parse a file on a device, unless the details cache
+        already holds what it parses to
+        @param file_name Name of the file in the root of the device
+        @param read Function that reads and parses the file, given the mount
+          point
+        @return What 'read' returns, or the JSON round trip of it on a hit
+        """
+        if not self._details_cache:
+            return read(device['mount_point'])
+        from .cache import boot_id
+        key = list(self._stat(join(device['mount_point'], file_name)))
+        key.append(boot_id())
+        value = self._details_cache.lookup(device['target_id_usb_id'],
+                                           file_name, key)
+        if value is None:
+            value = read(device['mount_point'])
+            self._details_cache.store(device['target_id_usb_id'], file_name,
+                                      key, value)
+        return value
+
+    def _save_details_cache(self):
+        if self._details_cache:
+            self._details_cache.save()
+
+    def _probe_deadline(self):
+        """! Context that bounds the time spent reading one device, when
+        probing in helper processes
+        """
+        if self._probe_helpers:
+            return self._probe_helpers.deadline()
+        return _no_deadline()
+
+    def _listdir(self, path):
+        """! List a directory on a device's file system"""
+        if self._probe_helpers:
+            return self._probe_helpers.call('listdir', path)
+        return os.listdir(path)
+
+    def _stat(self, path):
+        """! Get the device number, mtime and size of a file on a device's
+        file system
+        """
+        if self._probe_helpers:
+            return self._probe_helpers.call('stat', path)
+        st = os.stat(path)
+        return st.st_dev, st.st_mtime, st.st_size
+
+    def _readlines(self, path):
+        """! Read the lines of a file on a device's file system"""
+        if self._probe_helpers:
+            return self._probe_helpers.call('readlines', path)
+        with open(path, 'r') as f:
+            return f.readlines()
+
     @staticmethod
     @deprecated("This method will be removed from the public API. "
                 "Please use 'list_mbeds' instead")
@@ -26,6 +26,7 @@ from collections import defaultdict
 
 # Make sure that any global generic setup is run
 from . import lstools_base
+from .filters import Filter
 
 import logging
 logger = logging.getLogger("mbedls.main")
@@ -94,18 +95,32 @@ def get_version():
 def print_version(mbeds, args):
     print(get_version())
 
+def _fields(args):
+    """! The fields requested with '--fields', or None for all of them """
+    if not getattr(args, 'fields', None):
+        return None
+    return [f.strip() for f in args.fields.split(',') if f.strip()]
+
+def _filter(args):
+    """! The Filter built from the '--filter' options, or None """
+    return getattr(args, 'filter', None) or None
+
 def print_mbeds(mbeds, args, simple):
-    devices = mbeds.list_mbeds(unique_names=True, read_details_txt=True)
+    columns = _fields(args) or ['platform_name', 'platform_name_unique',
+                                'mount_point', 'serial_port', 'target_id',
+                                'daplink_version']
+    devices = mbeds.list_mbeds(unique_names=True, read_details_txt=True,
+                               filter_function=_filter(args), fields=columns)
     if devices:
         from prettytable import PrettyTable
-        columns = ['platform_name', 'platform_name_unique', 'mount_point',
-                    'serial_port', 'target_id', 'daplink_version']
         pt = PrettyTable(columns)
         pt.align = 'l'
         for d in devices:
             pt.add_row([d.get(col, None) or 'unknown' for col in columns])
+        sortby = ('platform_name_unique' if 'platform_name_unique' in columns
+                  else columns[0])
         print(pt.get_string(border=not simple, header=not simple,
-                            padding_width=1, sortby='platform_name_unique'))
+                            padding_width=1, sortby=sortby))
 
 def print_table(mbeds, args):
     return print_mbeds(mbeds, args, False)
@@ -114,45 +129,53 @@ def print_simple(mbeds, args):
     return print_mbeds(mbeds, args, True)
 
 def mock_platform(mbeds, args):
-    for token in args.mock.split(','):
-        if ':' in token:
-            oper = '+' # Default
-            mid, platform_name = token.split(':')
-            if mid and mid[0] in ['+', '-']:
-                oper = mid[0]   # Operation (character)
-                mid = mid[1:]   # We remove operation character
-            mbeds.mock_manufacture_id(mid, platform_name, oper=oper)
-        elif token and token[0] in ['-', '!']:
-            # Operations where do not specify data after colon: --mock=-1234,-7678
-            oper = token[0]
-            mid = token[1:]
-            mbeds.mock_manufacture_id(mid, 'dummy', oper=oper)
-        else:
-            logger.error("Could not parse mock from token: '%s'", token)
+    # All the tokens are written to the mock file at once
+    with mbeds.mock_batch():
+        for token in args.mock.split(','):
+            if ':' in token:
+                oper = '+' # Default
+                mid, platform_name = token.split(':')
+                if mid and mid[0] in ['+', '-']:
+                    oper = mid[0]   # Operation (character)
+                    mid = mid[1:]   # We remove operation character
+                mbeds.mock_manufacture_id(mid, platform_name, oper=oper)
+            elif token and token[0] in ['-', '!']:
+                # Operations where do not specify data after colon: --mock=-1234,-7678
+                oper = token[0]
+                mid = token[1:]
+                mbeds.mock_manufacture_id(mid, 'dummy', oper=oper)
+            else:
+                logger.error("Could not parse mock from token: '%s'", token)
 
 def list_platforms(mbeds, args):
     print(mbeds.list_manufacture_ids())
 
 def mbeds_as_json(mbeds, args):
     print(json.dumps(mbeds.list_mbeds(unique_names=True,
-                                      read_details_txt=True),
+                                      read_details_txt=True,
+                                      filter_function=_filter(args),
+                                      fields=_fields(args)),
                      indent=4, sort_keys=True))
 
 def json_by_target_id(mbeds, args):
-    print(json.dumps({m['target_id']: m for m
-                      in mbeds.list_mbeds(unique_names=True,
-                                          read_details_txt=True)},
+    fields = _fields(args)
+    # The target ID is the key, even when it is not one of the fields
+    devices = mbeds.list_mbeds(unique_names=True, read_details_txt=True,
+                               filter_function=_filter(args),
+                               fields=fields and fields + ['target_id'])
+    print(json.dumps({m['target_id']: {f: m[f] for f in fields} if fields else m
+                      for m in devices},
                      indent=4, sort_keys=True))
 
 def json_platforms(mbeds, args):
     platforms = set()
-    for d in mbeds.list_mbeds():
+    for d in mbeds.list_mbeds(filter_function=_filter(args)):
         platforms |= set([d['platform_name']])
     print(json.dumps(list(platforms), indent=4, sort_keys=True))
 
 def json_platforms_ext(mbeds, args):
     platforms = defaultdict(lambda: 0)
-    for d in mbeds.list_mbeds():
+    for d in mbeds.list_mbeds(filter_function=_filter(args)):
         platforms[d['platform_name']] += 1
     print(json.dumps(platforms, indent=4, sort_keys=True))
 
@@ -163,6 +186,9 @@ def parse_cli(to_parse):
      * command - python function to run
      * skip_retarget - bool indicting to skip retargeting
      * list_unmounted - list boards that are not mounted
+     * fields - comma separated fields to list, or None
+     * filter - Filter that listed boards must match, or None
+     * shared_cache - share scan results with other mbedls processes
      * debug - turn on debug logging
     """
     parser = argparse.ArgumentParser()
@@ -214,11 +240,30 @@ def parse_cli(to_parse):
         '-u', '--list-unmounted', dest='list_unmounted', default=False,
         action='store_true',
         help='list mbeds, regardless of whether they are mounted or not')
+    parser.add_argument(
+        '--fields', metavar='FIELD[,FIELD...]', default=None,
+        help='only list these fields, separated by commas, and only read the '
+        'files on the boards that they need. Ex. platform_name,serial_port')
+    parser.add_argument(
+        '--filter', metavar='FIELD[__OP]=VALUE', action='append', default=None,
+        help='only list boards whose FIELD matches VALUE; OP is one of %s, and '
+        'defaults to exact. May be repeated. Ex. platform_name=K64F'
+        % ', '.join(sorted(Filter.OPERATORS)))
+    parser.add_argument(
+        '--no-shared-cache', dest='shared_cache', default=True,
+        action='store_false',
+        help='scan the boards even when another mbedls process has just '
+        'done so, instead of reusing its result')
     parser.add_argument(
         '-d', '--debug', dest='debug', default=False, action="store_true",
         help='outputs extra debug information useful when creating issues!')
 
     args = parser.parse_args(to_parse)
+    if args.filter:
+        try:
+            args.filter = Filter.parse(args.filter)
+        except ValueError as e:
+            parser.error(str(e))
     if args.mock:
         args.command = mock_platform
     return args
@@ -253,7 +298,8 @@ def mbedls_main():
 
     mbeds = create(skip_retarget=args.skip_retarget,
                    list_unmounted=args.list_unmounted,
-                   force_mock=args.command is mock_platform)
+                   force_mock=args.command is mock_platform,
+                   shared_cache=args.shared_cache)
 
     if mbeds is None:
         logger.critical('This platform is not supported! Pull requests welcome at github.com/ARMmbed/mbed-ls')
@@ -18,21 +18,52 @@ limitations under the License.
 """Functions that manage a platform database"""
 
 import datetime
+import hashlib
 import json
+import pickle
 import re
+import sys
+import threading
 from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
 from copy import copy
 from io import open
-from os import makedirs
-from os.path import join, dirname, getmtime
+from os import makedirs, stat, remove, rename, chmod, umask
+from os.path import join, dirname, getmtime, abspath
 from appdirs import user_data_dir
 from fasteners import InterProcessLock
+from tempfile import mkstemp
+
+from .cache import _now
 
 try:
     unicode
 except NameError:
     unicode = str
 
+try:
+    from types import MappingProxyType
+except ImportError:
+    class MappingProxyType(dict):
+        """Python 2 stand-in for a read-only view of a dict"""
+
+        def _read_only(self, *args, **kwargs):
+            raise TypeError("Platform records are read-only")
+
+        __setitem__ = __delitem__ = _read_only
+        clear = pop = popitem = setdefault = update = _read_only
+
+try:
+    from os import replace as _replace
+except ImportError:
+    # Python 2 only renames over an existing file atomically on POSIX
+    def _replace(src, dst):
+        try:
+            rename(src, dst)
+        except OSError:
+            remove(dst)
+            rename(src, dst)
+
 
 import logging
 logger = logging.getLogger("mbedls.platform_database")
@@ -42,6 +73,20 @@ del logging
 LOCAL_PLATFORM_DATABASE = join(user_data_dir("mbedls"), "platforms.json")
 LOCAL_MOCKS_DATABASE = join(user_data_dir("mbedls"), "mock.json")
 
+
+def local_platform_cache(database_files):
+    """! The cache file, in the user data directory, of a set of databases
+    @details Each set of database files has its own cache, so processes
+      that use different mock files don't invalidate each other's cache
+    """
+    paths = "\n".join(abspath(path) for path in database_files)
+    digest = hashlib.sha1(paths.encode("utf-8")).hexdigest()[:16]
+    return join(user_data_dir("mbedls"), "platforms-%s.pickle" % digest)
+
+
+# Entry of a database file that holds data about the file itself
+META_KEY = "__meta__"
+
 DEFAULT_PLATFORM_DB = {
     u'daplink': {
         u'0001': u'LPC2368',
@@ -319,6 +364,37 @@ def _older_than_me(path):
     return _get_modified_time(path) < _get_modified_time(__file__)
 
 
+def _stamp(paths):
+    """! What a cache of the databases in 'paths' is valid for
+    @return List of the Python major version and the path, modification time
+      and size of this module and of each database file
+    @details This module stands in for the package version, as it holds
+      DEFAULT_PLATFORM_DB and the loading code
+    """
+    stamp = [sys.version_info[0]]
+    for path in [__file__] + list(paths):
+        try:
+            st = stat(path)
+            stamp.append((abspath(path), st.st_mtime, st.st_size))
+        except OSError:
+            stamp.append((abspath(path), None, None))
+    return stamp
+
+
+def _file_stamp(path):
+    """! What changes whenever a database file is written
+    @return The inode, modification time and size of the file, or None when
+      it is missing
+    @details Writes replace the file, so the inode changes even when the
+      time and size don't
+    """
+    try:
+        st = stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime, st.st_size)
+
+
 def _modify_data_format(data, verbose_data, simple_data_key='platform_name'):
     if isinstance(data, dict):
         if verbose_data:
@@ -334,28 +410,116 @@ def _modify_data_format(data, verbose_data, simple_data_key='platform_name'):
         return data
 
 
+def _record(data, simple_data_key='platform_name'):
+    """! The read-only verbose record of a database entry"""
+    return MappingProxyType(dict(_modify_data_format(data, True,
+                                                     simple_data_key)))
+
+
+def _read_db(db):
+    """! Load a database file
+    @return Tuple of the database, without its META_KEY entry, and the
+      number of times the file has been written
+    @details Raises IOError or ValueError when the file can't be used
+    """
+    if db is LOCAL_PLATFORM_DATABASE and _older_than_me(db):
+        raise ValueError("Platform Database is out of date")
+    with open(db, encoding="utf-8") as db_in:
+        data = json.load(db_in)
+    meta = data.pop(META_KEY, None) or {}
+    return data, meta.get("generation", 0)
+
+
+def _by_device_type(data):
+    """! A database in the format keyed by device type
+    @details Old databases only map ids to the names of daplink platforms
+    """
+    if data and not isinstance(next(iter(data.values())), dict):
+        return {'daplink': data}
+    return data
+
+
+def _file_mode(path):
+    """! The permissions to give a database file that replaces 'path'
+    @details Those of 'path', or those a new file gets from the umask
+    """
+    try:
+        return stat(path).st_mode & 0o7777
+    except OSError:
+        mask = umask(0)
+        umask(mask)
+        return 0o666 & ~mask
+
+
+def _replace_file(path, content):
+    """! Write a file through a temporary file that then replaces it
+    @param content Bytes to write
+    @details Readers see either the old or the new file, never a part of
+      one. Raises IOError or OSError when the file can't be written
+    """
+    fd, temp_path = mkstemp(dir=dirname(path) or ".",
+                            prefix=".platforms-", suffix=".tmp")
+    try:
+        with open(fd, "wb") as out:
+            out.write(content)
+        # mkstemp makes files only their owner can read
+        chmod(temp_path, _file_mode(path))
+        _replace(temp_path, path)
+    except (IOError, OSError):
+        try:
+            remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _replace_db(db, data, generation):
+    """! Write a database file, to be called with its lock held
+    @param generation The number of times the file has been written,
+      counting this write
+    @return False if the file could not be written
+    @details Readers don't need the lock, see '_replace_file'
+    """
+    content = dict(data)
+    content[META_KEY] = {"generation": generation}
+    try:
+        _replace_file(db, unicode(json.dumps(content)).encode("utf-8"))
+        return True
+    except (IOError, OSError) as exc:
+        logger.error("Could not write database %s: %s", db, exc)
+        return False
+
+
 def _overwrite_or_open(db):
+    """! Load a database file, recreating the local platform database when
+    it can't be used
+    @return The same as '_read_db'
+    """
     try:
-        if db is LOCAL_PLATFORM_DATABASE and _older_than_me(db):
-            raise ValueError("Platform Database is out of date")
-        with open(db, encoding="utf-8") as db_in:
-            return json.load(db_in)
+        return _read_db(db)
     except (IOError, ValueError) as exc:
         if db is LOCAL_PLATFORM_DATABASE:
-            logger.warning(
-                "Error loading database %s: %s; Recreating", db, str(exc))
             try:
                 makedirs(dirname(db))
             except OSError:
                 pass
-            try:
-                with open(db, "w", encoding="utf-8") as out:
-                    out.write(unicode(json.dumps(DEFAULT_PLATFORM_DB)))
-            except IOError:
-                pass
-            return copy(DEFAULT_PLATFORM_DB)
+            lock = InterProcessLock("%s.lock" % db)
+            if lock.acquire(blocking=True, timeout=60):
+                try:
+                    # Another process may have recreated it while we waited
+                    try:
+                        return _read_db(db)
+                    except (IOError, ValueError):
+                        pass
+                    logger.warning(
+                        "Error loading database %s: %s; Recreating", db, str(exc))
+                    if _replace_db(db, DEFAULT_PLATFORM_DB, 1):
+                        return copy(DEFAULT_PLATFORM_DB), 1
+                finally:
+                    lock.release()
+            return copy(DEFAULT_PLATFORM_DB), 0
         else:
-            return {}
+            return {}, 0
 
 
 class PlatformDatabase(object):
@@ -365,58 +529,295 @@ class PlatformDatabase(object):
 
     target_id_pattern = re.compile(r'^[a-fA-F0-9]{4}$')
 
-    def __init__(self, database_files, primary_database=None):
-        """Construct a PlatformDatabase object from a series of platform database files"""
+    def __init__(self, database_files, primary_database=None, cache_file=None,
+                 reload_interval=None):
+        """Construct a PlatformDatabase object from a series of platform database files
+        @param cache_file When set, keep the loaded databases in this file
+          and load them from it, with a single read, for as long as none of
+          the database files changes
+        @param reload_interval When set, lookups check at most every this
+          many seconds whether the database files changed on disk, and read
+          the changed files again
+        """
         self._prim_db = primary_database
         if not self._prim_db and len(database_files) == 1:
             self._prim_db = database_files[0]
-        self._dbs = OrderedDict()
-        self._keys = defaultdict(set)
+        self._database_files = list(database_files)
+        self._reload_interval = reload_interval
+        self._checked = _now()
+        self._reload_lock = threading.Lock()
+        self._file_stamps = {db: _file_stamp(db) for db in database_files}
+        self._batch_depth = 0
+        self._batch_dirty = False
+        # Changes to the primary database that were not written yet, as
+        # (device type, id or None for all, data or None when removed)
+        self._changes = []
+        self._cache_file = cache_file
+        stamp = _stamp(database_files) if cache_file else None
+        if not (cache_file and self._load_cache(stamp)):
+            self._dbs, self._keys, self._generations = self._load(
+                database_files)
+            self._index = self._merge(self._dbs)
+            # Files changed while they were being read are not cached
+            if cache_file and stamp == _stamp(database_files):
+                self._save_cache(stamp)
+
+    def _load(self, database_files, loaded=None):
+        """! Read the database files
+        @param loaded Dict of the databases, and their generations, of the
+          files that are not to be read again
+        @return Tuple of the databases, by file, the ids of each device type
+          and the generations of the files
+        """
+        dbs = OrderedDict()
+        keys = defaultdict(set)
+        generations = {}
         for db in database_files:
-            new_db = _overwrite_or_open(db)
-            first_value = None
-            if new_db.values():
-                first_value = next(iter(new_db.values()))
-                if not isinstance(first_value, dict):
-                    new_db = {
-                        'daplink': new_db
-                    }
+            if loaded and db in loaded:
+                new_db, generations[db] = loaded[db]
+            else:
+                new_db, generations[db] = _overwrite_or_open(db)
+            new_db = _by_device_type(new_db)
 
             if new_db:
                 for device_type in new_db:
-                    duplicates = self._keys[device_type].intersection(set(new_db[device_type].keys()))
+                    duplicates = keys[device_type].intersection(set(new_db[device_type].keys()))
                     duplicates = set(["%s.%s" % (device_type, k) for k in duplicates])
                     if duplicates:
                         logger.warning(
                             "Duplicate platform ids found: %s,"
                             " ignoring the definitions from %s",
                             " ".join(duplicates), db)
-                    self._dbs[db] = new_db
-                    self._keys[device_type] = self._keys[device_type].union(new_db[device_type].keys())
+                    dbs[db] = new_db
+                    keys[device_type] = keys[device_type].union(new_db[device_type].keys())
             else:
-                self._dbs[db] = new_db
+                dbs[db] = new_db
+        return dbs, keys, generations
 
+    def _load_cache(self, stamp):
+        """! Load the databases from the cache file
+        @return False when the cache is missing, unreadable or out of date
+        """
+        try:
+            with open(self._cache_file, "rb") as cache_in:
+                cached = pickle.load(cache_in)
+            if cached['stamp'] != stamp:
+                logger.debug("Platform cache %s is out of date",
+                             self._cache_file)
+                return False
+            self._dbs = OrderedDict(cached['dbs'])
+            self._keys = defaultdict(set, cached['keys'])
+            self._generations = cached['generations']
+            self._index = {
+                device_type: {id: MappingProxyType(record)
+                              for id, record in records.items()}
+                for device_type, records in cached['index'].items()}
+            return True
+        except Exception as exc:
+            logger.debug("Could not load platform cache %s: %s",
+                         self._cache_file, exc)
+            return False
+
+    def _save_cache(self, stamp):
+        """! Write the databases to the cache file, unless another process
+        is already doing so
+        """
+        try:
+            makedirs(dirname(self._cache_file))
+        except OSError:
+            pass
+        lock = InterProcessLock("%s.lock" % self._cache_file)
+        if not lock.acquire(blocking=False):
+            return
+        try:
+            cached = {
+                'stamp': stamp,
+                'dbs': list(self._dbs.items()),
+                'keys': dict(self._keys),
+                'generations': self._generations,
+                'index': {
+                    device_type: {id: dict(record)
+                                  for id, record in records.items()}
+                    for device_type, records in self._index.items()}}
+            _replace_file(self._cache_file, pickle.dumps(cached, 2))
+        except (IOError, OSError) as exc:
+            logger.debug("Could not save platform cache %s: %s",
+                         self._cache_file, exc)
+        finally:
+            lock.release()
+
+    @staticmethod
+    def _merge(dbs, device_types=None):
+        """! Merge databases into one verbose record per id
+        @param dbs Ordered dict of the databases
+        @param device_types Only merge these device types; None merges all
+        @return Dict of the records of each device type, by id
+        @details The first database with a non-empty entry for an id wins, as
+          it always has
+        """
+        if device_types is None:
+            device_types = set(t for db in dbs.values() for t in db)
+        index = {}
+        for device_type in device_types:
+            records = {}
+            for db in reversed(list(dbs.values())):
+                for id, data in db.get(device_type, {}).items():
+                    if data:
+                        records[id] = _record(data)
+            index[device_type] = records
+        return index
+
+    def _reindex(self, id, device_type):
+        """! Bring the merged record of a single id up to date"""
+        index = self._index.setdefault(device_type, {})
+        index.pop(id, None)
+        for db in self._dbs.values():
+            data = db.get(device_type, {}).get(id)
+            if data:
+                index[id] = _record(data)
+                return
+
+    def _maybe_reload(self):
+        """! Read the database files that changed on disk again, if
+        'reload_interval' seconds passed since they were last checked
+        @details Changes that were not made permanent are lost for the files
+          that are read again
+        """
+        if not self._reload_interval or self._batch_depth:
+            return
+        # Lookups made while another thread reloads use the current data
+        if not self._reload_lock.acquire(False):
+            return
+        try:
+            now = _now()
+            if now - self._checked < self._reload_interval:
+                return
+            self._checked = now
+            stamps = {db: _file_stamp(db) for db in self._database_files}
+            changed = [db for db in self._database_files
+                       if stamps[db] != self._file_stamps.get(db)]
+            if not changed:
+                return
+            logger.debug("Reloading changed databases %s", ", ".join(changed))
+            dbs, keys, generations = self._load(
+                self._database_files,
+                {db: (data, self._generations.get(db, 0))
+                 for db, data in self._dbs.items() if db not in changed})
+            # Lookups see either the old databases or the new ones
+            self._dbs, self._keys, self._index = dbs, keys, self._merge(dbs)
+            self._generations = generations
+            self._file_stamps = stamps
+            if self._prim_db in changed:
+                self._changes = []
+        finally:
+            self._reload_lock.release()
 
     def items(self, device_type='daplink'):
+        self._maybe_reload()
         for db in self._dbs.values():
             for entry in db.get(device_type, {}).items():
                 yield entry
 
     def all_ids(self, device_type='daplink'):
+        self._maybe_reload()
         return iter(self._keys[device_type])
 
     def get(self, index, default=None, device_type='daplink', verbose_data=False):
         """Standard lookup function. Works exactly like a dict. If 'verbose_data'
         is True, all data for the platform is returned as a dict."""
-        for db in self._dbs.values():
-            if device_type in db:
-                maybe_answer = db[device_type].get(index, None)
-                if maybe_answer:
-                    return _modify_data_format(maybe_answer, verbose_data)
+        self._maybe_reload()
+        record = self._index.get(device_type, {}).get(index)
+        if record is None:
+            return default
+        return dict(record) if verbose_data else record['platform_name']
+
+    def get_many(self, ids, device_type='daplink'):
+        """Look up several platforms at once
+        @param ids Iterable of platform ids
+        @return List of the read-only verbose records of the platforms, in the
+          order of 'ids', with None for unknown ids
+        @details The records are shared by all the lookups of a platform;
+          copy one with dict() to change it
+        """
+        self._maybe_reload()
+        index = self._index.get(device_type, {})
+        return [index.get(id) for id in ids]
+
+    @contextmanager
+    def batch(self):
+        """Write the permanent changes made in the 'with' block to the
+        primary database once, when the outermost block exits
+
+        Ex. with plat_db.batch():
+                plat_db.add('0240', 'K64F', permanent=True)
+                plat_db.remove('0200', permanent=True)
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth and self._batch_dirty:
+                self._batch_dirty = False
+                self._update_db()
 
-        return default
+    def add_many(self, platforms, permanent=False, device_type='daplink'):
+        """Add several platforms, with a single write of the origin database
+        @param platforms Dict, or iterable of (id, platform_name) pairs
+        """
+        if isinstance(platforms, dict):
+            platforms = platforms.items()
+        with self.batch():
+            for id, platform_name in platforms:
+                self.add(id, platform_name, permanent, device_type)
+
+    def remove_many(self, ids, permanent=False, device_type='daplink',
+                    verbose_data=False):
+        """Remove several platforms, with a single write of the origin
+        database
+        @return List of what 'remove' returns for each id
+        """
+        with self.batch():
+            return [self.remove(id, permanent, device_type, verbose_data)
+                    for id in ids]
+
+    def _merge_written(self):
+        """! Apply the changes of this object to what other processes wrote
+        to the primary database since it was read, to be called with its
+        lock held
+        @return The generation of the primary database on disk
+        """
+        if _file_stamp(self._prim_db) == self._file_stamps.get(self._prim_db):
+            # Not written since this object read or wrote it
+            return self._generations.get(self._prim_db, 0)
+        try:
+            data, generation = _read_db(self._prim_db)
+        except (IOError, ValueError):
+            return self._generations.get(self._prim_db, 0)
+        if generation == self._generations.get(self._prim_db, 0):
+            return generation
+        logger.debug("Merging changes into %s, written by another process",
+                     self._prim_db)
+        data = _by_device_type(data)
+        for device_type, id, platform in self._changes:
+            if id is None:
+                data[device_type] = {}
+            elif platform is None:
+                data.get(device_type, {}).pop(id, None)
+            else:
+                data.setdefault(device_type, {})[id] = platform
+        loaded = {db: (db_data, self._generations.get(db, 0))
+                  for db, db_data in self._dbs.items()}
+        loaded[self._prim_db] = (data, generation)
+        dbs, keys, generations = self._load(self._database_files, loaded)
+        self._dbs, self._keys, self._index = dbs, keys, self._merge(dbs)
+        self._generations = generations
+        return generation
 
     def _update_db(self):
+        if self._batch_depth:
+            self._batch_dirty = True
+            return True
         if self._prim_db:
             lock = InterProcessLock("%s.lock" % self._prim_db)
             acquired = lock.acquire(blocking=False)
@@ -425,10 +826,16 @@ class PlatformDatabase(object):
                 acquired = lock.acquire(blocking=True, timeout=60)
             if acquired:
                 try:
-                    with open(self._prim_db, "w", encoding="utf-8") as out:
-                        out.write(unicode(
-                            json.dumps(self._dbs[self._prim_db])))
-                    return True
+                    generation = self._merge_written() + 1
+                    written = _replace_db(self._prim_db,
+                                          self._dbs[self._prim_db], generation)
+                    if written:
+                        self._generations[self._prim_db] = generation
+                        self._changes = []
+                        # Not a change to reload
+                        self._file_stamps[self._prim_db] = _file_stamp(
+                            self._prim_db)
+                    return written
                 finally:
                     lock.release()
             else:
@@ -449,12 +856,14 @@ class PlatformDatabase(object):
                 if device_type not in self._dbs[self._prim_db]:
                     self._dbs[self._prim_db][device_type] = {}
                 self._dbs[self._prim_db][device_type][id] = platform_name
+                self._changes.append((device_type, id, platform_name))
             else:
                 cur_db = next(iter(self._dbs.values()))
                 if device_type not in cur_db:
                     cur_db[device_type] = {}
                 cur_db[device_type][id] = platform_name
             self._keys[device_type].add(id)
+            self._reindex(id, device_type)
             if permanent:
                 self._update_db()
         else:
@@ -468,12 +877,18 @@ class PlatformDatabase(object):
         logger.debug("Trying remove of %s", id)
         if id is '*' and device_type in self._dbs[self._prim_db]:
             self._dbs[self._prim_db][device_type] = {}
+            self._changes.append((device_type, None, None))
+            self._index[device_type] = self._merge(
+                self._dbs, [device_type])[device_type]
         for db in self._dbs.values():
             if device_type in db and id in db[device_type]:
                 logger.debug("Removing id...")
                 removed = db[device_type][id]
                 del db[device_type][id]
+                if db is self._dbs.get(self._prim_db):
+                    self._changes.append((device_type, id, None))
                 self._keys[device_type].remove(id)
+                self._reindex(id, device_type)
                 if permanent:
                     self._update_db()
 
@@ -0,0 +1,214 @@
+"""
+mbed SDK
+Copyright (c) 2018 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""Run file system reads in helper processes that may be abandoned
+
+An 'open()' or 'listdir()' on the mount point of a wedged board can block in
+uninterruptible sleep. Doing those reads in a helper process bounds how long
+the caller waits; a helper that misses its deadline is killed, and reaped in
+the background once it exits, and replaced by a new one on the next request.
+"""
+
+import errno
+import pickle
+import struct
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty
+
+import logging
+logger = logging.getLogger("mbedls.probe_helpers")
+logger.addHandler(logging.NullHandler())
+del logging
+
+# Runs in the helper; self contained so that it works no matter how
+# mbed_lstools was imported in the parent
+HELPER_SOURCE = r'''
+import io, os, pickle, struct, sys
+stdin = getattr(sys.stdin, 'buffer', sys.stdin)
+stdout = getattr(sys.stdout, 'buffer', sys.stdout)
+while True:
+    header = stdin.read(4)
+    if len(header) < 4:
+        break
+    op, path = pickle.loads(stdin.read(struct.unpack('!I', header)[0]))
+    try:
+        if op == 'listdir':
+            result = (True, os.listdir(path))
+        elif op == 'isdir':
+            result = (True, os.path.isdir(path))
+        elif op == 'stat':
+            st = os.stat(path)
+            result = (True, (st.st_dev, st.st_mtime, st.st_size))
+        else:
+            with io.open(path, 'r') as f:
+                result = (True, f.readlines())
+    except EnvironmentError as e:
+        result = (False, (e.errno, e.strerror, e.filename))
+    data = pickle.dumps(result, 2)
+    stdout.write(struct.pack('!I', len(data)) + data)
+    stdout.flush()
+'''
+
+
+class ProbeTimeout(IOError):
+    """ A helper did not answer before the deadline """
+
+
+def _read_exactly(stream, size):
+    data = b''
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            raise EOFError()
+        data += chunk
+    return data
+
+
+class _Helper(object):
+    """ One helper process and the thread that collects its answers """
+
+    def __init__(self):
+        self._proc = subprocess.Popen([sys.executable, '-c', HELPER_SOURCE],
+                                      stdin=subprocess.PIPE,
+                                      stdout=subprocess.PIPE)
+        self._answers = Queue()
+        reader = threading.Thread(target=self._read_answers)
+        reader.daemon = True
+        reader.start()
+
+    def _read_answers(self):
+        try:
+            while True:
+                size, = struct.unpack('!I', _read_exactly(self._proc.stdout, 4))
+                self._answers.put(
+                    pickle.loads(_read_exactly(self._proc.stdout, size)))
+        except (EOFError, IOError, OSError, ValueError):
+            self._answers.put(None)
+
+    def call(self, op, path, timeout):
+        data = pickle.dumps((op, path), 2)
+        self._proc.stdin.write(struct.pack('!I', len(data)) + data)
+        self._proc.stdin.flush()
+        try:
+            answer = self._answers.get(timeout=max(timeout, 0))
+        except Empty:
+            raise ProbeTimeout(errno.ETIMEDOUT,
+                               "Timed out after %.1f seconds" % timeout, path)
+        if answer is None:
+            raise IOError("Probe helper exited", path)
+        return answer
+
+    def abandon(self):
+        """! Kill the helper without waiting for it to exit
+        @details A helper stuck in uninterruptible sleep only dies once its
+          read returns, so it is reaped by a thread of its own
+        """
+        try:
+            self._proc.kill()
+        except OSError:
+            pass
+        reaper = threading.Thread(target=self._reap)
+        reaper.daemon = True
+        reaper.start()
+
+    def _reap(self):
+        self._proc.wait()
+        for stream in [self._proc.stdin, self._proc.stdout]:
+            try:
+                stream.close()
+            except (IOError, OSError):
+                pass
+
+    def close(self):
+        """! Let an idle helper exit, and reap it"""
+        try:
+            self._proc.stdin.close()
+        except (IOError, OSError):
+            pass
+        self._reap()
+
+
+class ProbeHelperPool(object):
+    """ A small pool of helper processes that run 'listdir', 'isdir', 'stat'
+    and 'readlines' with a deadline
+    """
+
+    def __init__(self, size=1, timeout=5.0):
+        """! ctor
+        @param size Maximum number of helpers answering requests at once
+        @param timeout Seconds allowed for all the reads of one device
+        """
+        self.timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(size)
+        self._local = threading.local()
+
+    @contextmanager
+    def deadline(self):
+        """! Share one deadline between all the requests made by this thread
+        inside the 'with' block
+        """
+        if getattr(self._local, 'deadline', None) is not None:
+            yield
+            return
+        self._local.deadline = time.time() + self.timeout
+        try:
+            yield
+        finally:
+            self._local.deadline = None
+
+    def call(self, op, path):
+        """! Run a read in a helper
+        @param op 'listdir', 'isdir', 'stat' or 'readlines'
+        @param path Path to read
+        @return Result of the read
+        @details Raises ProbeTimeout when the deadline passes and the same
+          OSError or IOError as the read would raise in this process
+        """
+        deadline = getattr(self._local, 'deadline', None) or \
+            time.time() + self.timeout
+        with self._slots:
+            with self._lock:
+                helper = self._idle.pop() if self._idle else None
+            if helper is None:
+                helper = _Helper()
+            try:
+                ok, value = helper.call(op, path, deadline - time.time())
+            except (IOError, OSError):
+                logger.warning("Abandoning probe helper stuck on %s", path)
+                helper.abandon()
+                raise
+            with self._lock:
+                self._idle.append(helper)
+        if not ok:
+            raise OSError(*value)
+        return value
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for helper in idle:
+            helper.close()
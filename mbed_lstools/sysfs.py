@@ -0,0 +1,111 @@
+"""
+mbed SDK
+Copyright (c) 2018 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""Enumerate USB devices and their disk and tty children through sysfs"""
+
+import os
+import re
+from io import open
+from os.path import join, realpath
+
+import logging
+logger = logging.getLogger("mbedls.sysfs")
+logger.addHandler(logging.NullHandler())
+del logging
+
+# USB devices are named <bus>-<port>[.<port>...]; their interfaces add
+# ':<config>.<interface>'
+usb_device_name = re.compile(r'^\d+-[\d.]+$')
+
+
+def _read_attr(path, name):
+    try:
+        with open(join(path, name), 'r', encoding='utf-8') as attr:
+            return attr.read().strip()
+    except (IOError, OSError):
+        return None
+
+
+def _children(device_path):
+    """! Find the block and tty devices of one USB device
+    @param device_path sysfs directory of the USB device
+    @return Tuple of two lists: block device names and tty names
+    @details Walks the interfaces of the device, without descending into
+      the USB devices plugged into it when it is a hub
+    """
+    disks = []
+    ttys = []
+    for dirpath, dirnames, _ in os.walk(device_path):
+        kind = os.path.basename(dirpath)
+        if kind == 'block':
+            disks.extend(sorted(dirnames))
+            del dirnames[:]
+        elif kind == 'tty':
+            ttys.extend(sorted(dirnames))
+            del dirnames[:]
+        else:
+            dirnames[:] = [d for d in dirnames if not usb_device_name.match(d)]
+    return disks, ttys
+
+
+def usb_devices(sysfs_root='/sys'):
+    """! List the USB devices that have a serial number
+    @param sysfs_root Where sysfs is mounted
+    @return List of dicts with the keys 'serial', 'vendor_id', 'product_id',
+      'disks' and 'ttys'
+    """
+    devices_dir = join(sysfs_root, 'bus', 'usb', 'devices')
+    try:
+        names = os.listdir(devices_dir)
+    except OSError as e:
+        logger.error("Could not list USB devices in %s: %s", devices_dir, e)
+        return []
+
+    result = []
+    for name in sorted(names):
+        if not usb_device_name.match(name):
+            continue
+        path = realpath(join(devices_dir, name))
+        serial = _read_attr(path, 'serial')
+        if not serial:
+            continue
+        disks, ttys = _children(path)
+        result.append({
+            'serial': serial,
+            'vendor_id': _read_attr(path, 'idVendor'),
+            'product_id': _read_attr(path, 'idProduct'),
+            'disks': disks,
+            'ttys': ttys
+        })
+    logger.debug("Found USB devices %r", result)
+    return result
+
+
+def usb_ids(sysfs_root='/sys'):
+    """! Build USBID maps for the disks and serial ports of all USB devices
+    @param sysfs_root Where sysfs is mounted
+    @return Tuple of two dicts: USBID -> disk device file in /dev and
+      USBID -> serial device file in /dev
+    """
+    disk_ids = {}
+    serial_ids = {}
+    for device in usb_devices(sysfs_root):
+        if device['disks']:
+            disk_ids[device['serial']] = join('/dev', device['disks'][0])
+        if device['ttys']:
+            serial_ids[device['serial']] = join('/dev', device['ttys'][0])
+    return disk_ids, serial_ids
@@ -0,0 +1,196 @@
+"""
+mbed SDK
+Copyright (c) 2018 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""Keep a table of USB disks and serial ports up to date from Linux uevents"""
+
+import errno
+import socket
+import struct
+
+import logging
+logger = logging.getLogger("mbedls.uevent")
+logger.addHandler(logging.NullHandler())
+del logging
+
+NETLINK_KOBJECT_UEVENT = 15
+KERNEL_GROUP = 1
+UDEV_GROUP = 2
+
+UDEV_MESSAGE_PREFIX = b'libudev\0'
+UDEV_MESSAGE_MAGIC = 0xfeedcafe
+
+# Pseudo event reported when events were lost and all tables must be rebuilt
+RESYNC = {'ACTION': 'resync'}
+
+
+def parse_uevent(data):
+    """! Parse a uevent netlink message, as sent by either the kernel or udev
+    @param data Raw message bytes
+    @return Dict of the event properties, or None if the message is malformed
+    @details Kernel messages look like 'add@/devices/...\\0KEY=value\\0...'.
+      udev messages start with a binary header that holds the offset of the
+      same 'KEY=value\\0' properties
+    """
+    if data.startswith(UDEV_MESSAGE_PREFIX):
+        if len(data) < 24:
+            return None
+        magic, = struct.unpack_from('!I', data, 8)
+        if magic != UDEV_MESSAGE_MAGIC:
+            return None
+        _, offset, length = struct.unpack_from('=III', data, 12)
+        properties = data[offset:offset + length].split(b'\0')
+    else:
+        properties = data.split(b'\0')[1:]
+
+    event = {}
+    for prop in properties:
+        key, sep, value = prop.decode('utf-8', 'replace').partition('=')
+        if sep:
+            event[key] = value
+    return event if 'ACTION' in event else None
+
+
+class NetlinkUeventSource(object):
+    """ Reads uevents from a NETLINK_KOBJECT_UEVENT socket without blocking
+    """
+
+    def __init__(self, groups=UDEV_GROUP):
+        """! ctor
+        @param groups Netlink multicast groups to join. The udev group is the
+          default as its events are sent once the /dev/.../by-id links exist
+        """
+        self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW,
+                                   NETLINK_KOBJECT_UEVENT)
+        self._sock.bind((0, groups))
+        self._sock.setblocking(False)
+
+    def fileno(self):
+        return self._sock.fileno()
+
+    def read_events(self):
+        """! Drain all pending events from the socket
+        @return List of event dicts, oldest first
+        """
+        events = []
+        while True:
+            try:
+                data = self._sock.recv(65536)
+            except socket.error as e:
+                if e.errno == errno.ENOBUFS:
+                    logger.warning("uevent socket overrun, rescanning devices")
+                    events.append(RESYNC)
+                    continue
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return events
+                raise
+            event = parse_uevent(data)
+            if event:
+                events.append(event)
+
+    def close(self):
+        self._sock.close()
+
+
+class RecordedUeventSource(object):
+    """ Replays a recorded uevent stream; used for testing and benchmarking
+    """
+
+    def __init__(self, events=()):
+        """! ctor
+        @param events Event dicts or raw netlink messages to replay
+        """
+        self._pending = []
+        for event in events:
+            self.push(event)
+
+    def push(self, event):
+        """! Queue an event dict or a raw netlink message"""
+        if isinstance(event, bytes):
+            event = parse_uevent(event)
+        if event:
+            self._pending.append(event)
+
+    def read_events(self):
+        events, self._pending = self._pending, []
+        return events
+
+    def close(self):
+        pass
+
+
+class UeventDeviceTable(object):
+    """ Maps USB IDs to disk and serial device files, maintained incrementally
+    from uevents instead of re-enumerating /dev/<type>/by-id on every lookup
+    """
+
+    SUBSYSTEMS = {'block': 'disk', 'tty': 'serial'}
+
+    def __init__(self, source, rescan, link_usb_id):
+        """! ctor
+        @param source Event source with a 'read_events' method
+        @param rescan Function that enumerates a device type from scratch,
+          returning a dict: USBID -> device file in /dev
+        @param link_usb_id Function that returns the USBID of a by-id link,
+          or None if the link does not belong to a USB device
+        """
+        self._source = source
+        self._rescan = rescan
+        self._link_usb_id = link_usb_id
+        self._ids = {}
+        self._stale = set(self.SUBSYSTEMS.values())
+
+    def ids(self, device_type):
+        """! Get the current USBID -> device file map for a device type
+        @param device_type 'disk' or 'serial'
+        """
+        for event in self._source.read_events():
+            self._apply(event)
+        if device_type in self._stale:
+            self._ids[device_type] = dict(self._rescan(device_type))
+            self._stale.discard(device_type)
+        return self._ids[device_type]
+
+    def _apply(self, event):
+        if event is RESYNC:
+            self._stale.update(self.SUBSYSTEMS.values())
+            return
+        device_type = self.SUBSYSTEMS.get(event.get('SUBSYSTEM'))
+        if not device_type or device_type in self._stale:
+            return
+        ids = self._ids[device_type]
+        devname = event.get('DEVNAME')
+        if not devname:
+            return
+        if not devname.startswith('/'):
+            devname = '/dev/' + devname
+
+        if event['ACTION'] == 'remove':
+            for usb_id in [k for k, v in ids.items() if v == devname]:
+                logger.debug("uevent: %s %s removed", device_type, usb_id)
+                del ids[usb_id]
+        elif 'DEVLINKS' in event or 'USEC_INITIALIZED' in event:
+            # Sent by udev, after it created any by-id links
+            by_id = '/dev/%s/by-id/' % device_type
+            for link in event.get('DEVLINKS', '').split():
+                usb_id = link.startswith(by_id) and self._link_usb_id(link)
+                if usb_id:
+                    logger.debug("uevent: %s %s -> %s", device_type, usb_id,
+                                 devname)
+                    ids[usb_id] = devname
+        else:
+            # Kernel events carry no by-id links; enumerate on the next lookup
+            self._stale.add(device_type)
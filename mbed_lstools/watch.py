@@ -0,0 +1,205 @@
+"""
+mbed SDK
+Copyright (c) 2018 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""Track changes to directories (inotify) and the mount table (poll) on Linux"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+from os.path import dirname, exists
+
+import logging
+logger = logging.getLogger("mbedls.watch")
+logger.addHandler(logging.NullHandler())
+del logging
+
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+DIRECTORY_EVENTS = (IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO |
+                    IN_ATTRIB | IN_DELETE_SELF | IN_MOVE_SELF)
+# Events that mean the watch is gone and has to be added again
+WATCH_LOST = IN_DELETE_SELF | IN_MOVE_SELF
+
+_event_header = struct.Struct('iIII')
+
+
+class Inotify(object):
+    """ Minimal non-blocking inotify binding
+    """
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                           use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._rm_watch = libc.inotify_rm_watch
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def add_watch(self, path, mask):
+        """! Watch a path
+        @return Watch descriptor
+        """
+        wd = self._add_watch(self.fd, path.encode('utf-8'), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def rm_watch(self, wd):
+        self._rm_watch(self.fd, wd)
+
+    def read_events(self):
+        """! Read all pending events
+        @return List of (watch descriptor, mask) tuples
+        """
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return events
+                raise
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _event_header.unpack_from(data, offset)
+                events.append((wd, mask))
+                offset += _event_header.size + length
+
+    def close(self):
+        os.close(self.fd)
+
+
+class ChangeWatcher(object):
+    """ Remembers which inputs changed since they were last read
+
+    Directories are watched with inotify and the mount table with poll(),
+    which the kernel signals with POLLPRI whenever a mount is added or
+    removed. Inputs that can't be watched are always reported as changed.
+    """
+
+    def __init__(self):
+        self._inotify = Inotify()
+        self._poll = select.poll()
+        self._poll.register(self._inotify.fd, select.POLLIN)
+        self._dirs = {}          # name -> directory to watch
+        self._watches = {}       # name -> (watch descriptor, watched path)
+        self._mountinfo = {}     # file descriptor -> (name, open file)
+        self._changed = set()
+        self._unwatched = set()
+
+    def watch_directory(self, name, path):
+        """! Report 'name' as changed whenever entries of 'path' change
+        @details When 'path' does not exist yet, its closest existing parent
+          is watched until it appears
+        """
+        self._dirs[name] = path
+        self._changed.add(name)
+        self._add_directory_watch(name)
+
+    def watch_mountinfo(self, name, path='/proc/self/mountinfo'):
+        """! Report 'name' as changed whenever the mount table changes"""
+        self._changed.add(name)
+        try:
+            mountinfo = open(path, 'rb')
+        except (IOError, OSError) as e:
+            logger.debug("Can't watch %s: %s", path, e)
+            self._unwatched.add(name)
+            return
+        self._mountinfo[mountinfo.fileno()] = (name, mountinfo)
+        self._poll.register(mountinfo, select.POLLPRI | select.POLLERR)
+
+    def _add_directory_watch(self, name):
+        path = self._dirs[name]
+        while path != dirname(path) and not exists(path):
+            path = dirname(path)
+        try:
+            wd = self._inotify.add_watch(path, DIRECTORY_EVENTS)
+        except OSError as e:
+            logger.debug("Can't watch %s: %s", path, e)
+            self._watches.pop(name, None)
+            self._unwatched.add(name)
+            return
+        old_wd, _ = self._watches.get(name, (wd, None))
+        self._watches[name] = (wd, path)
+        self._unwatched.discard(name)
+        if old_wd != wd and all(w != old_wd for w, _ in self._watches.values()):
+            self._inotify.rm_watch(old_wd)
+        if path != self._dirs[name]:
+            logger.debug("Watching %s until %s exists", path, self._dirs[name])
+
+    def _update(self, timeout=0):
+        """! Collect pending notifications
+        @param timeout Milliseconds to wait for a notification, None to block
+        """
+        for fd, _ in self._poll.poll(timeout):
+            if fd in self._mountinfo:
+                self._changed.add(self._mountinfo[fd][0])
+                continue
+            for wd, mask in self._inotify.read_events():
+                if mask & IN_Q_OVERFLOW:
+                    self._changed.update(self._dirs)
+                    continue
+                for name, (name_wd, path) in list(self._watches.items()):
+                    if name_wd != wd:
+                        continue
+                    self._changed.add(name)
+                    # Follow the directory when it is (re)created or removed
+                    if mask & WATCH_LOST or path != self._dirs[name]:
+                        self._add_directory_watch(name)
+
+    def changed(self, name):
+        """! Check, and forget, whether an input changed since the last call
+        @return True when the input has to be read again
+        """
+        if name in self._unwatched:
+            return True
+        self._update()
+        if name in self._changed:
+            self._changed.discard(name)
+            return True
+        return False
+
+    def wait(self, timeout=None):
+        """! Block until any watched input changes
+        @param timeout Seconds to wait, None to wait forever
+        @return True if something changed, False on timeout
+        @details Inputs that can't be watched never wake this up
+        """
+        if self._changed:
+            return True
+        self._update(None if timeout is None else int(timeout * 1000))
+        return bool(self._changed)
+
+    def close(self):
+        self._inotify.close()
+        for _, mountinfo in self._mountinfo.values():
+            mountinfo.close()
@@ -399,3 +399,8 @@ class MbedLsToolsWin7(MbedLsToolsBase):
                           path, stderr.strip())
 
         return result
+
+    def _mount_point_ready_command(self, path):
+        """! The 'dir' check of 'mount_point_ready' for 'mount_point_ready_async'
+        """
+        return ['cmd', '/c', 'dir', path]
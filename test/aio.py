@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+'''
+mbed SDK
+Copyright (c) 2018 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the 'License');
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an 'AS IS' BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import unittest
+import sys
+import time
+from copy import deepcopy
+from mock import MagicMock, patch
+
+from mbed_lstools.lstools_base import MbedLsToolsBase
+from mbed_lstools.linux import MbedLsToolsLinuxGeneric
+
+
+class DummyLsTools(MbedLsToolsBase):
+    return_value = []
+    def find_candidates(self):
+        return self.return_value
+
+
+def _update_from_fs(device, read_details_txt):
+    # Finish in reverse order
+    time.sleep(0.02 * (6 - int(device['mount_point'][-1])))
+    device['device_type'] = 'daplink'
+
+
+@unittest.skipUnless(sys.version_info >= (3, 6), 'needs Python 3.6')
+class AsyncListTestCase(unittest.TestCase):
+
+    def setUp(self):
+        import asyncio
+        self.loop = asyncio.new_event_loop()
+        self.base = DummyLsTools()
+        self.devices = [{'mount_point': 'mount_point_%d' % i,
+                         'target_id_usb_id': u'0240DEADBEE%d' % i,
+                         'serial_port': 'serial_port_%d' % i} for i in range(6)]
+
+    def tearDown(self):
+        self.loop.close()
+
+    def _drain(self, agen):
+        result = []
+        while True:
+            try:
+                result.append(self.loop.run_until_complete(agen.__anext__()))
+            except StopAsyncIteration:
+                return result
+
+    def test_list_mbeds_async(self):
+        with patch("mbed_lstools.lstools_base.MbedLsToolsBase._update_device_from_fs") as _up_fs,\
+             patch("mbed_lstools.lstools_base.MbedLsToolsBase.mount_point_ready") as _mpr:
+            _mpr.side_effect = lambda path: path != 'mount_point_3'
+            _up_fs.side_effect = _update_from_fs
+            self.base.return_value = deepcopy(self.devices)
+            expected = self.base.list_mbeds(unique_names=True)
+            self.base.return_value = deepcopy(self.devices)
+            result = self.loop.run_until_complete(
+                self.base.list_mbeds_async(unique_names=True))
+        self.assertEqual(result, expected)
+        self.assertEqual(len(result), 5)
+
+    def test_iter_mbeds_async(self):
+        with patch("mbed_lstools.lstools_base.MbedLsToolsBase._update_device_from_fs") as _up_fs,\
+             patch("mbed_lstools.lstools_base.MbedLsToolsBase.mount_point_ready") as _mpr:
+            _mpr.return_value = True
+            _up_fs.side_effect = _update_from_fs
+            self.base.return_value = deepcopy(self.devices)
+            result = self._drain(self.base.iter_mbeds_async(unique_names=True))
+        self.assertEqual(sorted(d['mount_point'] for d in result),
+                         ['mount_point_%d' % i for i in range(6)])
+        self.assertNotEqual(result[0]['mount_point'], 'mount_point_0')
+        self.assertEqual(result[-1]['mount_point'], 'mount_point_0')
+        self.assertEqual([d['platform_name_unique'] for d in result],
+                         ['K64F[%d]' % i for i in range(6)])
+
+    def test_max_concurrency(self):
+        with patch("mbed_lstools.lstools_base.MbedLsToolsBase._update_device_from_fs") as _up_fs,\
+             patch("mbed_lstools.lstools_base.MbedLsToolsBase.mount_point_ready") as _mpr:
+            _mpr.return_value = True
+            _up_fs.side_effect = _update_from_fs
+            self.base.return_value = deepcopy(self.devices)
+            result = self._drain(self.base.iter_mbeds_async(max_concurrency=1))
+        self.assertEqual([d['mount_point'] for d in result],
+                         ['mount_point_%d' % i for i in range(6)])
+
+    def test_candidate_commands(self):
+        outputs = []
+        def from_output(output):
+            outputs.extend(output)
+            return deepcopy(self.devices[:1])
+        with patch.object(self.base, '_candidate_commands') as _commands,\
+             patch.object(self.base, '_candidates_from_output') as _from_output,\
+             patch.object(self.base, 'find_candidates') as _find:
+            _commands.return_value = [
+                [sys.executable, '-c', 'print("out")'],
+                [sys.executable, '-c', 'import sys; sys.exit(3)']]
+            _from_output.side_effect = from_output
+            candidates = self.loop.run_until_complete(
+                self.base.find_candidates_async())
+            _find.assert_not_called()
+        self.assertEqual(candidates, self.devices[:1])
+        self.assertEqual(outputs[0][0].strip(), b'out')
+        self.assertEqual(outputs[0][2], 0)
+        self.assertEqual(outputs[1][2], 3)
+
+    def test_mount_point_ready_command(self):
+        with patch.object(self.base, '_mount_point_ready_command') as _command:
+            _command.return_value = [sys.executable, '-c', 'import sys; sys.exit(1)']
+            self.assertFalse(self.loop.run_until_complete(
+                self.base.mount_point_ready_async('mount_point_0')))
+            _command.return_value = [sys.executable, '-c', '']
+            self.assertTrue(self.loop.run_until_complete(
+                self.base.mount_point_ready_async('mount_point_0')))
+
+    def test_linux_mount_fallback(self):
+        linux = MbedLsToolsLinuxGeneric()
+        linux.MOUNTINFO_FILE_NAME = '/nonexistent/mountinfo'
+        future = self.loop.create_future()
+        future.set_result((b'/dev/sdb on /media/usb0 type vfat (rw,noexec)\n'
+                           b'/dev/sda1 on / type ext4 (rw)\n', b'', 0))
+        _run = MagicMock(return_value=future)
+        with patch.object(linux, '_run_cli_process_async', _run),\
+             patch.object(linux, '_dev_by_id') as _dev_by_id:
+            _dev_by_id.side_effect = lambda device_type: {
+                'disk': {'0240DEADBEEF': '/dev/sdb'},
+                'serial': {'0240DEADBEEF': '/dev/ttyACM0'}}[device_type]
+            candidates = self.loop.run_until_complete(
+                linux.find_candidates_async())
+            _run.assert_called_once_with(['mount'])
+        self.assertEqual(candidates, [{'mount_point': '/media/usb0',
+                                       'serial_port': '/dev/ttyACM0',
+                                       'target_id_usb_id': '0240DEADBEEF'}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -28,6 +28,7 @@ from copy import deepcopy
 from six import StringIO
 
 import mbed_lstools.main as cli
+from mbed_lstools.filters import Filter
 
 
 try:
@@ -45,6 +46,8 @@ class CLIComands(unittest.TestCase):
         self.stdout = self._stdout.start()
         self.mbeds = MagicMock()
         self.args = MagicMock()
+        self.args.fields = None
+        self.args.filter = None
         self.mbeds.list_mbeds.return_value = [
             {'platform_name': 'foo', 'platform_name_unique': 'foo[0]',
              'mount_point': 'a mount point', 'serial_port': 'a serial port',
@@ -97,6 +100,46 @@ class CLIComands(unittest.TestCase):
         for name in json.loads(self.stdout.getvalue()).keys():
             self.assertIn(name, platform_names)
 
+    def test_print_table_fields(self):
+        self.args.fields = 'serial_port,platform_name'
+        self.mbeds.list_mbeds.return_value = [
+            {'serial_port': 'a serial port', 'platform_name': 'foo'}]
+        cli.print_table(self.mbeds, self.args)
+        self.mbeds.list_mbeds.assert_called_once_with(
+            unique_names=True, read_details_txt=True, filter_function=None,
+            fields=['serial_port', 'platform_name'])
+        self.assertIn('a serial port', self.stdout.getvalue())
+        self.assertNotIn('mount_point', self.stdout.getvalue())
+
+    def test_json_by_target_id_fields(self):
+        self.args.fields = 'serial_port'
+        self.mbeds.list_mbeds.return_value = [
+            {'serial_port': 'a serial port', 'target_id': 'DEADBEEF'}]
+        cli.json_by_target_id(self.mbeds, self.args)
+        self.mbeds.list_mbeds.assert_called_once_with(
+            unique_names=True, read_details_txt=True, filter_function=None,
+            fields=['serial_port', 'target_id'])
+        self.assertEqual(json.loads(self.stdout.getvalue()),
+                         {'DEADBEEF': {'serial_port': 'a serial port'}})
+
+    def test_mbeds_as_json_filter(self):
+        self.args.filter = Filter(platform_name='foo')
+        cli.mbeds_as_json(self.mbeds, self.args)
+        self.mbeds.list_mbeds.assert_called_once_with(
+            unique_names=True, read_details_txt=True,
+            filter_function=Filter(platform_name='foo'), fields=None)
+
+    def test_mock_platform(self):
+        self.args.mock = '0240:K64F,-0200,+0300:KL25Z'
+        batch = self.mbeds.mock_batch.return_value
+        batch.__exit__.side_effect = lambda *args: self.assertEqual(
+            self.mbeds.mock_manufacture_id.call_count, 3)
+        cli.mock_platform(self.mbeds, self.args)
+        self.mbeds.mock_manufacture_id.assert_any_call('0240', 'K64F', oper='+')
+        self.mbeds.mock_manufacture_id.assert_any_call('0200', 'dummy', oper='-')
+        self.mbeds.mock_manufacture_id.assert_any_call('0300', 'KL25Z', oper='+')
+        batch.__exit__.assert_called_once()
+
     def test_list_platform(self):
         self.mbeds.list_manufacture_ids.return_value ="""
         foo
@@ -119,6 +162,25 @@ class CLIParser(unittest.TestCase):
         args = cli.parse_cli([])
         assert callable(args.command)
 
+    def test_parse_cli_fields(self):
+        args = cli.parse_cli(['-j', '--fields', 'platform_name,serial_port'])
+        self.assertEqual(cli._fields(args), ['platform_name', 'serial_port'])
+        self.assertEqual(cli._fields(cli.parse_cli([])), None)
+
+    def test_parse_cli_filter(self):
+        args = cli.parse_cli(['--filter', 'platform_name=K64F',
+                              '--filter', 'target_id__startswith=0240'])
+        self.assertEqual(args.filter, Filter(platform_name='K64F',
+                                             target_id__startswith='0240'))
+        self.assertEqual(cli.parse_cli([]).filter, None)
+        with patch('sys.stderr', new_callable=StringIO):
+            with self.assertRaises(SystemExit):
+                cli.parse_cli(['--filter', 'platform_name__like=K'])
+
+    def test_parse_cli_shared_cache(self):
+        self.assertTrue(cli.parse_cli([]).shared_cache)
+        self.assertFalse(cli.parse_cli(['--no-shared-cache']).shared_cache)
+
     def test_parse_cli_conflict(self):
         try:
             args = cli.parse_cli(["-j", "-J"])
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+'''
+mbed SDK
+Copyright (c) 2018 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the 'License');
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an 'AS IS' BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import unittest
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from mock import patch
+
+from mbed_lstools.lstools_base import MbedLsToolsBase
+from mbed_lstools.cache import DetailsCache, DeviceIndex, SingleFlight, \
+    SharedScanCache
+
+USB_ID = u'0240000032044e4500257009997b00386781000097969900'
+
+MBED_HTM = ('<!-- mbed Microcontroller Website and Authentication Shortcut -->\n'
+            '<html><head><meta http-equiv="refresh" content="0; '
+            'url=http://mbed.org/device/?code=%s"/>'
+            '</head></html>\n') % USB_ID
+
+DETAILS_TXT = ('# DAPLink Firmware - see https://mbed.com/daplink\n'
+               'Unique ID: %s\n'
+               'Interface Version: 0244\n'
+               'Local Mods: 0\n') % USB_ID
+
+
+class DummyLsTools(MbedLsToolsBase):
+    return_value = []
+    def find_candidates(self):
+        return self.return_value
+
+
+class DetailsCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'mbedls', 'details.json')
+        self.mount_point = os.path.join(self.root, 'DAPLINK')
+        os.mkdir(self.mount_point)
+        self._write('mbed.htm', MBED_HTM)
+        self._write('DETAILS.TXT', DETAILS_TXT)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _write(self, name, contents):
+        with open(os.path.join(self.mount_point, name), 'w') as f:
+            f.write(contents)
+
+    def _list(self):
+        base = DummyLsTools(details_cache=self.path)
+        base.return_value = [{'mount_point': self.mount_point,
+                              'target_id_usb_id': USB_ID,
+                              'serial_port': 'serial_port'}]
+        return base.list_mbeds(read_details_txt=True)
+
+    def test_hit_skips_board_files(self):
+        expected = self._list()
+        self.assertEqual(expected[0]['daplink_version'], '0244')
+        self.assertEqual(expected[0]['target_id_mbed_htm'], USB_ID)
+        with patch('mbed_lstools.lstools_base.MbedLsToolsBase._readlines') as _readlines:
+            self.assertEqual(self._list(), expected)
+            _readlines.assert_not_called()
+
+    def test_changed_file_is_read(self):
+        self._list()
+        self._write('DETAILS.TXT', DETAILS_TXT.replace('0244', '0250 beta'))
+        with patch('mbed_lstools.lstools_base.MbedLsToolsBase._readlines',
+                   side_effect=MbedLsToolsBase._readlines,
+                   autospec=True) as _readlines:
+            result = self._list()
+            _readlines.assert_called_once_with(
+                _readlines.call_args[0][0],
+                os.path.join(self.mount_point, 'DETAILS.TXT'))
+        self.assertEqual(result[0]['daplink_version'], '0250 beta')
+
+    def test_new_boot_is_read(self):
+        self._list()
+        with patch('mbed_lstools.cache.boot_id') as _boot_id,\
+             patch('mbed_lstools.lstools_base.MbedLsToolsBase._readlines',
+                   side_effect=MbedLsToolsBase._readlines,
+                   autospec=True) as _readlines:
+            _boot_id.return_value = 'another boot'
+            self._list()
+            self.assertEqual(_readlines.call_count, 2)
+
+    def test_eviction(self):
+        cache = DetailsCache(self.path, max_age_days=1)
+        cache.store('old', 'mbed.htm', [1], 'value')
+        cache.store('new', 'mbed.htm', [1], 'value')
+        cache._entries['old']['seen'] = time.time() - 2 * 24 * 60 * 60
+        self.assertTrue(cache.save())
+        with open(self.path) as f:
+            self.assertEqual(list(json.load(f)), ['new'])
+        self.assertEqual(DetailsCache(self.path).lookup('new', 'mbed.htm', [1]),
+                         'value')
+        self.assertEqual(DetailsCache(self.path).lookup('new', 'mbed.htm', [2]),
+                         None)
+
+    def test_save_merges(self):
+        first = DetailsCache(self.path)
+        second = DetailsCache(self.path)
+        first.store('first', 'mbed.htm', [1], 'value')
+        second.store('second', 'mbed.htm', [1], 'value')
+        first.save()
+        second.save()
+        with open(self.path) as f:
+            self.assertEqual(sorted(json.load(f)), ['first', 'second'])
+
+
+class DeviceIndexTestCase(unittest.TestCase):
+
+    def test_put_get_discard(self):
+        index = DeviceIndex()
+        candidate = {'target_id_usb_id': USB_ID, 'mount_point': 'D:',
+                     'serial_port': 'COM1'}
+        device = dict(candidate, target_id=USB_ID,
+                      platform_name_unique='K64F[0]')
+        index.put('key', candidate, device)
+        device['serial_port'] = 'changed'
+
+        found_candidate, found = index.get('key', 'serial_port', 'COM1')
+        self.assertEqual(found_candidate, candidate)
+        self.assertEqual(found, {'target_id_usb_id': USB_ID, 'target_id': USB_ID,
+                                 'mount_point': 'D:', 'serial_port': 'COM1'})
+        self.assertEqual(index.get('key', 'target_id', USB_ID)[1], found)
+        self.assertEqual(index.get('other', 'target_id', USB_ID), (None, None))
+
+        index.put('key', dict(candidate, mount_point='E:'),
+                  dict(found, mount_point='E:'))
+        self.assertEqual(index.get('key', 'mount_point', 'D:'), (None, None))
+        self.assertEqual(index.get('key', 'mount_point', 'E:')[1]['mount_point'],
+                         'E:')
+        index.discard('key', USB_ID)
+        self.assertEqual(index.get('key', 'serial_port', 'COM1'), (None, None))
+
+
+class SharedScanCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'mbedls', 'scans.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_reuse_and_expiry(self):
+        cache = SharedScanCache(self.path, ttl=2)
+        other = SharedScanCache(self.path, ttl=2)
+        with patch('time.time') as _time:
+            _time.return_value = 1000
+            self.assertEqual(cache.get_or_scan('a', lambda: [{'n': 1}]),
+                             [{'n': 1}])
+            _time.return_value = 1001.9
+            self.assertEqual(other.get_or_scan('a', lambda: [{'n': 2}]),
+                             [{'n': 1}])
+            self.assertEqual(other.get_or_scan('b', lambda: [{'n': 3}]),
+                             [{'n': 3}])
+            _time.return_value = 1002
+            self.assertEqual(other.get_or_scan('a', lambda: [{'n': 4}]),
+                             [{'n': 4}])
+            cache.invalidate()
+            self.assertEqual(cache.get_or_scan('b', lambda: [{'n': 5}]),
+                             [{'n': 5}])
+
+    def test_waits_for_other_process(self):
+        marker = os.path.join(self.root, 'scanning')
+        script = (
+            "import os, time\n"
+            "from mbed_lstools.cache import SharedScanCache\n"
+            "def scan():\n"
+            "    open(%r, 'w').close()\n"
+            "    time.sleep(0.5)\n"
+            "    return [{'scanned_by': 'child'}]\n"
+            "SharedScanCache(%r).get_or_scan('key', scan)\n"
+            % (marker, self.path))
+        child = subprocess.Popen([sys.executable, '-c', script])
+        try:
+            for _ in range(1000):
+                if os.path.exists(marker) or child.poll() is not None:
+                    break
+                time.sleep(0.01)
+            self.assertTrue(os.path.exists(marker))
+            result = SharedScanCache(self.path, ttl=60).get_or_scan(
+                'key', lambda: [{'scanned_by': 'parent'}])
+            self.assertEqual(result, [{'scanned_by': 'child'}])
+        finally:
+            child.wait()
+
+
+class SingleFlightTestCase(unittest.TestCase):
+
+    def test_waiters_share_the_result(self):
+        flights = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(10)
+            return [{'n': len(calls)}]
+
+        results = []
+        threads = [threading.Thread(
+            target=lambda: results.append(flights.do('key', compute)))
+            for _ in range(3)]
+        threads[0].start()
+        started.wait(10)
+        for thread in threads[1:]:
+            thread.start()
+        while flights.shared < 2:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual(calls, [1])
+        self.assertEqual(results, [[{'n': 1}]] * 3)
+        self.assertEqual(len(set(id(r) for r in results)), 3)
+        self.assertEqual(flights.do('key', lambda: 'again'), 'again')
+
+    def test_error_is_raised(self):
+        flights = SingleFlight()
+        with self.assertRaises(ValueError):
+            flights.do('key', lambda: int('x'))
+        self.assertEqual(flights.do('key', lambda: 1), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+'''
+mbed SDK
+Copyright (c) 2018 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the 'License');
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an 'AS IS' BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import unittest
+import json
+import pickle
+import threading
+import time
+from copy import deepcopy
+from mock import MagicMock
+
+from mbed_lstools.device import MbedDevice
+
+
+class MbedDeviceTestCase(unittest.TestCase):
+
+    def test_dict_compatible(self):
+        device = MbedDevice({'mount_point': '/media/DAPLINK', 'foo': 1},
+                            serial_port='/dev/ttyACM0')
+        self.assertEqual(device, {'mount_point': '/media/DAPLINK', 'foo': 1,
+                                  'serial_port': '/dev/ttyACM0'})
+        self.assertEqual(device.get('platform_name'), None)
+        self.assertNotIn('platform_name', device)
+        device['platform_name'] = 'K64F'
+        del device['foo']
+        self.assertEqual(sorted(device), ['mount_point', 'platform_name',
+                                          'serial_port'])
+        self.assertEqual(len(device), 3)
+        with self.assertRaises(KeyError):
+            device['foo']
+        with self.assertRaises(AttributeError):
+            device.bar = 1
+
+    def test_deferred_stages(self):
+        device = MbedDevice(mount_point='/media/DAPLINK')
+        fs = MagicMock(side_effect=lambda d: d.update(platform_name='K64F',
+                                                      daplink_version='0241'))
+        details = MagicMock(side_effect=lambda d: d.update(daplink_version='0244'))
+        device.defer(lambda key: key != 'mount_point', fs)
+        device.defer(lambda key: key.startswith('daplink_'), details)
+        self.assertTrue(device.pending)
+
+        self.assertEqual(device['mount_point'], '/media/DAPLINK')
+        fs.assert_not_called()
+        self.assertEqual(device['platform_name'], 'K64F')
+        self.assertEqual(fs.call_count, 1)
+        details.assert_not_called()
+        self.assertEqual(device['daplink_version'], '0244')
+        self.assertEqual(details.call_count, 1)
+        self.assertFalse(device.pending)
+
+        self.assertEqual(device['daplink_version'], '0244')
+        self.assertEqual(fs.call_count, 1)
+        self.assertEqual(details.call_count, 1)
+
+    def test_writes_kept(self):
+        device = MbedDevice(mount_point='/media/DAPLINK')
+        fs = MagicMock(side_effect=lambda d: d.update(platform_name='K64F',
+                                                      target_id='0240'))
+        device.defer(lambda key: key != 'mount_point', fs)
+        device['mount_point'] = '/media/OTHER'
+        fs.assert_not_called()
+        device['platform_name'] = 'MINE'
+        self.assertEqual(fs.call_count, 1)
+        device.update(target_id='1234')
+        self.assertEqual(device, {'mount_point': '/media/OTHER',
+                                  'platform_name': 'MINE',
+                                  'target_id': '1234'})
+
+    def test_copies_resolve(self):
+        device = MbedDevice(mount_point='/media/DAPLINK')
+        device.defer(lambda key: True, lambda d: d.update(platform_name='K64F'))
+        for copied in [deepcopy(device), pickle.loads(pickle.dumps(device))]:
+            self.assertIsInstance(copied, MbedDevice)
+            self.assertFalse(copied.pending)
+            self.assertEqual(copied, {'mount_point': '/media/DAPLINK',
+                                      'platform_name': 'K64F'})
+
+    def test_plain_dict_users(self):
+        device = MbedDevice(mount_point='/media/DAPLINK')
+        device.defer(lambda key: True, lambda d: d.update(platform_name='K64F'))
+        self.assertIsInstance(device, dict)
+        self.assertEqual(json.loads(json.dumps(device)),
+                         {'mount_point': '/media/DAPLINK',
+                          'platform_name': 'K64F'})
+        self.assertFalse(device.pending)
+        plain = device.to_dict()
+        self.assertIs(type(plain), dict)
+        self.assertEqual(plain, device)
+
+    def test_concurrent_reads(self):
+        device = MbedDevice(mount_point='/media/DAPLINK')
+
+        def slow_stage(record):
+            time.sleep(0.05)
+            record['platform_name'] = 'K64F'
+        stage = MagicMock(side_effect=slow_stage)
+        device.defer(lambda key: key == 'platform_name', stage)
+        seen = []
+        threads = [threading.Thread(
+            target=lambda: seen.append(device.get('platform_name')))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(seen, ['K64F'] * 4)
+        self.assertEqual(stage.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
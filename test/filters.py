@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+'''
+mbed SDK
+Copyright (c) 2018 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the 'License');
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an 'AS IS' BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import unittest
+
+from mbed_lstools.filters import Filter
+
+
+class FilterTestCase(unittest.TestCase):
+
+    device = {'platform_name': 'K64F', 'target_id': '0240000032044e45',
+              'serial_port': '/dev/ttyACM0', 'daplink_version': None}
+
+    def test_operators(self):
+        self.assertTrue(Filter()(self.device))
+        self.assertTrue(Filter(platform_name='K64F')(self.device))
+        self.assertFalse(Filter(platform_name='KL25Z')(self.device))
+        self.assertTrue(Filter(platform_name__ne='KL25Z')(self.device))
+        self.assertTrue(Filter(target_id__startswith='0240',
+                               target_id__endswith='4e45')(self.device))
+        self.assertFalse(Filter(target_id__startswith='0240',
+                                platform_name='KL25Z')(self.device))
+        self.assertTrue(Filter(serial_port__contains='ACM')(self.device))
+        self.assertTrue(Filter(platform_name__in=['K64F', 'K66F'])(self.device))
+        self.assertTrue(Filter(serial_port__regex=r'ACM\d$')(self.device))
+        self.assertFalse(Filter(daplink_version__startswith='02')(self.device))
+        self.assertFalse(Filter(url__contains='mbed')(self.device))
+        with self.assertRaises(ValueError):
+            Filter(platform_name__like='K')
+
+    def test_matches_known_fields(self):
+        flt = Filter(platform_name='K64F', target_id__startswith='0200')
+        self.assertTrue(flt.matches(self.device, ['platform_name']))
+        self.assertFalse(flt.matches(self.device))
+        self.assertFalse(flt.matches(self.device, ['target_id']))
+        self.assertEqual(flt.fields, frozenset(['platform_name', 'target_id']))
+
+    def test_parse(self):
+        flt = Filter.parse(['platform_name__in=K64F, K66F',
+                            'target_id__startswith=0240'])
+        self.assertEqual(flt, Filter(platform_name__in=('K64F', 'K66F'),
+                                     target_id__startswith='0240'))
+        self.assertEqual(hash(flt), hash(Filter.parse(
+            ['target_id__startswith=0240', 'platform_name__in=K64F,K66F'])))
+        self.assertEqual(repr(Filter.parse(['platform_name=K64F'])),
+                         "Filter(platform_name='K64F')")
+        with self.assertRaises(ValueError):
+            Filter.parse(['platform_name'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+'''
+mbed SDK
+Copyright (c) 2018 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the 'License');
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an 'AS IS' BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import unittest
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from mock import MagicMock
+
+from mbed_lstools.lease import BoardAllocator, LeaseTimeout
+
+
+class BoardAllocatorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.lock_dir = tempfile.mkdtemp()
+        self.mbeds = MagicMock()
+        self.mbeds.list_mbeds.return_value = [
+            {'platform_name': 'K64F', 'target_id': '0240000000000001'},
+            {'platform_name': 'KL25Z', 'target_id': '0200000000000001'},
+            {'platform_name': 'K64F', 'target_id': '0240000000000002'},
+        ]
+        self.allocator = BoardAllocator(self.mbeds, lock_dir=self.lock_dir,
+                                        poll_interval=0.01)
+
+    def tearDown(self):
+        shutil.rmtree(self.lock_dir)
+
+    def test_acquire_release(self):
+        lease = self.allocator.acquire(platform_name='K64F', count=2)
+        self.assertEqual(lease.target_ids, ['0240000000000001',
+                                            '0240000000000002'])
+        self.assertEqual(self.mbeds.list_mbeds.call_count, 1)
+
+        other = BoardAllocator(self.mbeds, lock_dir=self.lock_dir,
+                               poll_interval=0.01)
+        with self.assertRaises(LeaseTimeout):
+            other.acquire(platform_name='K64F', timeout=0.05)
+        with other.acquire(platform_name='KL25Z', timeout=0.05) as kl25z:
+            self.assertEqual(kl25z.target_ids, ['0200000000000001'])
+
+        lease.release()
+        lease = other.acquire(platform_name='K64F', timeout=0.05)
+        self.assertEqual(lease.target_ids, ['0240000000000001'])
+        lease.release()
+
+    def test_all_or_nothing(self):
+        with self.allocator.acquire(target_id='0240000000000002'):
+            with self.assertRaises(LeaseTimeout):
+                self.allocator.acquire(platform_name='K64F', count=2,
+                                       timeout=0.05)
+            self.assertGreater(self.mbeds.list_mbeds.call_count, 1)
+            # The first K64F was not kept while waiting for the second
+            with self.allocator.acquire(platform_name='K64F',
+                                        timeout=0.05) as lease:
+                self.assertEqual(lease.target_ids, ['0240000000000001'])
+
+    def test_other_process(self):
+        path = os.path.join(self.lock_dir, '0240000000000001.lock')
+        script = ("import sys\n"
+                  "from fasteners import InterProcessLock\n"
+                  "lock = InterProcessLock(%r)\n"
+                  "lock.acquire()\n"
+                  "print('locked')\n"
+                  "sys.stdout.flush()\n"
+                  "sys.stdin.read()\n" % path)
+        child = subprocess.Popen([sys.executable, '-c', script],
+                                 stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        try:
+            self.assertEqual(child.stdout.readline().strip(), b'locked')
+            with self.allocator.acquire(platform_name='K64F') as lease:
+                self.assertEqual(lease.target_ids, ['0240000000000002'])
+        finally:
+            child.stdin.close()
+            child.wait()
+            child.stdout.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
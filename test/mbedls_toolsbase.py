@@ -22,11 +22,16 @@ import errno
 import logging
 import re
 import json
+import time
+import threading
+import shutil
+import tempfile
 from io import StringIO
-from mock import patch, mock_open
+from mock import patch, mock_open, MagicMock
 from copy import deepcopy
 
 from mbed_lstools.lstools_base import MbedLsToolsBase, FSInteraction
+from mbed_lstools.filters import Filter
 
 class DummyLsTools(MbedLsToolsBase):
     return_value = []
@@ -229,6 +234,19 @@ class BasicTestCase(unittest.TestCase):
         self.assertEqual(None, self.base.plat_db.get("0342"))
         self.assertEqual(None, self.base.plat_db.get("0343"))
 
+    def test_mock_batch(self):
+        self.base._shared_cache = MagicMock()
+        with patch("mbed_lstools.platform_database._replace_db") as _replace_db:
+            _replace_db.return_value = True
+            with self.base.mock_batch():
+                self.base.mock_manufacture_id('0341', 'TEST_PLATFORM_NAME_1')
+                self.base.mock_manufacture_id('0342', 'TEST_PLATFORM_NAME_2')
+                self.base._shared_cache.invalidate.assert_not_called()
+                _replace_db.assert_not_called()
+            self.assertEqual(_replace_db.call_count, 1)
+        self.base._shared_cache.invalidate.assert_called_once_with()
+        self.assertEqual('TEST_PLATFORM_NAME_2', self.base.plat_db.get('0342'))
+
     def test_update_device_from_fs_mid_unmount(self):
         dummy_mount = 'dummy_mount'
         device = {
@@ -393,6 +411,394 @@ class BasicTestCase(unittest.TestCase):
             _read_htm.assert_not_called()
             _up_details.assert_not_called()
 
+    def test_fs_lazy(self):
+        device = {
+            'target_id_usb_id': '024075309420ABCE',
+            'mount_point': 'invalid_mount_point',
+            'serial_port': 'invalid_serial_port'
+        }
+        with patch("mbed_lstools.lstools_base.MbedLsToolsBase._read_htm_ids") as _read_htm,\
+             patch("mbed_lstools.lstools_base.MbedLsToolsBase._details_txt") as _up_details,\
+             patch("mbed_lstools.lstools_base.MbedLsToolsBase.mount_point_ready") as mount_point_ready,\
+             patch("mbed_lstools.lstools_base.MbedLsToolsBase._save_details_cache") as _save,\
+             patch('os.listdir') as _listdir:
+            new_device_id = "00017531642046"
+            _read_htm.return_value = (new_device_id, {})
+            _listdir.return_value = []
+            _up_details.return_value = {
+                'Automation allowed': '0'
+            }
+            mount_point_ready.return_value = True
+
+            self.base.return_value = [deepcopy(device)]
+            ret = self.base.list_mbeds(FSInteraction.Lazy, None, False, True)
+            self.assertEqual(len(ret), 1)
+            _save.reset_mock()
+            self.assertEqual(ret[0]['mount_point'], device['mount_point'])
+            self.assertEqual(ret[0]['serial_port'], device['serial_port'])
+            _listdir.assert_not_called()
+            _read_htm.assert_not_called()
+
+            self.assertEqual(ret[0]['target_id'], new_device_id)
+            self.assertEqual(ret[0]['platform_name'], 'LPC2368')
+            _read_htm.assert_called_once_with(device['mount_point'])
+            _up_details.assert_not_called()
+
+            self.assertEqual(ret[0]['daplink_automation_allowed'], '0')
+            _up_details.assert_called_once_with(device['mount_point'])
+            # The details cache is saved once, not after every record
+            _save.assert_not_called()
+            self.base.close()
+            _save.assert_called_once_with()
+
+            self.base.return_value = [deepcopy(device)]
+            eager = self.base.list_mbeds(FSInteraction.BeforeFilter, None,
+                                         False, True)
+            self.assertEqual(dict(ret[0]), eager[0])
+            self.assertEqual(_read_htm.call_count, 2)
+
+            _read_htm.reset_mock()
+            self.base.return_value = [deepcopy(device)]
+            filtered = self.base.list_mbeds(
+                FSInteraction.Lazy, lambda m: m['serial_port'] == 'other',
+                False, False)
+            self.assertEqual(filtered, [])
+            _read_htm.assert_not_called()
+
+    def test_fs_filter(self):
+        k64f = {'target_id_usb_id': '0240000032044e45',
+                'mount_point': 'k64f_mount_point',
+                'serial_port': 'k64f_serial_port'}
+        kl25z = {'target_id_usb_id': '0200000032044e45',
+                 'mount_point': 'kl25z_mount_point',
+                 'serial_port': 'kl25z_serial_port'}
+        with patch("mbed_lstools.lstools_base.MbedLsToolsBase._read_htm_ids") as _read_htm,\
+             patch("mbed_lstools.lstools_base.MbedLsToolsBase.mount_point_ready") as mount_point_ready,\
+             patch('os.listdir') as _listdir:
+            _read_htm.side_effect = lambda mount_point: (
+                {'k64f_mount_point': '0240000032044e4500257009997b0038',
+                 'kl25z_mount_point': '0200000032044e4500257009997b0039'}
+                [mount_point], {})
+            _listdir.return_value = []
+            mount_point_ready.return_value = True
+
+            self.base.return_value = [deepcopy(k64f), deepcopy(kl25z)]
+            ret = self.base.list_mbeds(filter_function=Filter(
+                serial_port__startswith='kl25z'))
+            self.assertEqual([m['platform_name'] for m in ret], ['KL25Z'])
+            mount_point_ready.assert_called_once_with('kl25z_mount_point')
+
+            mount_point_ready.reset_mock()
+            _read_htm.reset_mock()
+            _listdir.reset_mock()
+            self.base.return_value = [deepcopy(k64f), deepcopy(kl25z)]
+            ret = self.base.list_mbeds(
+                FSInteraction.AfterFilter,
+                Filter(platform_name='K64F', target_id__endswith='0038'))
+            self.assertEqual(len(ret), 1)
+            self.assertEqual(ret[0]['target_id'],
+                             '0240000032044e4500257009997b0038')
+            self.assertEqual(mount_point_ready.call_count, 2)
+            # The platform of the USB id rules the KL25Z out before the read
+            _read_htm.assert_called_once_with('k64f_mount_point')
+            self.assertEqual(_listdir.call_count, 1)
+
+            _read_htm.reset_mock()
+            self.base.return_value = [deepcopy(k64f), deepcopy(kl25z)]
+            ret = self.base.list_mbeds(FSInteraction.BeforeFilter,
+                                       Filter(platform_name='K64F'))
+            self.assertEqual([m['serial_port'] for m in ret],
+                             ['k64f_serial_port'])
+            # The platform may change once mbed.htm is read
+            self.assertEqual(_read_htm.call_count, 2)
+
+            _read_htm.reset_mock()
+            self.base.return_value = [deepcopy(k64f), deepcopy(kl25z)]
+            ret = self.base.list_mbeds(FSInteraction.Never,
+                                       Filter(platform_name='K64F'))
+            self.assertEqual([m['serial_port'] for m in ret],
+                             ['k64f_serial_port'])
+            _read_htm.assert_not_called()
+
+            self.base.return_value = [deepcopy(k64f), deepcopy(kl25z)]
+            ret = self.base.list_mbeds(FSInteraction.Lazy,
+                                       Filter(platform_name='KL25Z'))
+            self.assertEqual([m['serial_port'] for m in ret],
+                             ['kl25z_serial_port'])
+            self.assertEqual(_read_htm.call_count, 2)
+
+    def test_fs_filter_platform_from_htm(self):
+        # The USB id names a K64F, but mbed.htm tells that this is a KL25Z
+        device = {'target_id_usb_id': '0240000032044e45',
+                  'mount_point': 'mount_point',
+                  'serial_port': 'serial_port'}
+        with patch("mbed_lstools.lstools_base.MbedLsToolsBase._read_htm_ids") as _read_htm,\
+             patch("mbed_lstools.lstools_base.MbedLsToolsBase.mount_point_ready") as mount_point_ready,\
+             patch('os.listdir') as _listdir:
+            _read_htm.return_value = ('0200000032044e4500257009997b0039', {})
+            _listdir.return_value = []
+            mount_point_ready.return_value = True
+            for fs_interaction in [FSInteraction.BeforeFilter,
+                                   FSInteraction.AfterFilter,
+                                   FSInteraction.Lazy]:
+                for filter_function in [
+                        Filter(platform_name='KL25Z'),
+                        lambda m: m['platform_name'] == 'KL25Z']:
+                    self.base.return_value = [deepcopy(device)]
+                    ret = self.base.list_mbeds(fs_interaction, filter_function)
+                    # AfterFilter only knows the platform of the USB id
+                    self.assertEqual(
+                        [m['platform_name'] for m in ret],
+                        [] if fs_interaction == FSInteraction.AfterFilter
+                        else ['KL25Z'])
+
+    def test_find_by(self):
+        k64f = {'target_id_usb_id': '0240000032044e45',
+                'mount_point': 'k64f_mount_point',
+                'serial_port': 'k64f_serial_port'}
+        kl25z = {'target_id_usb_id': '0200000032044e45',
+                 'mount_point': 'kl25z_mount_point',
+                 'serial_port': 'kl25z_serial_port'}
+        with patch("mbed_lstools.lstools_base.MbedLsToolsBase._read_htm_ids") as _read_htm,\
+             patch("mbed_lstools.lstools_base.MbedLsToolsBase.mount_point_ready") as mount_point_ready,\
+             patch('os.listdir') as _listdir:
+            _read_htm.side_effect = lambda mount_point: (
+                {'k64f_mount_point': '0240000032044e45',
+                 'kl25z_mount_point': '0200000032044e4500257009997b0039'}
+                [mount_point], {})
+            _listdir.return_value = []
+            mount_point_ready.return_value = True
+            self.base.find_candidates = lambda: deepcopy([k64f, kl25z])
+
+            device = self.base.find_by_serial_port('kl25z_serial_port')
+            self.assertEqual(device['platform_name'], 'KL25Z')
+            _read_htm.assert_called_once_with('kl25z_mount_point')
+            device = self.base.find_by_mount_point('kl25z_mount_point')
+            self.assertEqual(device['serial_port'], 'kl25z_serial_port')
+            self.assertEqual(_read_htm.call_count, 1)
+
+            _read_htm.reset_mock()
+            device = self.base.find_by_target_id('0240000032044e45')
+            self.assertEqual(device['platform_name'], 'K64F')
+            _read_htm.assert_called_once_with('k64f_mount_point')
+
+            _read_htm.reset_mock()
+            self.assertEqual(self.base.find_by_mount_point('other'), None)
+            _read_htm.assert_not_called()
+
+            # The target ID in mbed.htm is not the USB id of this one
+            self.base.invalidate()
+            device = self.base.find_by_target_id(
+                '0200000032044e4500257009997b0039')
+            self.assertEqual(device['mount_point'], 'kl25z_mount_point')
+            self.assertEqual(_read_htm.call_count, 2)
+
+            _read_htm.reset_mock()
+            moved = dict(kl25z, serial_port='moved')
+            self.base.find_candidates = lambda: deepcopy([k64f, moved])
+            device = self.base.find_by_target_id(
+                '0200000032044e4500257009997b0039')
+            self.assertEqual(device['serial_port'], 'moved')
+            _read_htm.assert_called_once_with('kl25z_mount_point')
+
+            _read_htm.reset_mock()
+            self.base.invalidate()
+            self.base.list_mbeds(unique_names=True)
+            self.assertEqual(_read_htm.call_count, 2)
+            device = self.base.find_by_serial_port('k64f_serial_port')
+            self.assertEqual(_read_htm.call_count, 2)
+            self.assertNotIn('platform_name_unique', device)
+
+    def test_refresh(self):
+        base = DummyLsTools(cache_ttl=60)
+        k64f = {'target_id_usb_id': '0240000032044e45',
+                'mount_point': 'k64f_mount_point',
+                'serial_port': 'k64f_serial_port'}
+        kl25z = {'target_id_usb_id': '0200000032044e45',
+                 'mount_point': 'kl25z_mount_point',
+                 'serial_port': 'kl25z_serial_port'}
+        base.find_candidates = lambda: deepcopy([k64f, kl25z])
+        versions = {'k64f_mount_point': '0244', 'kl25z_mount_point': '0244'}
+        with patch("mbed_lstools.lstools_base.MbedLsToolsBase._read_htm_ids") as _read_htm,\
+             patch("mbed_lstools.lstools_base.MbedLsToolsBase.mount_point_ready") as mount_point_ready,\
+             patch('os.listdir') as _listdir:
+            _read_htm.side_effect = lambda mount_point: (
+                '0240000032044e45' if mount_point.startswith('k64f')
+                else '0200000032044e4500257009997b0039',
+                {'Version': versions[mount_point]})
+            _listdir.return_value = []
+            mount_point_ready.return_value = True
+
+            base.list_mbeds_changes()
+            base.list_mbeds()
+            self.assertEqual(_read_htm.call_count, 4)
+
+            _read_htm.reset_mock()
+            versions['kl25z_mount_point'] = '0250'
+            kl25z['mount_point'] = 'kl25z_remounted'
+            versions['kl25z_remounted'] = '0250'
+            device = base.refresh('0200000032044e4500257009997b0039')
+            self.assertEqual(device['daplink_version'], '0250')
+            self.assertEqual(device['mount_point'], 'kl25z_remounted')
+            _read_htm.assert_called_once_with('kl25z_remounted')
+            mount_point_ready.assert_called_with('kl25z_remounted')
+
+            # The change seen by refresh is still reported
+            _read_htm.reset_mock()
+            changes = base.list_mbeds_changes()
+            self.assertEqual((changes['added'], changes['removed']), ([], []))
+            self.assertEqual(len(changes['changed']), 1)
+            self.assertEqual(changes['changed'][0]['fields'],
+                             ['daplink_version', 'mount_point'])
+            self.assertEqual(
+                changes['changed'][0]['previous']['daplink_version'], '0244')
+            _read_htm.assert_called_once_with('kl25z_remounted')
+            _read_htm.reset_mock()
+            self.assertEqual(base.list_mbeds_changes(),
+                             {'added': [], 'removed': [], 'changed': []})
+            _read_htm.assert_not_called()
+            self.assertEqual(
+                base.find_by_mount_point('kl25z_remounted')['daplink_version'],
+                '0250')
+            _read_htm.assert_not_called()
+            ret = base.list_mbeds()
+            self.assertEqual(sorted(m['daplink_version'] for m in ret),
+                             ['0244', '0250'])
+            self.assertEqual(_read_htm.call_count, 2)
+
+            base.find_candidates = lambda: deepcopy([k64f])
+            self.assertEqual(base.refresh('0200000032044e4500257009997b0039'),
+                             None)
+            removed = base.list_mbeds_changes()['removed']
+            self.assertEqual([m['mount_point'] for m in removed],
+                             ['kl25z_remounted'])
+
+    def test_wait_for_device(self):
+        k64f = {'target_id_usb_id': '0240000032044e45',
+                'mount_point': 'k64f_mount_point',
+                'serial_port': 'k64f_serial_port'}
+        states = [[], [dict(k64f, mount_point=None)], [k64f]]
+        self.base.find_candidates = lambda: deepcopy(states[0])
+        with patch("mbed_lstools.lstools_base.MbedLsToolsBase._read_htm_ids") as _read_htm,\
+             patch("mbed_lstools.lstools_base.MbedLsToolsBase.mount_point_ready") as mount_point_ready,\
+             patch("mbed_lstools.lstools_base.MbedLsToolsBase._wait_for_change") as _wait,\
+             patch('os.listdir') as _listdir:
+            _read_htm.return_value = ('0240000032044e45', {})
+            _listdir.return_value = []
+            mount_point_ready.return_value = True
+            _wait.side_effect = lambda timeout: states.pop(0)
+
+            device = self.base.wait_for_device('0240000032044e45', mounted=False)
+            self.assertEqual(device['mount_point'], None)
+            self.assertEqual(device['platform_name'], 'K64F')
+            self.assertEqual(_wait.call_count, 1)
+            _read_htm.assert_not_called()
+
+            # Polling neither warns about the state waited for nor drops the
+            # results shared with other processes
+            self.base._shared_cache = MagicMock()
+            with patch("mbed_lstools.lstools_base.logger") as _logger:
+                device = self.base.wait_for_device('0240000032044e45',
+                                                   timeout=60)
+                _logger.warning.assert_not_called()
+            self.assertEqual(device['mount_point'], 'k64f_mount_point')
+            self.assertEqual(_wait.call_count, 2)
+            _read_htm.assert_called_once_with('k64f_mount_point')
+            self.assertEqual([c[0][0] for c in _wait.call_args_list],
+                             [self.base.WAIT_POLL_MIN] * 2)
+            self.base._shared_cache.invalidate.assert_called_once_with()
+
+    def test_wait_for_device_timeout(self):
+        self.base.return_value = []
+        self.base.WAIT_POLL_MIN = 0.01
+        start = time.time()
+        self.assertEqual(self.base.wait_for_device('0240000032044e45',
+                                                   timeout=0.1), None)
+        self.assertLess(time.time() - start, 5)
+
+    def test_wait_for_remount(self):
+        k64f = {'target_id_usb_id': '0240000032044e45',
+                'mount_point': 'k64f_mount_point',
+                'serial_port': 'k64f_serial_port'}
+        states = [[k64f], [k64f], [], [dict(k64f, mount_point='remounted')]]
+        self.base.find_candidates = lambda: deepcopy(states[0])
+        with patch("mbed_lstools.lstools_base.MbedLsToolsBase._read_htm_ids") as _read_htm,\
+             patch("mbed_lstools.lstools_base.MbedLsToolsBase.mount_point_ready") as mount_point_ready,\
+             patch("mbed_lstools.lstools_base.MbedLsToolsBase._wait_for_change") as _wait,\
+             patch('os.listdir') as _listdir:
+            _read_htm.return_value = ('0240000032044e45', {})
+            _listdir.return_value = []
+            mount_point_ready.return_value = True
+            _wait.side_effect = lambda timeout: states.pop(0)
+
+            device = self.base.wait_for_remount('0240000032044e45')
+            self.assertEqual(device['mount_point'], 'remounted')
+            self.assertEqual(_wait.call_count, 3)
+            _read_htm.assert_called_once_with('remounted')
+
+    def test_fs_filter_fields(self):
+        self.base.return_value = [{'target_id_usb_id': '024075309420ABCE',
+                                   'mount_point': 'invalid_mount_point',
+                                   'serial_port': 'invalid_serial_port'}]
+        with patch("mbed_lstools.lstools_base.MbedLsToolsBase._update_device_from_fs") as _up_fs,\
+             patch("mbed_lstools.lstools_base.MbedLsToolsBase.mount_point_ready") as mount_point_ready:
+            mount_point_ready.return_value = True
+            ret = self.base.list_mbeds(
+                filter_function=Filter(serial_port='invalid_serial_port'),
+                fields=['mount_point'])
+            _up_fs.assert_not_called()
+        self.assertEqual(ret, [{'mount_point': 'invalid_mount_point'}])
+
+    def test_list_mbeds_fields(self):
+        device = {
+            'target_id_usb_id': '024075309420ABCE',
+            'mount_point': 'invalid_mount_point',
+            'serial_port': 'invalid_serial_port'
+        }
+        with patch("mbed_lstools.lstools_base.MbedLsToolsBase._read_htm_ids") as _read_htm,\
+             patch("mbed_lstools.lstools_base.MbedLsToolsBase._details_txt") as _up_details,\
+             patch("mbed_lstools.lstools_base.MbedLsToolsBase.mount_point_ready") as mount_point_ready,\
+             patch('os.listdir') as _listdir:
+            _read_htm.return_value = ("00017531642046", {})
+            _listdir.return_value = []
+            _up_details.return_value = {'Version': '0244'}
+            mount_point_ready.return_value = True
+
+            self.base.return_value = [deepcopy(device)]
+            ret = self.base.list_mbeds(read_details_txt=True, unique_names=True,
+                                       fields=['serial_port', 'mount_point'])
+            self.assertEqual(ret, [{'serial_port': 'invalid_serial_port',
+                                    'mount_point': 'invalid_mount_point'}])
+            _read_htm.assert_not_called()
+            _up_details.assert_not_called()
+            mount_point_ready.assert_called_once_with('invalid_mount_point')
+
+            self.base.return_value = [deepcopy(device)]
+            ret = self.base.list_mbeds(read_details_txt=True, unique_names=True,
+                                       fields=['platform_name', 'target_id'])
+            self.assertEqual(ret, [{'platform_name': 'LPC2368',
+                                    'target_id': '00017531642046'}])
+            _read_htm.assert_called_once_with('invalid_mount_point')
+            _up_details.assert_not_called()
+
+            self.base.return_value = [deepcopy(device)]
+            ret = self.base.list_mbeds(read_details_txt=True, unique_names=True,
+                                       fields=['platform_name_unique',
+                                               'daplink_version'])
+            self.assertEqual(ret, [{'platform_name_unique': 'LPC2368[0]',
+                                    'daplink_version': '0244'}])
+            _up_details.assert_called_once_with('invalid_mount_point')
+
+    def test_list_mbeds_fields_unmounted(self):
+        self.base.list_unmounted = True
+        self.base.return_value = [{'target_id_usb_id': '024075309420ABCE',
+                                   'mount_point': 'invalid_mount_point',
+                                   'serial_port': 'invalid_serial_port'}]
+        with patch("mbed_lstools.lstools_base.MbedLsToolsBase.mount_point_ready") as mount_point_ready:
+            ret = self.base.list_mbeds(fields=['serial_port'])
+            mount_point_ready.assert_not_called()
+        self.assertEqual(ret, [{'serial_port': 'invalid_serial_port'}])
+
     def test_fs_before(self):
         device = {
             'target_id_usb_id': '024075309420ABCE',
@@ -467,6 +873,253 @@ class BasicTestCase(unittest.TestCase):
             self.assertEqual(ret_with_details, [])
             _read_htm.assert_called_with(device['mount_point'])
 
+    def test_list_mbeds_parallel(self):
+        devices = [{'mount_point': 'mount_point_%d' % i,
+                    'target_id_usb_id': u'0240DEADBEE%d' % i,
+                    'serial_port': 'serial_port_%d' % i} for i in range(6)]
+
+        def _update_from_fs(device, read_details_txt):
+            # Finish in reverse order
+            time.sleep(0.01 * (6 - int(device['mount_point'][-1])))
+            device['device_type'] = 'daplink'
+
+        with patch("mbed_lstools.lstools_base.MbedLsToolsBase._update_device_from_fs") as _up_fs,\
+             patch("mbed_lstools.lstools_base.MbedLsToolsBase.mount_point_ready") as _mpr:
+            _mpr.return_value = True
+            _up_fs.side_effect = _update_from_fs
+            self.base.return_value = deepcopy(devices)
+            serial = self.base.list_mbeds(unique_names=True)
+            self.base.max_workers = 4
+            self.base.return_value = deepcopy(devices)
+            parallel = self.base.list_mbeds(unique_names=True)
+        self.assertEqual(serial, parallel)
+        self.assertEqual([d['platform_name_unique'] for d in parallel],
+                         ['K64F[%d]' % i for i in range(6)])
+
+    def test_iter_mbeds_stops_early(self):
+        self.base.return_value = [{'mount_point': 'mount_point_%d' % i,
+                                   'target_id_usb_id': u'0240DEADBEE%d' % i,
+                                   'serial_port': 'serial_port_%d' % i}
+                                  for i in range(6)]
+        with patch("mbed_lstools.lstools_base.MbedLsToolsBase._update_device_from_fs") as _up_fs,\
+             patch("mbed_lstools.lstools_base.MbedLsToolsBase.mount_point_ready") as _mpr:
+            _mpr.return_value = True
+            mbeds = self.base.iter_mbeds()
+            first = next(mbeds)
+            mbeds.close()
+            self.assertEqual(_up_fs.call_count, 1)
+        self.assertEqual(first['mount_point'], 'mount_point_0')
+
+    def test_iter_mbeds_completion_order(self):
+        devices = [{'mount_point': 'mount_point_%d' % i,
+                    'target_id_usb_id': u'0240DEADBEE%d' % i,
+                    'serial_port': 'serial_port_%d' % i} for i in range(3)]
+
+        def _update_from_fs(device, read_details_txt):
+            # Finish in reverse order
+            time.sleep(0.05 * (3 - int(device['mount_point'][-1])))
+            device['device_type'] = 'daplink'
+
+        with patch("mbed_lstools.lstools_base.MbedLsToolsBase._update_device_from_fs") as _up_fs,\
+             patch("mbed_lstools.lstools_base.MbedLsToolsBase.mount_point_ready") as _mpr:
+            _mpr.return_value = True
+            _up_fs.side_effect = _update_from_fs
+            self.base.max_workers = 3
+            self.base.return_value = deepcopy(devices)
+            result = list(self.base.iter_mbeds(unique_names=True))
+        self.assertEqual([d['mount_point'] for d in result],
+                         ['mount_point_2', 'mount_point_1', 'mount_point_0'])
+        self.assertEqual([d['platform_name_unique'] for d in result],
+                         ['K64F[0]', 'K64F[1]', 'K64F[2]'])
+
+    def test_list_mbeds_changes(self):
+        devices = [{'mount_point': 'mount_point_%d' % i,
+                    'target_id_usb_id': u'0240DEADBEE%d' % i,
+                    'serial_port': 'serial_port_%d' % i} for i in range(3)]
+        with patch("mbed_lstools.lstools_base.MbedLsToolsBase._update_device_from_fs") as _up_fs,\
+             patch("mbed_lstools.lstools_base.MbedLsToolsBase.mount_point_ready") as _mpr:
+            _mpr.return_value = True
+            self.base.return_value = deepcopy(devices)
+            changes = self.base.list_mbeds_changes()
+            self.assertEqual(sorted(d['mount_point'] for d in changes['added']),
+                             ['mount_point_0', 'mount_point_1', 'mount_point_2'])
+            self.assertEqual(changes['removed'], [])
+            self.assertEqual(changes['changed'], [])
+            self.assertEqual(_up_fs.call_count, 3)
+
+            self.base.return_value = deepcopy(devices)
+            changes = self.base.list_mbeds_changes()
+            self.assertEqual(changes, {'added': [], 'removed': [], 'changed': []})
+            self.assertEqual(_up_fs.call_count, 3)
+
+            devices[1]['serial_port'] = 'serial_port_9'
+            self.base.return_value = deepcopy(devices[1:])
+            changes = self.base.list_mbeds_changes()
+            self.assertEqual(_up_fs.call_count, 4)
+        self.assertEqual(changes['added'], [])
+        self.assertEqual([d['mount_point'] for d in changes['removed']],
+                         ['mount_point_0'])
+        self.assertEqual(len(changes['changed']), 1)
+        self.assertEqual(changes['changed'][0]['fields'], ['serial_port'])
+        self.assertEqual(changes['changed'][0]['device']['serial_port'],
+                         'serial_port_9')
+        self.assertEqual(changes['changed'][0]['previous']['serial_port'],
+                         'serial_port_1')
+
+    def test_list_mbeds_changes_firmware_update(self):
+        device = {'mount_point': 'mount_point',
+                  'target_id_usb_id': u'0240DEADBEEF',
+                  'serial_port': 'serial_port'}
+        versions = ['0244']
+
+        def update_from_fs(device, read_details_txt):
+            device['daplink_version'] = versions[-1]
+
+        with patch("mbed_lstools.lstools_base.MbedLsToolsBase._update_device_from_fs") as _up_fs,\
+             patch("mbed_lstools.lstools_base.MbedLsToolsBase._stat") as _stat,\
+             patch("mbed_lstools.lstools_base.MbedLsToolsBase.mount_point_ready") as _mpr:
+            _mpr.return_value = True
+            _up_fs.side_effect = update_from_fs
+            _stat.return_value = (2049, 1000.0, 512)
+            self.base.return_value = [deepcopy(device)]
+            self.base.list_mbeds_changes(read_details_txt=True)
+            self.base.return_value = [deepcopy(device)]
+            self.assertEqual(self.base.list_mbeds_changes(read_details_txt=True),
+                             {'added': [], 'removed': [], 'changed': []})
+            self.assertEqual(_up_fs.call_count, 1)
+
+            # Remounted at the same paths with new firmware
+            versions.append('0250')
+            _stat.return_value = (2049, 2000.0, 512)
+            self.base.return_value = [deepcopy(device)]
+            changes = self.base.list_mbeds_changes(read_details_txt=True)
+            self.assertEqual(_up_fs.call_count, 2)
+            self.assertEqual(changes['changed'][0]['fields'], ['daplink_version'])
+
+            # Other arguments report every device again, without a diff
+            # against fields that were read differently
+            self.base.return_value = [deepcopy(device)]
+            changes = self.base.list_mbeds_changes()
+            self.assertEqual(len(changes['added']), 1)
+            self.assertEqual(changes['changed'], [])
+
+    def test_list_mbeds_cache_ttl(self):
+        base = DummyLsTools(cache_ttl=60)
+        base.return_value = [{'mount_point': 'dummy_mount_point',
+                              'target_id_usb_id': u'0240DEADBEEF',
+                              'serial_port': 'dummy_serial_port'}]
+        with patch.object(base, 'find_candidates', wraps=base.find_candidates) as _find,\
+             patch("mbed_lstools.lstools_base.MbedLsToolsBase._update_device_from_fs"),\
+             patch("mbed_lstools.lstools_base.MbedLsToolsBase.mount_point_ready") as _mpr:
+            _mpr.return_value = True
+            first = base.list_mbeds()
+            first[0]['platform_name'] = 'modified'
+            second = base.list_mbeds()
+            self.assertEqual(second[0]['platform_name'], 'K64F')
+            self.assertEqual(_find.call_count, 1)
+
+            base.list_mbeds(unique_names=True)
+            base.list_mbeds(filter_function=lambda m: True)
+            self.assertEqual(_find.call_count, 3)
+
+            base.invalidate()
+            base.list_mbeds()
+            self.assertEqual(_find.call_count, 4)
+        self.assertEqual(base.cache_stats(),
+                         {'hits': 1, 'misses': 3, 'ttl': 60, 'coalesced': 0})
+
+    def test_list_mbeds_shared_cache(self):
+        root = tempfile.mkdtemp()
+        try:
+            path = os.path.join(root, 'scans.json')
+            first = DummyLsTools(shared_cache=path)
+            second = DummyLsTools(shared_cache=path)
+            candidates = [{'mount_point': 'dummy_mount_point',
+                           'target_id_usb_id': u'0240DEADBEEF',
+                           'serial_port': 'dummy_serial_port'}]
+            with patch.object(first, 'find_candidates') as _find_first,\
+                 patch.object(second, 'find_candidates') as _find_second,\
+                 patch("mbed_lstools.lstools_base.MbedLsToolsBase._update_device_from_fs"),\
+                 patch("mbed_lstools.lstools_base.MbedLsToolsBase.mount_point_ready") as _mpr:
+                _mpr.return_value = True
+                _find_first.return_value = deepcopy(candidates)
+                _find_second.return_value = deepcopy(candidates)
+                self.assertEqual(first.list_mbeds(), second.list_mbeds())
+                self.assertEqual(_find_first.call_count, 1)
+                _find_second.assert_not_called()
+
+                second.list_mbeds(unique_names=True)
+                second.list_mbeds(filter_function=lambda m: True)
+                self.assertEqual(_find_second.call_count, 2)
+
+                first.invalidate()
+                second.list_mbeds()
+                self.assertEqual(_find_second.call_count, 3)
+        finally:
+            shutil.rmtree(root)
+
+    def test_list_mbeds_coalesced(self):
+        base = DummyLsTools()
+        entered = threading.Event()
+        release = threading.Event()
+
+        def find_candidates():
+            entered.set()
+            release.wait(10)
+            return [{'mount_point': 'dummy_mount_point',
+                     'target_id_usb_id': u'0240DEADBEEF',
+                     'serial_port': 'dummy_serial_port'}]
+
+        results = []
+        def list_mbeds():
+            results.append(base.list_mbeds())
+
+        with patch.object(base, 'find_candidates', side_effect=find_candidates) as _find,\
+             patch("mbed_lstools.lstools_base.MbedLsToolsBase._update_device_from_fs"),\
+             patch("mbed_lstools.lstools_base.MbedLsToolsBase.mount_point_ready") as _mpr:
+            _mpr.return_value = True
+            threads = [threading.Thread(target=list_mbeds) for _ in range(5)]
+            threads[0].start()
+            entered.wait(10)
+            for thread in threads[1:]:
+                thread.start()
+            while base.cache_stats()['coalesced'] < 4:
+                time.sleep(0.01)
+            release.set()
+            for thread in threads:
+                thread.join(10)
+            self.assertEqual(_find.call_count, 1)
+
+            # Calls with a filter function can't be shared
+            release.clear()
+            entered.clear()
+            thread = threading.Thread(target=list_mbeds)
+            thread.start()
+            entered.wait(10)
+            release.set()
+            base.list_mbeds(filter_function=lambda m: True)
+            thread.join(10)
+            self.assertEqual(_find.call_count, 3)
+
+        self.assertEqual(len(results), 6)
+        self.assertEqual(len(set(id(r) for r in results)), 6)
+        for result in results:
+            self.assertEqual(result[0]['platform_name'], 'K64F')
+
+    def test_list_mbeds_cache_expires(self):
+        base = DummyLsTools(cache_ttl=60)
+        with patch.object(base, 'find_candidates') as _find,\
+             patch('mbed_lstools.cache._now') as _now:
+            _find.return_value = []
+            _now.return_value = 100
+            base.list_mbeds()
+            _now.return_value = 159
+            base.list_mbeds()
+            self.assertEqual(_find.call_count, 1)
+            _now.return_value = 160
+            base.list_mbeds()
+            self.assertEqual(_find.call_count, 2)
+
 class RetargetTestCase(unittest.TestCase):
     """ Test cases that makes use of retargetting
     """
@@ -19,6 +19,7 @@ limitations under the License.
 import unittest
 import sys
 import os
+import tempfile
 from mock import patch
 from mbed_lstools.linux import MbedLsToolsLinuxGeneric
 
@@ -28,6 +29,8 @@ class LinuxPortTestCase(unittest.TestCase):
 
     def setUp(self):
         self.linux_generic = MbedLsToolsLinuxGeneric()
+        # Most of these tests exercise the 'mount' fallback
+        self.linux_generic.MOUNTINFO_FILE_NAME = '/nonexistent/mountinfo'
 
     def tearDown(self):
         pass
@@ -79,6 +82,57 @@ class LinuxPortTestCase(unittest.TestCase):
         self.assertEqual('/mnt/DAPLINK_', mount_dict['/dev/sdh'])
         self.assertEqual('/mnt/DAPLINK__', mount_dict['/dev/sdi'])
 
+    mountinfo_vfat = [
+        b'22 1 8:1 / / rw,relatime shared:1 - ext4 /dev/sda1 rw,errors=remount-ro',
+        b'23 22 0:22 / /proc rw,nosuid,nodev,noexec,relatime shared:12 - proc proc rw',
+        b'61 22 8:16 / /media/usb0 rw,nosuid,nodev,relatime shared:33 - vfat /dev/sdb rw,uid=1000,gid=1000,fmask=0022,dmask=0022',
+        b'62 22 8:32 / /media/usb1 rw,nosuid,nodev,relatime - vfat /dev/sdc rw,uid=1000,gid=1000',
+        b'63 22 8:48 / /media/user/MBED\\040DISK rw,relatime shared:35 master:2 - vfat /dev/sdd rw',
+        b'64 22 8:64 / /media/usb3 rw,relatime shared:36 - vfat /dev/disk/by-uuid/2702-1974 rw',
+    ]
+
+    def test_get_mount_point_mountinfo(self):
+        mountinfo = os.path.join(tempfile.mkdtemp(), 'mountinfo')
+        with open(mountinfo, 'wb') as f:
+            f.write(b'\n'.join(self.mountinfo_vfat))
+        self.linux_generic.MOUNTINFO_FILE_NAME = mountinfo
+        with patch('mbed_lstools.linux.MbedLsToolsLinuxGeneric._run_cli_process') as _cliproc:
+            mount_ids, mount_devnos = self.linux_generic._mount_table()
+            mount_dict = dict(self.linux_generic._fat_mounts())
+            _cliproc.assert_not_called()
+        self.assertEqual(mount_ids, mount_dict)
+        self.assertEqual('/media/usb0', mount_dict['/dev/sdb'])
+        self.assertEqual('/media/usb1', mount_dict['/dev/sdc'])
+        self.assertEqual('/media/user/MBED DISK', mount_dict['/dev/sdd'])
+        self.assertNotIn('/dev/sda1', mount_dict)
+        self.assertEqual('/media/usb0', mount_devnos['8:16'])
+        self.assertEqual('/media/usb3', mount_devnos['8:64'])
+        self.assertNotIn('8:1', mount_devnos)
+
+    def test_get_mount_point_mountinfo_undecodable(self):
+        mountinfo = os.path.join(tempfile.mkdtemp(), 'mountinfo')
+        with open(mountinfo, 'wb') as f:
+            f.write(b'\n'.join([
+                b'61 22 8:16 / /media/\xff\xfe rw,relatime - vfat /dev/sdb rw',
+                b'62 22 8:32 / /media/usb1 rw,relatime - vfat /dev/sdc rw']))
+        self.linux_generic.MOUNTINFO_FILE_NAME = mountinfo
+        mount_ids, _ = self.linux_generic._mount_table()
+        self.assertEqual('/media/usb1', mount_ids['/dev/sdc'])
+        self.assertEqual(os.fsencode(mount_ids['/dev/sdb']),
+                         b'/media/\xff\xfe')
+
+    def test_mount_point_by_devno(self):
+        mount_ids = {'/dev/disk/by-uuid/2702-1974': '/media/usb3'}
+        mount_devnos = {'8:64': '/media/usb3'}
+        with patch('mbed_lstools.linux._devno') as _devno:
+            _devno.return_value = '8:64'
+            self.assertEqual('/media/usb3', self.linux_generic._mount_point(
+                '/dev/sde', mount_ids, mount_devnos))
+            _devno.assert_called_once_with('/dev/sde')
+            _devno.return_value = '8:80'
+            self.assertEqual(None, self.linux_generic._mount_point(
+                '/dev/sdf', mount_ids, mount_devnos))
+
     def find_candidates_with_patch(self, mount_list, link_dict, listdir_dict):
         if not getattr(sys.modules['os'], 'readlink', None):
             sys.modules['os'].readlink = None
@@ -22,11 +22,13 @@ import errno
 import logging
 import tempfile
 import json
+import shutil
+import threading
 from mock import patch, MagicMock, DEFAULT
 from io import StringIO
 
 from mbed_lstools.platform_database import PlatformDatabase, DEFAULT_PLATFORM_DB,\
-    LOCAL_PLATFORM_DATABASE
+    LOCAL_PLATFORM_DATABASE, _overwrite_or_open, _record, local_platform_cache
 
 try:
     unicode
@@ -70,12 +72,12 @@ class EmptyPlatformDatabaseTests(unittest.TestCase):
     def test_broken_database(self):
         """Verify that the platform database correctly reset's its database
         """
-        with patch("mbed_lstools.platform_database.open") as _open:
-            stringio = MagicMock()
-            _open.side_effect = (IOError("Bogus"), stringio)
+        with patch("mbed_lstools.platform_database.open") as _open,\
+             patch("mbed_lstools.platform_database._replace_db") as _replace_db:
+            _open.side_effect = IOError("Bogus")
             self.pdb = PlatformDatabase([LOCAL_PLATFORM_DATABASE])
-            stringio.__enter__.return_value.write.assert_called_with(
-                unicode(json.dumps(DEFAULT_PLATFORM_DB)))
+            _replace_db.assert_called_once_with(LOCAL_PLATFORM_DATABASE,
+                                                DEFAULT_PLATFORM_DB, 1)
             self.pdb.add("1234", "MYTARGET")
             self.assertEqual(self.pdb.get("1234"), "MYTARGET")
 
@@ -92,14 +94,86 @@ class EmptyPlatformDatabaseTests(unittest.TestCase):
     def test_old_database(self):
         """Verify that the platform database correctly updates's its database
         """
-        with patch("mbed_lstools.platform_database.open") as _open,\
+        with patch("mbed_lstools.platform_database._replace_db") as _replace_db,\
              patch("mbed_lstools.platform_database.getmtime") as _getmtime:
-            stringio = MagicMock()
-            _open.return_value = stringio
-            _getmtime.side_effect = (0, 1000000)
+            _getmtime.side_effect = lambda path: (
+                0 if path == LOCAL_PLATFORM_DATABASE else 1000000)
             self.pdb = PlatformDatabase([LOCAL_PLATFORM_DATABASE])
-            stringio.__enter__.return_value.write.assert_called_with(
-                unicode(json.dumps(DEFAULT_PLATFORM_DB)))
+            _replace_db.assert_called_once_with(LOCAL_PLATFORM_DATABASE,
+                                                DEFAULT_PLATFORM_DB, 1)
+
+    def test_concurrent_first_run(self):
+        """Verify that the database is not recreated when another process
+        recreated it while this one waited for the lock
+        """
+        db_path = os.path.join(tempfile.mkdtemp(), 'platforms.json')
+
+        def other_process_writes(*args, **kwargs):
+            with open(db_path, 'wb') as db:
+                db.write(b'{"daplink": {"1234": "MYTARGET"}}')
+            return True
+
+        with patch("mbed_lstools.platform_database.LOCAL_PLATFORM_DATABASE",
+                   db_path),\
+             patch("mbed_lstools.platform_database.InterProcessLock") as _lock,\
+             patch("mbed_lstools.platform_database._replace_db") as _replace_db:
+            _lock.return_value.acquire.side_effect = other_process_writes
+            self.pdb = PlatformDatabase([db_path])
+            _replace_db.assert_not_called()
+            self.assertEqual(self.pdb.get("1234"), "MYTARGET")
+
+    def test_atomic_write(self):
+        """Verify that writes replace the file and count the generations
+        """
+        self.base_db.close()
+        self.pdb.add("1234", "MYTARGET", permanent=True)
+        self.pdb.add("1235", "MYTARGET", permanent=True)
+        with open(self.base_db_path, 'rb') as db:
+            self.assertEqual(json.loads(db.read().decode('utf-8')),
+                             {'daplink': {'1234': 'MYTARGET', '1235': 'MYTARGET'},
+                              '__meta__': {'generation': 2}})
+        self.assertEqual(sorted(os.listdir(os.path.dirname(self.base_db_path))),
+                         ['base', 'base.lock'])
+        self.pdb = PlatformDatabase([self.base_db_path])
+        self.assertEqual(set(self.pdb.all_ids()), set(['1234', '1235']))
+
+    def test_write_keeps_generation_and_mode(self):
+        """Verify that writes count on from the loaded generation and keep
+        the permissions of the file
+        """
+        self.base_db.close()
+        with open(self.base_db_path, 'wb') as db:
+            db.write(b'{"daplink": {}, "__meta__": {"generation": 7}}')
+        os.chmod(self.base_db_path, 0o640)
+        self.pdb = PlatformDatabase([self.base_db_path])
+        with patch("mbed_lstools.platform_database._read_db") as _read_db:
+            self.pdb.add("1234", "MYTARGET", permanent=True)
+            _read_db.assert_not_called()
+        with open(self.base_db_path, 'rb') as db:
+            self.assertEqual(json.loads(db.read().decode('utf-8'))['__meta__'],
+                             {'generation': 8})
+        if os.name == 'posix':
+            self.assertEqual(os.stat(self.base_db_path).st_mode & 0o777, 0o640)
+
+    def test_concurrent_writers(self):
+        """Verify that a write merges what another writer wrote since the
+        database was loaded
+        """
+        self.base_db.close()
+        with open(self.base_db_path, 'wb') as db:
+            db.write(b'{"daplink": {"0200": "KL25Z", "0240": "K64F"}}')
+        first = PlatformDatabase([self.base_db_path])
+        second = PlatformDatabase([self.base_db_path])
+        first.add("1234", "FIRST", permanent=True)
+        second.add("1235", "SECOND", permanent=True)
+        second.remove("0200", permanent=True)
+        with open(self.base_db_path, 'rb') as db:
+            written = json.loads(db.read().decode('utf-8'))
+        self.assertEqual(written['__meta__'], {'generation': 3})
+        self.assertEqual(written['daplink'], {'0240': 'K64F', '1234': 'FIRST',
+                                              '1235': 'SECOND'})
+        self.assertEqual(second.get("1234"), "FIRST")
+        self.assertEqual(second.get("0200"), None)
 
     def test_bogus_database(self):
         """Basic empty database test
@@ -149,6 +223,28 @@ class EmptyPlatformDatabaseTests(unittest.TestCase):
         self.assertEqual(self.pdb.get('1337', verbose_data=True), platform_data)
         self.assertEqual(self.pdb.get('1337'), platform_data['platform_name'])
 
+    def test_verbose_data_shared_read_only(self):
+        """Test that verbose lookups share one record that can't be changed
+        """
+        self.pdb.add('1337', {'platform_name': 'VALID'}, permanent=False)
+        self.pdb.add('1338', 'SIMPLE', permanent=False)
+        record, simple, unknown = self.pdb.get_many(['1337', '1338', 'NOTVALID'])
+        self.assertEqual(record, {'platform_name': 'VALID'})
+        self.assertEqual(simple, {'platform_name': 'SIMPLE'})
+        self.assertEqual(unknown, None)
+        self.assertIs(self.pdb.get_many(['1337'])[0], record)
+        with self.assertRaises(TypeError):
+            record['platform_name'] = 'CHANGED'
+
+        # 'get' hands out copies that may be changed
+        verbose = self.pdb.get('1337', verbose_data=True)
+        self.assertEqual(type(verbose), dict)
+        verbose['platform_name'] = 'CHANGED'
+        self.assertEqual(json.loads(json.dumps(verbose)),
+                         {'platform_name': 'CHANGED'})
+        self.assertEqual(self.pdb.get('1337'), 'VALID')
+
+
 class OverriddenPlatformDatabaseTests(unittest.TestCase):
     """ Test that for one database overriding another
     """
@@ -176,16 +272,17 @@ class OverriddenPlatformDatabaseTests(unittest.TestCase):
     def assertBaseUnchanged(self):
         """Assert that the base database has not changed
         """
-        self.base_db.seek(0)
-        self.assertEqual(self.base_db.read(),
+        with open(self.base_db_path, 'rb') as base_db:
+            content = base_db.read()
+        self.assertEqual(content,
                          json.dumps(dict([('0123', 'Base_Platform')]))
                          .encode('utf-8'))
 
     def assertOverrideUnchanged(self):
         """Assert that the override database has not changed
         """
-        self.overriding_db.seek(0)
-        self.assertEqual(self.overriding_db.read(), b'{}')
+        with open(self.overriding_db_path, 'rb') as overriding_db:
+            self.assertEqual(overriding_db.read(), b'{}')
 
     def test_basline(self):
         """Sanity check that the base database does what we expect
@@ -225,10 +322,10 @@ class OverriddenPlatformDatabaseTests(unittest.TestCase):
         self.assertIn(('0123', 'Overriding_Platform'), list(self.pdb.items()))
         self.assertEqual(set(self.pdb.all_ids()), set(['0123']))
         self.assertEqual(self.pdb.get('0123'), 'Overriding_Platform')
-        self.overriding_db.seek(0)
-        self.assertEqual(self.overriding_db.read(),
-                         json.dumps(dict([('daplink', dict([('0123', 'Overriding_Platform')]))]))
-                         .encode('utf-8'))
+        with open(self.overriding_db_path, 'rb') as overriding_db:
+            self.assertEqual(json.loads(overriding_db.read().decode('utf-8')),
+                             {'daplink': {'0123': 'Overriding_Platform'},
+                              '__meta__': {'generation': 1}})
         self.assertBaseUnchanged()
 
     def test_remove_override(self):
@@ -245,6 +342,18 @@ class OverriddenPlatformDatabaseTests(unittest.TestCase):
         self.assertOverrideUnchanged()
         self.assertBaseUnchanged()
 
+    def test_override_precedence(self):
+        """Check that lookups follow adds and removes of overriding ids
+        """
+        self.pdb.add('0123', 'Overriding_Platform')
+        self.assertEqual(self.pdb.get('0123'), 'Overriding_Platform')
+        self.assertEqual(self.pdb.get_many(['0123']),
+                         [{'platform_name': 'Overriding_Platform'}])
+        self.pdb.remove('0123')
+        self.assertEqual(self.pdb.get('0123'), 'Base_Platform')
+        self.assertEqual(self.pdb.get_many(['0123']),
+                         [{'platform_name': 'Base_Platform'}])
+
     def test_remove_from_base(self):
         """Check that removing a platform from the base database no longer allows you to query
         the original base database definition and that that the base database
@@ -264,6 +373,154 @@ class OverriddenPlatformDatabaseTests(unittest.TestCase):
         self.assertEqual(self.pdb.get('0123'), None)
         self.assertBaseUnchanged()
 
+class CachedPlatformDatabaseTests(unittest.TestCase):
+    """ Test loading the databases from a cache file
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.base_db_path = os.path.join(self.temp_dir, 'base')
+        with open(self.base_db_path, 'wb') as base_db:
+            base_db.write(b'{"0123": "Base_Platform"}')
+        self.cache_path = os.path.join(self.temp_dir, 'platforms.pickle')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def make_pdb(self):
+        return PlatformDatabase([self.base_db_path],
+                                cache_file=self.cache_path)
+
+    def test_load_from_cache(self):
+        """Check that an unchanged database is not read again
+        """
+        self.make_pdb()
+        self.assertTrue(os.path.isfile(self.cache_path))
+        with patch("mbed_lstools.platform_database._overwrite_or_open") as _o:
+            pdb = self.make_pdb()
+            _o.assert_not_called()
+        self.assertEqual(pdb.get('0123'), 'Base_Platform')
+        self.assertEqual(list(pdb.all_ids()), ['0123'])
+        pdb.add('1234', 'Another_Platform')
+        self.assertEqual(pdb.get('1234'), 'Another_Platform')
+
+    def test_changed_database(self):
+        """Check that the cache is rebuilt when a database file changes
+        """
+        self.make_pdb().add('1234', 'Another_Platform', permanent=True)
+        pdb = self.make_pdb()
+        self.assertEqual(pdb.get('1234'), 'Another_Platform')
+        with patch("mbed_lstools.platform_database._overwrite_or_open") as _o:
+            self.make_pdb()
+            _o.assert_not_called()
+
+    def test_broken_cache(self):
+        """Check that a corrupt cache file is ignored
+        """
+        with open(self.cache_path, 'wb') as cache:
+            cache.write(b'not a pickle')
+        self.assertEqual(self.make_pdb().get('0123'), 'Base_Platform')
+        self.assertEqual(self.make_pdb().get('0123'), 'Base_Platform')
+
+    def test_cache_per_database_set(self):
+        """Check that each set of databases has its own cache file
+        """
+        mock_db_path = os.path.join(self.temp_dir, 'mock')
+        self.assertEqual(local_platform_cache([self.base_db_path]),
+                         local_platform_cache([self.base_db_path]))
+        self.assertNotEqual(local_platform_cache([self.base_db_path]),
+                            local_platform_cache([mock_db_path,
+                                                  self.base_db_path]))
+
+    def test_cache_replaced(self):
+        """Check that the cache is written to a temporary file that then
+        replaces it, so readers never see a part of it
+        """
+        with open(self.cache_path, 'wb') as cache:
+            cache.write(b'not a pickle')
+        with patch("mbed_lstools.platform_database._replace",
+                   side_effect=OSError("Bogus")):
+            self.make_pdb()
+        with open(self.cache_path, 'rb') as cache:
+            self.assertEqual(cache.read(), b'not a pickle')
+        self.assertFalse([name for name in os.listdir(self.temp_dir)
+                          if name.endswith('.tmp')])
+        self.make_pdb()
+        with patch("mbed_lstools.platform_database._overwrite_or_open") as _o:
+            self.assertEqual(self.make_pdb().get('0123'), 'Base_Platform')
+            _o.assert_not_called()
+
+class ReloadedPlatformDatabaseTests(unittest.TestCase):
+    """ Test noticing changes made to the database files by other processes
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.base_db_path = os.path.join(self.temp_dir, 'base')
+        self.mock_db_path = os.path.join(self.temp_dir, 'mock')
+        for path in [self.base_db_path, self.mock_db_path]:
+            with open(path, 'wb') as db:
+                db.write(b'{"0123": "Base_Platform"}')
+        self.now = patch("mbed_lstools.platform_database._now").start()
+        self.now.return_value = 0
+        self.addCleanup(patch.stopall)
+        self.pdb = self.make_pdb()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def make_pdb(self):
+        return PlatformDatabase([self.mock_db_path, self.base_db_path],
+                                primary_database=self.mock_db_path,
+                                reload_interval=5)
+
+    def test_reload_changed_file(self):
+        """Check that a change made by another process is seen once the
+        interval has passed, and that only the changed file is read
+        """
+        self.make_pdb().add('0124', 'Other_Platform', permanent=True)
+        self.assertEqual(self.pdb.get('0124'), None)
+        self.now.return_value = 4
+        self.assertEqual(self.pdb.get('0124'), None)
+        self.now.return_value = 5
+        with patch("mbed_lstools.platform_database._overwrite_or_open",
+                   wraps=_overwrite_or_open) as _o:
+            self.assertEqual(self.pdb.get('0124'), 'Other_Platform')
+            _o.assert_called_once_with(self.mock_db_path)
+        self.assertEqual(set(self.pdb.all_ids()), set(['0123', '0124']))
+
+    def test_reload_concurrent_lookups(self):
+        """Check that a lookup made by another thread in the middle of a
+        reload sees the databases from before the reload
+        """
+        self.make_pdb().add('0124', 'Other_Platform', permanent=True)
+        self.now.return_value = 5
+        seen = []
+
+        def lookup():
+            seen.append((self.pdb.get('0123'), self.pdb.get('0124')))
+
+        def record_and_lookup(data):
+            if not seen:
+                thread = threading.Thread(target=lookup)
+                thread.start()
+                thread.join()
+            return _record(data)
+
+        with patch("mbed_lstools.platform_database._record",
+                   side_effect=record_and_lookup):
+            self.assertEqual(self.pdb.get('0124'), 'Other_Platform')
+        self.assertEqual(seen, [('Base_Platform', None)])
+
+    def test_own_write_not_reloaded(self):
+        """Check that the file written by this database is not read again
+        """
+        self.pdb.add('0124', 'Other_Platform', permanent=True)
+        self.now.return_value = 5
+        with patch("mbed_lstools.platform_database._overwrite_or_open") as _o:
+            self.assertEqual(self.pdb.get('0124'), 'Other_Platform')
+            _o.assert_not_called()
+
 class InternalLockingChecks(unittest.TestCase):
 
     def setUp(self):
@@ -304,6 +561,30 @@ class InternalLockingChecks(unittest.TestCase):
         self.base_db.seek(0)
         self.assertEqual(self.base_db.read(), b'{}')
 
+    def test_batch(self):
+        """Test that a batch of modifications is written once
+        """
+        with self.pdb.batch():
+            self.pdb.add_many([('7155', 'Junk'), ('7156', 'Junk')],
+                              permanent=True)
+            self.assertEqual(self.pdb.remove_many(['7155', '0000'],
+                                                  permanent=True),
+                             ['Junk', None])
+            self.acquire.assert_not_called()
+        self.assertEqual(self.acquire.call_count, 1)
+        self.assertEqual(self.release.call_count, 1)
+        with open(self.base_db_path, 'rb') as base_db:
+            self.assertEqual(json.loads(base_db.read().decode('utf-8')),
+                             {'daplink': {'7156': 'Junk'},
+                              '__meta__': {'generation': 1}})
+        self.assertEqual(self.pdb.get('7156'), 'Junk')
+
+    def test_batch_no_update(self):
+        """Test that a batch without permanent modifications writes nothing
+        """
+        self.pdb.add_many({'7155': 'Junk'})
+        self.acquire.assert_not_called()
+
     def test_update_ambiguous(self):
         """Test that the backing file is not updated when lock acquisition fails
         """
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+'''
+mbed SDK
+Copyright (c) 2018 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the 'License');
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an 'AS IS' BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import unittest
+import errno
+import gc
+import os
+import shutil
+import tempfile
+import time
+from mock import patch
+
+from mbed_lstools import lstools_base
+from mbed_lstools.lstools_base import MbedLsToolsBase
+from mbed_lstools.probe_helpers import ProbeHelperPool, ProbeTimeout
+
+MBED_HTM = ('<!-- mbed Microcontroller Website and Authentication Shortcut -->\n'
+            '<html><head><meta http-equiv="refresh" content="0; '
+            'url=http://mbed.org/device/?code=0240000032044e4500257009997b00386781000097969900"/>'
+            '</head></html>\n')
+
+
+class DummyLsTools(MbedLsToolsBase):
+    return_value = []
+    def find_candidates(self):
+        return self.return_value
+
+
+def make_mount(root, name, hang=False):
+    mount_point = os.path.join(root, name)
+    os.mkdir(mount_point)
+    htm = os.path.join(mount_point, 'mbed.htm')
+    if hang:
+        # Opening a FIFO with no writer blocks, like a wedged board
+        os.mkfifo(htm)
+    else:
+        with open(htm, 'w') as f:
+            f.write(MBED_HTM)
+    return mount_point
+
+
+@unittest.skipUnless(hasattr(os, 'mkfifo'), 'needs named pipes')
+class ProbeHelperPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.pool = ProbeHelperPool(size=2, timeout=0.5)
+
+    def tearDown(self):
+        self.pool.close()
+        shutil.rmtree(self.root)
+
+    def test_reads(self):
+        mount_point = make_mount(self.root, 'MBED')
+        self.assertEqual(self.pool.call('listdir', mount_point), ['mbed.htm'])
+        self.assertTrue(self.pool.call('isdir', mount_point))
+        self.assertEqual(
+            self.pool.call('readlines', os.path.join(mount_point, 'mbed.htm')),
+            MBED_HTM.splitlines(True))
+
+    def test_remote_error(self):
+        with self.assertRaises(OSError) as cm:
+            self.pool.call('readlines', os.path.join(self.root, 'missing'))
+        self.assertEqual(cm.exception.errno, errno.ENOENT)
+
+    def test_timeout_replaces_helper(self):
+        mount_point = make_mount(self.root, 'HUNG', hang=True)
+        start = time.time()
+        with self.assertRaises(ProbeTimeout) as cm:
+            self.pool.call('readlines', os.path.join(mount_point, 'mbed.htm'))
+        self.assertLess(time.time() - start, 5)
+        self.assertEqual(cm.exception.errno, errno.ETIMEDOUT)
+        self.assertTrue(cm.exception.strerror.startswith('Timed out after'))
+        self.assertEqual(cm.exception.filename,
+                         os.path.join(mount_point, 'mbed.htm'))
+        self.assertEqual(self.pool.call('listdir', mount_point), ['mbed.htm'])
+
+    def test_helpers_are_reaped(self):
+        mount_point = make_mount(self.root, 'HUNG', hang=True)
+        with patch('mbed_lstools.probe_helpers._Helper._reap',
+                   autospec=True) as _reap:
+            with self.assertRaises(ProbeTimeout):
+                self.pool.call('readlines',
+                               os.path.join(mount_point, 'mbed.htm'))
+            deadline = time.time() + 5
+            while not _reap.called and time.time() < deadline:
+                time.sleep(0.01)
+            stuck = _reap.call_args[0][0]
+        stuck._reap()
+        self.assertIsNotNone(stuck._proc.returncode)
+
+        self.pool.call('listdir', mount_point)
+        idle = list(self.pool._idle)
+        self.pool.close()
+        for helper in idle:
+            self.assertIsNotNone(helper._proc.returncode)
+
+    def test_deadline_is_shared(self):
+        mount_point = make_mount(self.root, 'MBED')
+        with self.pool.deadline():
+            time.sleep(0.6)
+            with self.assertRaises(ProbeTimeout):
+                self.pool.call('listdir', mount_point)
+
+
+@unittest.skipUnless(hasattr(os, 'mkfifo'), 'needs named pipes')
+class ProbeTimeoutListTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_hung_device_is_unmounted(self):
+        base = DummyLsTools(probe_timeout=0.5, max_workers=2,
+                            list_unmounted=True)
+        base.return_value = [
+            {'mount_point': make_mount(self.root, 'HUNG', hang=True),
+             'target_id_usb_id': u'0240000032044e4500257009997b00386781000097969901',
+             'serial_port': 'serial_port_0'},
+            {'mount_point': make_mount(self.root, 'MBED'),
+             'target_id_usb_id': u'0240000032044e4500257009997b00386781000097969900',
+             'serial_port': 'serial_port_1'}]
+        start = time.time()
+        result = base.list_mbeds()
+        self.assertLess(time.time() - start, 5)
+        base.close()
+        self.assertEqual(len(result), 2)
+        self.assertEqual(result[0]['mount_point'], None)
+        self.assertEqual(result[0]['device_type'], 'unknown')
+        self.assertEqual(result[1]['mount_point'],
+                         os.path.join(self.root, 'MBED'))
+        self.assertEqual(result[1]['platform_name'], 'K64F')
+        self.assertEqual(result[1]['target_id_mbed_htm'],
+                         u'0240000032044e4500257009997b00386781000097969900')
+
+    def test_closed_at_exit(self):
+        gc.collect()
+        before = len(lstools_base._to_close)
+        with patch('atexit.register') as _register:
+            bases = [DummyLsTools(probe_timeout=0.5) for _ in range(3)]
+            _register.assert_not_called()
+        self.assertTrue(all(base in lstools_base._to_close for base in bases))
+        with patch.object(DummyLsTools, 'close') as _close:
+            lstools_base._close_at_exit()
+            self.assertGreaterEqual(_close.call_count, 3)
+        del bases
+        gc.collect()
+        self.assertEqual(len(lstools_base._to_close), before)
+
+
+if __name__ == '__main__':
+    unittest.main()
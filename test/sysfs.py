@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+'''
+mbed SDK
+Copyright (c) 2018 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the 'License');
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an 'AS IS' BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import unittest
+import os
+import shutil
+import tempfile
+from mock import patch
+
+from mbed_lstools.linux import MbedLsToolsLinuxGeneric
+from mbed_lstools.sysfs import usb_devices, usb_ids
+
+K64F_ID = '0240000032044e4500257009997b00386781000097969900'
+NUCLEO_ID = '0672FF485649785087171742'
+
+
+def make_sysfs(root):
+    """Build a fake sysfs tree with a root hub, a DAPLink behind an external
+    hub and a disk-only ST-Link"""
+    pci = os.path.join(root, 'devices', 'pci0000:00', '0000:00:14.0')
+    tree = {
+        'usb1': {'serial': '0000:00:14.0', 'idVendor': '1d6b',
+                 'idProduct': '0002'},
+        'usb1/1-1': {'idVendor': '05e3', 'idProduct': '0610'},
+        'usb1/1-1/1-1:1.0': {},
+        'usb1/1-1/1-1.2': {'serial': K64F_ID, 'idVendor': '0d28',
+                           'idProduct': '0204'},
+        'usb1/1-1/1-1.2/1-1.2:1.0/host6/target6:0:0/6:0:0:0/block/sdb': {},
+        'usb1/1-1/1-1.2/1-1.2:1.0/host6/target6:0:0/6:0:0:0/block/sdb/sdb1': {},
+        'usb1/1-1/1-1.2/1-1.2:1.1/tty/ttyACM0': {},
+        'usb1/1-3': {'serial': NUCLEO_ID, 'idVendor': '0483',
+                     'idProduct': '374b'},
+        'usb1/1-3/1-3:1.1/host7/target7:0:0/7:0:0:0/block/sdc': {},
+    }
+    for path, attrs in tree.items():
+        path = os.path.join(pci, path)
+        os.makedirs(path)
+        for name, value in attrs.items():
+            with open(os.path.join(path, name), 'w') as f:
+                f.write(value + '\n')
+
+    devices = os.path.join(root, 'bus', 'usb', 'devices')
+    os.makedirs(devices)
+    for name, path in [('usb1', 'usb1'), ('1-1', 'usb1/1-1'),
+                       ('1-1:1.0', 'usb1/1-1/1-1:1.0'),
+                       ('1-1.2', 'usb1/1-1/1-1.2'),
+                       ('1-1.2:1.0', 'usb1/1-1/1-1.2/1-1.2:1.0'),
+                       ('1-3', 'usb1/1-3')]:
+        os.symlink(os.path.join(pci, path), os.path.join(devices, name))
+
+
+class SysfsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        make_sysfs(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_usb_devices(self):
+        devices = usb_devices(self.root)
+        self.assertEqual(devices, [{
+            'serial': K64F_ID, 'vendor_id': '0d28', 'product_id': '0204',
+            'disks': ['sdb'], 'ttys': ['ttyACM0']
+        }, {
+            'serial': NUCLEO_ID, 'vendor_id': '0483', 'product_id': '374b',
+            'disks': ['sdc'], 'ttys': []
+        }])
+
+    def test_usb_ids(self):
+        disk_ids, serial_ids = usb_ids(self.root)
+        self.assertEqual(disk_ids, {K64F_ID: '/dev/sdb', NUCLEO_ID: '/dev/sdc'})
+        self.assertEqual(serial_ids, {K64F_ID: '/dev/ttyACM0'})
+
+    def test_missing_sysfs(self):
+        self.assertEqual(usb_devices(os.path.join(self.root, 'nothing')), [])
+
+    def test_find_candidates_sysfs(self):
+        linux_generic = MbedLsToolsLinuxGeneric(sysfs_root=self.root)
+        with patch('mbed_lstools.linux.MbedLsToolsLinuxGeneric._dev_by_id') as _dev_by_id,\
+             patch('mbed_lstools.linux.MbedLsToolsLinuxGeneric._mount_table') as _mount_table:
+            _mount_table.return_value = ({'/dev/sdb': '/media/usb0'}, {})
+            candidates = linux_generic.find_candidates()
+            _dev_by_id.assert_not_called()
+        self.assertIn({
+            'mount_point': '/media/usb0',
+            'serial_port': '/dev/ttyACM0',
+            'target_id_usb_id': K64F_ID
+        }, candidates)
+        self.assertIn({
+            'mount_point': None,
+            'serial_port': None,
+            'target_id_usb_id': NUCLEO_ID
+        }, candidates)
+
+
+if __name__ == '__main__':
+    unittest.main()
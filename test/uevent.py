@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+'''
+mbed SDK
+Copyright (c) 2018 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the 'License');
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an 'AS IS' BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import unittest
+import struct
+from mock import patch, MagicMock
+
+from mbed_lstools.linux import MbedLsToolsLinuxGeneric
+from mbed_lstools.uevent import parse_uevent, RecordedUeventSource,\
+    UeventDeviceTable, RESYNC
+
+
+def udev_message(properties):
+    payload = b'\0'.join(b'%s=%s' % (k.encode(), v.encode())
+                         for k, v in properties.items()) + b'\0'
+    header = b'libudev\0' + struct.pack('!I', 0xfeedcafe) +\
+        struct.pack('=IIII', 40, 40, len(payload), 0) + b'\0' * 12
+    return header + payload
+
+
+DISK_ID = '0240000032044e4500257009997b00386781000097969900'
+DISK_LINK = '/dev/disk/by-id/usb-MBED_VFS_%s-0:0' % DISK_ID
+SERIAL_LINK = '/dev/serial/by-id/usb-ARM_DAPLink_CMSIS-DAP_%s-if01' % DISK_ID
+
+
+class ParseUeventTestCase(unittest.TestCase):
+
+    def test_kernel_message(self):
+        event = parse_uevent(b'add@/devices/usb1/1-1/block/sdb\0ACTION=add\0'
+                             b'DEVPATH=/devices/usb1/1-1/block/sdb\0'
+                             b'SUBSYSTEM=block\0DEVNAME=sdb\0')
+        self.assertEqual(event['ACTION'], 'add')
+        self.assertEqual(event['SUBSYSTEM'], 'block')
+        self.assertEqual(event['DEVNAME'], 'sdb')
+
+    def test_udev_message(self):
+        event = parse_uevent(udev_message({
+            'ACTION': 'add', 'SUBSYSTEM': 'tty', 'DEVNAME': '/dev/ttyACM0',
+            'DEVLINKS': SERIAL_LINK}))
+        self.assertEqual(event['DEVNAME'], '/dev/ttyACM0')
+        self.assertEqual(event['DEVLINKS'], SERIAL_LINK)
+
+    def test_malformed_message(self):
+        self.assertEqual(parse_uevent(b'libudev\0junk'), None)
+        self.assertEqual(parse_uevent(b'add@/devices\0SUBSYSTEM=block\0'), None)
+
+
+class UeventDeviceTableTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.linux_generic = MbedLsToolsLinuxGeneric()
+        self.source = RecordedUeventSource()
+        self.rescan = MagicMock(side_effect=lambda t: {})
+        self.table = UeventDeviceTable(self.source, self.rescan,
+                                       self.linux_generic._link_usb_id)
+
+    def test_initial_scan_once(self):
+        self.assertEqual(self.table.ids('disk'), {})
+        self.assertEqual(self.table.ids('disk'), {})
+        self.assertEqual(self.table.ids('serial'), {})
+        self.assertEqual(self.rescan.call_count, 2)
+
+    def test_add_remove(self):
+        self.table.ids('disk')
+        self.table.ids('serial')
+        self.source.push(udev_message({
+            'ACTION': 'add', 'SUBSYSTEM': 'block', 'DEVNAME': '/dev/sdb',
+            'DEVLINKS': '/dev/disk/by-path/pci-0000:00:14.0-usb-0:1:1.0 ' +
+            DISK_LINK}))
+        self.source.push({'ACTION': 'add', 'SUBSYSTEM': 'tty',
+                          'DEVNAME': 'ttyACM0', 'DEVLINKS': SERIAL_LINK})
+        self.source.push({'ACTION': 'add', 'SUBSYSTEM': 'usb',
+                          'DEVNAME': 'bus/usb/001/004'})
+        self.assertEqual(self.table.ids('disk'), {DISK_ID: '/dev/sdb'})
+        self.assertEqual(self.table.ids('serial'), {DISK_ID: '/dev/ttyACM0'})
+
+        self.source.push({'ACTION': 'remove', 'SUBSYSTEM': 'block',
+                          'DEVNAME': '/dev/sdb'})
+        self.assertEqual(self.table.ids('disk'), {})
+        self.assertEqual(self.table.ids('serial'), {DISK_ID: '/dev/ttyACM0'})
+        self.assertEqual(self.rescan.call_count, 2)
+
+    def test_kernel_event_rescans(self):
+        self.table.ids('disk')
+        self.source.push({'ACTION': 'add', 'SUBSYSTEM': 'block',
+                          'DEVNAME': 'sdb'})
+        self.rescan.side_effect = lambda t: {DISK_ID: '/dev/sdb'}
+        self.assertEqual(self.table.ids('disk'), {DISK_ID: '/dev/sdb'})
+        self.rescan.assert_called_with('disk')
+
+    def test_resync(self):
+        self.table.ids('disk')
+        self.table.ids('serial')
+        self.source.push(RESYNC)
+        self.table.ids('disk')
+        self.table.ids('serial')
+        self.assertEqual(self.rescan.call_count, 4)
+
+
+class LinuxHotplugTestCase(unittest.TestCase):
+
+    def test_find_candidates_hotplug(self):
+        source = RecordedUeventSource()
+        with patch('mbed_lstools.linux.MbedLsToolsLinuxGeneric._dev_by_id') as _dev_by_id,\
+             patch('mbed_lstools.linux.MbedLsToolsLinuxGeneric._mount_table') as _mount_table:
+            _dev_by_id.return_value = {}
+            _mount_table.return_value = ({'/dev/sdb': '/media/usb0'}, {})
+            linux_generic = MbedLsToolsLinuxGeneric(hotplug=True,
+                                                    uevent_source=source)
+            self.assertEqual(linux_generic.find_candidates(), [])
+            source.push({'ACTION': 'add', 'SUBSYSTEM': 'block',
+                         'DEVNAME': '/dev/sdb', 'DEVLINKS': DISK_LINK})
+            source.push({'ACTION': 'add', 'SUBSYSTEM': 'tty',
+                         'DEVNAME': '/dev/ttyACM0', 'DEVLINKS': SERIAL_LINK})
+            self.assertEqual(linux_generic.find_candidates(), [{
+                'mount_point': '/media/usb0',
+                'serial_port': '/dev/ttyACM0',
+                'target_id_usb_id': DISK_ID
+            }])
+            self.assertEqual(_dev_by_id.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
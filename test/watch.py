@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+'''
+mbed SDK
+Copyright (c) 2018 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the 'License');
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an 'AS IS' BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+from mock import patch
+
+from mbed_lstools.linux import MbedLsToolsLinuxGeneric
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), 'inotify is Linux only')
+class ChangeWatcherTestCase(unittest.TestCase):
+
+    def setUp(self):
+        from mbed_lstools.watch import ChangeWatcher
+        self.root = tempfile.mkdtemp()
+        self.watcher = ChangeWatcher()
+
+    def tearDown(self):
+        self.watcher.close()
+        shutil.rmtree(self.root)
+
+    def test_directory(self):
+        by_id = os.path.join(self.root, 'by-id')
+        os.mkdir(by_id)
+        self.watcher.watch_directory('disk', by_id)
+        self.assertTrue(self.watcher.changed('disk'))
+        self.assertFalse(self.watcher.changed('disk'))
+        os.symlink('../../sdb', os.path.join(by_id, 'usb-MBED_VFS_0240-0:0'))
+        self.assertTrue(self.watcher.wait(1))
+        self.assertTrue(self.watcher.changed('disk'))
+        self.assertFalse(self.watcher.changed('disk'))
+        os.remove(os.path.join(by_id, 'usb-MBED_VFS_0240-0:0'))
+        self.assertTrue(self.watcher.changed('disk'))
+
+    def test_directory_created_later(self):
+        by_id = os.path.join(self.root, 'serial', 'by-id')
+        self.watcher.watch_directory('serial', by_id)
+        self.assertTrue(self.watcher.changed('serial'))
+        self.assertFalse(self.watcher.changed('serial'))
+        os.mkdir(os.path.dirname(by_id))
+        self.assertTrue(self.watcher.changed('serial'))
+        os.mkdir(by_id)
+        self.assertTrue(self.watcher.changed('serial'))
+        os.symlink('../../ttyACM0', os.path.join(by_id, 'usb-ARM-if01'))
+        self.assertTrue(self.watcher.changed('serial'))
+        self.assertFalse(self.watcher.changed('serial'))
+
+        shutil.rmtree(by_id)
+        self.assertTrue(self.watcher.changed('serial'))
+        os.mkdir(by_id)
+        self.assertTrue(self.watcher.changed('serial'))
+
+    def test_mountinfo(self):
+        self.watcher.watch_mountinfo('mounts')
+        self.assertTrue(self.watcher.changed('mounts'))
+        self.assertFalse(self.watcher.changed('mounts'))
+        self.assertFalse(self.watcher.wait(0))
+
+    def test_unwatchable(self):
+        self.watcher.watch_mountinfo('mounts', os.path.join(self.root, 'none'))
+        self.assertTrue(self.watcher.changed('mounts'))
+        self.assertTrue(self.watcher.changed('mounts'))
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), 'inotify is Linux only')
+class LinuxWatchTestCase(unittest.TestCase):
+
+    def test_find_candidates_cached(self):
+        linux_generic = MbedLsToolsLinuxGeneric(watch=True)
+        with patch('mbed_lstools.linux.MbedLsToolsLinuxGeneric._dev_by_id') as _dev_by_id,\
+             patch('mbed_lstools.linux.MbedLsToolsLinuxGeneric._mount_table') as _mount_table:
+            _dev_by_id.return_value = {}
+            _mount_table.return_value = ({}, {})
+            linux_generic.find_candidates()
+            linux_generic.find_candidates()
+            linux_generic.find_candidates()
+            self.assertEqual(_dev_by_id.call_count, 2)
+            self.assertEqual(_mount_table.call_count, 1)
+        linux_generic._watcher.close()
+
+    def test_watch_with_sysfs(self):
+        linux_generic = MbedLsToolsLinuxGeneric(watch=True,
+                                                sysfs_root='/sys')
+        self.assertEqual(linux_generic._watcher._dirs, {})
+        with patch('mbed_lstools.sysfs.usb_ids') as usb_ids,\
+             patch('mbed_lstools.linux.MbedLsToolsLinuxGeneric._mount_table') as _mount_table:
+            usb_ids.return_value = ({}, {})
+            _mount_table.return_value = ({}, {})
+            linux_generic.find_candidates()
+            # Nothing that was watched is left unread
+            self.assertFalse(linux_generic._watcher.wait(0))
+        linux_generic._watcher.close()
+
+    def test_wait_for_change(self):
+        linux_generic = MbedLsToolsLinuxGeneric(watch=True)
+        with patch.object(linux_generic._watcher, 'wait') as wait,\
+             patch('time.sleep') as sleep:
+            linux_generic._wait_for_change(0.5)
+            wait.assert_called_once_with(0.5)
+            sleep.assert_not_called()
+        linux_generic._watcher.close()
+
+
+if __name__ == '__main__':
+    unittest.main()